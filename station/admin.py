@@ -9,6 +9,10 @@ from station.models import (
     Journey,
     Order,
     Ticket,
+    CheckIn,
+    WaitlistEntry,
+    Tariff,
+    OccupancySurcharge,
 )
 
 
@@ -29,3 +33,7 @@ admin.site.register(Station)
 admin.site.register(Route)
 admin.site.register(Journey)
 admin.site.register(Ticket)
+admin.site.register(CheckIn)
+admin.site.register(WaitlistEntry)
+admin.site.register(Tariff)
+admin.site.register(OccupancySurcharge)
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class StationConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "station"
+
+    def ready(self):
+        # Importing tickets registers its system check.
+        from station import signals, tickets  # noqa: F401
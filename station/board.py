@@ -0,0 +1,210 @@
+import threading
+import time
+from bisect import bisect_left, insort
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from station.models import Journey
+from station.seats import PREFIX as SEATS_PREFIX
+from train_station_api.events import broker
+
+KINDS = (("departures", "departure_time"), ("arrivals", "arrival_time"))
+JOURNEYS_TOPIC = "journeys"
+
+
+def board_topic(station_id):
+    return f"board:{station_id}"
+
+
+def board_journeys():
+    return Journey.objects.select_related(
+        "route__source", "route__destination", "train"
+    ).annotate(
+        tickets_available=F("train__cargo_num") * F("train__place_in_cargo")
+        - Count("tickets")
+    )
+
+
+def board_entry(journey):
+    return {
+        "id": journey.id,
+        "route": journey.route.name,
+        "train": journey.train.name,
+        "departure_time": journey.departure_time,
+        "arrival_time": journey.arrival_time,
+        "tickets_available": journey.tickets_available,
+    }
+
+
+def journey_stations(journey):
+    """Stations whose departures and arrivals show ``journey``."""
+    return journey.route.source_id, journey.route.destination_id
+
+
+def publish_journey(journey_id):
+    """Announce the board entry of ``journey_id``, or that it is gone,
+    once the current transaction commits."""
+    def publish():
+        journey = board_journeys().filter(pk=journey_id).first()
+        data = {"id": journey_id}
+        if journey is not None:
+            data.update(entry=board_entry(journey),
+                        stations=journey_stations(journey))
+        broker.publish(JOURNEYS_TOPIC, ("journey", data))
+
+    transaction.on_commit(publish)
+
+
+class Board:
+    """Upcoming departures and arrivals of one station.
+
+    Each kind keeps ``(time, journey id)`` keys in a sorted list, so
+    reading the next journeys is a bisection and a journey write is one
+    insertion or removal. Journeys beyond ``until`` are left out until the
+    board is reloaded.
+    """
+
+    def __init__(self, station_id, journeys, until):
+        self.station_id = station_id
+        self.until = until
+        self.loaded_at = time.monotonic()
+        self.keys = {kind: [] for kind, _ in KINDS}
+        self.entries = {}
+        for journey in journeys:
+            self.upsert(board_entry(journey), journey_stations(journey))
+
+    def kinds(self, entry, stations):
+        for (kind, field), station_id in zip(KINDS, stations):
+            moment = entry[field]
+            if station_id == self.station_id and moment < self.until:
+                yield kind, (moment, entry["id"])
+
+    def upsert(self, entry, stations):
+        """Add or replace the journey of ``entry`` shown at ``stations``;
+        return the kinds it changed."""
+        changed = self.remove(entry["id"])
+        for kind, key in self.kinds(entry, stations):
+            insort(self.keys[kind], key)
+            self.entries.setdefault(entry["id"], {})[kind] = (key, entry)
+            changed.add(kind)
+        return changed
+
+    def remove(self, journey_id):
+        changed = set()
+        for kind, (key, _) in self.entries.pop(journey_id, {}).items():
+            keys = self.keys[kind]
+            del keys[bisect_left(keys, key)]
+            changed.add(kind)
+        return changed
+
+    def adjust_seats(self, journey_id, delta):
+        """Apply ``delta`` to the seats left; return the entry if shown."""
+        kinds = self.entries.get(journey_id)
+        if not kinds:
+            return None
+        # Both kinds share the entry when a route loops back.
+        _, entry = next(iter(kinds.values()))
+        entry["tickets_available"] += delta
+        return entry
+
+    def snapshot(self, now, size):
+        result = {}
+        for kind, keys in self.keys.items():
+            start = bisect_left(keys, (now, 0))
+            result[kind] = [self.entries[journey_id][kind][1]
+                            for _, journey_id in keys[start:start + size]]
+        return result
+
+
+class BoardStore:
+    """Boards of the stations screens asked for in this process.
+
+    A board is loaded with one query on first use and reloaded every
+    ``BOARD_REFRESH_INTERVAL`` seconds, which moves its horizon forward.
+    In between it follows the ``journeys`` topic and the ``seats:<id>``
+    topics, so writes of every process reach it without touching the
+    database. Each process receives those events, so the changes are
+    handed to the station's ``board:<id>`` topic only within the process
+    rather than published again. Seat counts are deltas, so a board
+    loaded while an event is in flight may be off by it until reloaded.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._boards = {}
+
+    def get(self, station_id):
+        with self._lock:
+            board = self._boards.get(station_id)
+            if board is not None and (
+                    time.monotonic() - board.loaded_at
+                    < settings.BOARD_REFRESH_INTERVAL):
+                return board
+        now = timezone.now()
+        until = now + timedelta(hours=settings.BOARD_HORIZON_HOURS)
+        journeys = board_journeys().filter(
+            Q(route__source_id=station_id, departure_time__gte=now,
+              departure_time__lt=until)
+            | Q(route__destination_id=station_id, arrival_time__gte=now,
+                arrival_time__lt=until)
+        )
+        board = Board(station_id, journeys, until)
+        with self._lock:
+            self._boards[station_id] = board
+        return board
+
+    def snapshot(self, station_id):
+        board = self.get(station_id)
+        with self._lock:
+            return board.snapshot(timezone.now(), settings.BOARD_SIZE)
+
+    def apply_journey(self, topic, name, data):
+        journey_id = data["id"]
+        entry = data.get("entry")
+        if entry is not None:
+            for field in ("departure_time", "arrival_time"):
+                entry[field] = parse_datetime(entry[field])
+        with self._lock:
+            for board in self._boards.values():
+                if entry is None:
+                    changed = board.remove(journey_id)
+                else:
+                    changed = board.upsert(dict(entry), data["stations"])
+                for kind in changed:
+                    shown = board.entries.get(journey_id, {}).get(kind)
+                    if shown is None:
+                        event = ("remove", {"board": kind, "id": journey_id})
+                    else:
+                        event = ("upsert", {"board": kind,
+                                            "journey": shown[1]})
+                    broker.deliver(board_topic(board.station_id), event)
+
+    def apply_seats(self, topic, name, data):
+        journey_id = int(topic[len(SEATS_PREFIX):])
+        delta = len(data["seats"])
+        if name == "taken":
+            delta = -delta
+        elif name != "released":
+            return
+        with self._lock:
+            for board in self._boards.values():
+                entry = board.adjust_seats(journey_id, delta)
+                if entry is not None:
+                    broker.deliver(board_topic(board.station_id), (
+                        "seats", {"id": journey_id, "tickets_available":
+                                  entry["tickets_available"]}
+                    ))
+
+    def clear(self):
+        with self._lock:
+            self._boards.clear()
+
+
+boards = BoardStore()
+broker.listen(JOURNEYS_TOPIC, boards.apply_journey)
+broker.listen(SEATS_PREFIX, boards.apply_seats)
@@ -0,0 +1,122 @@
+import threading
+import time
+from bisect import bisect_right
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Value
+
+from station.models import OccupancySurcharge, Tariff
+from train_station_api.events import broker
+
+TOPIC = "fares"
+
+
+class FareTable:
+    """Tariffs and surcharges compiled into lookup tables.
+
+    Distance fares are kept as tariff starts, per-km rates and the fare
+    accumulated up to each start, so pricing a distance is a bisection;
+    surcharges are expanded to one entry per occupancy percent. Amounts
+    are integer cents and multipliers integer percents, so a price is
+    ``fare * multiplier * (100 + surcharge) / 10000`` rounded half up.
+    """
+
+    def __init__(self, tariffs, surcharges):
+        self.starts, self.rates, self.accumulated = [], [], []
+        total = 0
+        for from_km, price_per_km in tariffs:
+            if self.starts:
+                total += (from_km - self.starts[-1]) * self.rates[-1]
+            self.starts.append(from_km)
+            self.rates.append(int(price_per_km * 100))
+            self.accumulated.append(total)
+        self.surcharges = [0] * 101
+        for min_occupancy, surcharge in surcharges:
+            for occupancy in range(min_occupancy, 101):
+                self.surcharges[occupancy] = surcharge
+        self.loaded_at = time.monotonic()
+
+    def distance_fares(self, distances):
+        """Fares in cents; km before the first tariff are free."""
+        fares = []
+        for distance in distances:
+            index = bisect_right(self.starts, distance) - 1
+            fares.append(0 if index < 0 else self.accumulated[index]
+                         + (distance - self.starts[index]) * self.rates[index])
+        return fares
+
+    def prices(self, distances, multipliers, sold, capacities):
+        """Prices for parallel sequences of journey attributes.
+
+        ``multipliers`` are the train types' ``fare_multiplier`` values;
+        occupancy is ``sold / capacity``, rounded down to a percent.
+        """
+        surcharges = [
+            self.surcharges[min(100, count * 100 // capacity)]
+            if capacity > 0 else self.surcharges[100]
+            for count, capacity in zip(sold, capacities)
+        ]
+        return [
+            Decimal((fare * int(multiplier * 100) * (100 + surcharge)
+                     + 5000) // 10000).scaleb(-2)
+            for fare, multiplier, surcharge in zip(
+                self.distance_fares(distances), multipliers, surcharges
+            )
+        ]
+
+    def price_journeys(self, journeys, sold):
+        """Prices of journeys loaded with their route and train type."""
+        return self.prices(
+            [journey.route.distance for journey in journeys],
+            [journey.train.train_type.fare_multiplier for journey in journeys],
+            sold,
+            [journey.train.capacity for journey in journeys],
+        )
+
+
+class FareTables:
+    """The current fare table of this process.
+
+    It is compiled with one query on first use, and again after a tariff
+    or surcharge changes anywhere (announced on the ``fares`` topic) or
+    ``FARE_TABLE_TTL`` seconds have passed. Query budgets of the views
+    that price journeys include that query.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._table = None
+
+    def get(self):
+        table = self._table
+        if (table is not None
+                and time.monotonic() - table.loaded_at
+                < settings.FARE_TABLE_TTL):
+            return table
+        rows = sorted(Tariff.objects.order_by().values_list(
+            Value(0), "from_km", "price_per_km"
+        ).union(OccupancySurcharge.objects.order_by().values_list(
+            Value(1), "min_occupancy", "surcharge"
+        ), all=True))
+        table = FareTable(
+            [(start, rate) for kind, start, rate in rows if kind == 0],
+            [(start, int(surcharge)) for kind, start, surcharge in rows
+             if kind == 1],
+        )
+        with self._lock:
+            self._table = table
+        return table
+
+    def invalidate(self, *args):
+        with self._lock:
+            self._table = None
+
+
+fare_tables = FareTables()
+broker.listen(TOPIC, fare_tables.invalidate)
+
+
+def announce_fare_change():
+    fare_tables.invalidate()
+    broker.publish(TOPIC, ("changed", {}))
@@ -0,0 +1,95 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from io import BytesIO
+
+from PIL import Image, ImageOps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_VARIANT_WORKERS,
+            thread_name_prefix="image-variants",
+        )
+    return _executor
+
+
+def variant_name(name, variant, image_format):
+    directory, filename = os.path.split(name)
+    base, _ = os.path.splitext(filename)
+    extension = ".webp" if image_format == "WEBP" else ".jpg"
+    return os.path.join(directory, "variants", f"{base}-{variant}{extension}")
+
+
+def render_variant(original, size, image_format):
+    image = original.copy()
+    image.thumbnail(size, Image.Resampling.LANCZOS)
+    buffer = BytesIO()
+    if image_format == "WEBP":
+        image.save(buffer, format="WEBP", quality=80, method=4)
+    else:
+        image.convert("RGB").save(
+            buffer, format="JPEG", quality=80, optimize=True, progressive=True
+        )
+    return ContentFile(buffer.getvalue())
+
+
+def generate_image_variants(model, pk, name):
+    """Render every configured variant of the stored image ``name``."""
+    storage = model._meta.get_field("image").storage
+    with storage.open(name, "rb") as source:
+        original = ImageOps.exif_transpose(Image.open(source))
+        original.load()
+    if original.mode not in ("RGB", "RGBA"):
+        original = original.convert("RGBA" if "A" in original.mode else "RGB")
+
+    variants = {}
+    for variant, options in settings.IMAGE_VARIANTS.items():
+        content = render_variant(original, options["size"], options["format"])
+        path = variant_name(name, variant, options["format"])
+        variants[variant] = storage.save(path, content)
+
+    # The image may have been replaced while we were rendering.
+    model.objects.filter(pk=pk, image=name).update(image_variants=variants)
+    return variants
+
+
+def _run_in_worker(model, pk, name):
+    close_old_connections()
+    try:
+        return generate_image_variants(model, pk, name)
+    finally:
+        close_old_connections()
+
+
+def log_failure(name, future):
+    error = future.exception()
+    if error is not None:
+        logger.error("Could not generate the variants of %s.", name,
+                     exc_info=error)
+
+
+def schedule_image_variants(instance):
+    """Queue variant generation once the upload transaction commits."""
+    if not instance.image:
+        return
+    model, pk, name = type(instance), instance.pk, instance.image.name
+
+    def submit():
+        if settings.IMAGE_VARIANT_WORKERS:
+            future = get_executor().submit(_run_in_worker, model, pk, name)
+            future.add_done_callback(partial(log_failure, name))
+        else:
+            generate_image_variants(model, pk, name)
+
+    transaction.on_commit(submit)
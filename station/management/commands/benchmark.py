@@ -0,0 +1,221 @@
+import json
+import statistics
+import time
+import tracemalloc
+from datetime import datetime, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from station.models import Journey, Order, Route
+from user.revocation import denylist
+from user.serializers import UserTokenObtainPairSerializer
+from user.throttling import UserBucketThrottle, get_store
+
+# Metrics where a higher value is a regression; throughput is the inverse.
+HIGHER_IS_WORSE = ("p50_ms", "p95_ms", "p99_ms", "peak_memory_kb")
+STRICT = ("queries",)
+LOWER_IS_WORSE = ("throughput_rps",)
+
+
+def percentile(values, share):
+    ordered = sorted(values)
+    index = min(int(round(share * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def find_free_seat(journeys):
+    for journey in journeys:
+        train = journey.train
+        taken = set(journey.tickets.values_list("cargo", "seat"))
+        # Ticket.validate_ticket bounds seats by cargo_num as well.
+        for cargo in range(1, train.cargo_num + 1):
+            for seat in range(1, min(train.place_in_cargo,
+                                     train.cargo_num) + 1):
+                if (cargo, seat) not in taken:
+                    return journey, cargo, seat
+    raise CommandError("No journey with a free seat to benchmark booking.")
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, metrics in results.items():
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        for metric in HIGHER_IS_WORSE:
+            if metrics[metric] > expected[metric] * (1 + tolerance):
+                regressions.append((name, metric, expected[metric],
+                                    metrics[metric]))
+        for metric in STRICT:
+            if metrics[metric] > expected[metric]:
+                regressions.append((name, metric, expected[metric],
+                                    metrics[metric]))
+        for metric in LOWER_IS_WORSE:
+            if metrics[metric] < expected[metric] * (1 - tolerance):
+                regressions.append((name, metric, expected[metric],
+                                    metrics[metric]))
+    return regressions
+
+
+class Command(BaseCommand):
+    help = ("Benchmark the main API flows against the current database "
+            "and compare the results with a saved baseline.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=50)
+        parser.add_argument("--warmup", type=int, default=5)
+        parser.add_argument("--scenario", action="append",
+                            help="Run only this scenario (repeatable).")
+        parser.add_argument("--output",
+                            help="Write the results as JSON to this path.")
+        parser.add_argument("--baseline",
+                            help="Compare against a previously saved JSON.")
+        parser.add_argument("--tolerance", type=float, default=0.25,
+                            help="Allowed relative regression (default "
+                                 "0.25). Query counts may never increase.")
+
+    def handle(self, *args, **options):
+        order = Order.objects.select_related("user").first()
+        journey = Journey.objects.order_by("id").first()
+        route = Route.objects.select_related("source").order_by("id").first()
+        if order is None or journey is None or route is None:
+            raise CommandError(
+                "The database has no orders; run generate_dataset first."
+            )
+        self.user = order.user
+        # An address outside INTERNAL_IPS keeps debug_toolbar out of the
+        # measurements.
+        self.client = APIClient(REMOTE_ADDR="192.0.2.1")
+        token = UserTokenObtainPairSerializer.get_token(self.user)
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {token.access_token}"
+        )
+        booking_journey, cargo, seat = find_free_seat(
+            Journey.objects.select_related("train").order_by("id")[:50]
+        )
+
+        crew_id = journey.crew.values_list("id", flat=True).first()
+        journeys_url = reverse("station:journey-list")
+        scenarios = {
+            "journey-list": lambda: self.client.get(journeys_url),
+            "journey-list-filtered": lambda: self.client.get(
+                journeys_url,
+                {"route": journey.route_id,
+                 "departure_time": f"{journey.departure_time.date()}",
+                 "train": journey.train_id},
+            ),
+            "journey-detail": lambda: self.client.get(
+                reverse("station:journey-detail", args=[journey.id])
+            ),
+            "order-create": lambda: self.client.post(
+                reverse("station:order-list"),
+                {"tickets": [{"journey": booking_journey.id,
+                              "cargo": cargo, "seat": seat}]},
+                format="json",
+            ),
+            "order-list": lambda: self.client.get(
+                reverse("station:order-list")
+            ),
+            "crew-roster": lambda: self.client.get(
+                reverse("station:crew-roster", args=[crew_id]),
+                {"from": f"{journey.departure_time.date()}"},
+            ),
+            "route-filter": lambda: self.client.get(
+                reverse("station:route-list"),
+                {"source": route.source.name[:3]},
+            ),
+        }
+        selected = options["scenario"] or list(scenarios)
+        unknown = set(selected) - set(scenarios)
+        if unknown:
+            raise CommandError(f"Unknown scenario(s): {', '.join(unknown)}")
+
+        results = {}
+        for name in selected:
+            with override_settings(ALLOWED_HOSTS=["testserver"]):
+                results[name] = self.run_scenario(
+                    scenarios[name], options["iterations"], options["warmup"]
+                )
+            self.stdout.write(
+                f"{name:<24} p50 {results[name]['p50_ms']:8.2f} ms  "
+                f"p95 {results[name]['p95_ms']:8.2f} ms  "
+                f"{results[name]['throughput_rps']:8.1f} req/s  "
+                f"{results[name]['queries']:3d} queries  "
+                f"{results[name]['peak_memory_kb']:8.1f} KiB"
+            )
+
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump({
+                    "created_at": datetime.now(dt_timezone.utc).isoformat(),
+                    "iterations": options["iterations"],
+                    "scenarios": results,
+                }, output, indent=2)
+
+        if options["baseline"]:
+            with open(options["baseline"]) as baseline_file:
+                baseline = json.load(baseline_file)["scenarios"]
+            regressions = compare(results, baseline, options["tolerance"])
+            if regressions:
+                for name, metric, expected, actual in regressions:
+                    self.stderr.write(
+                        f"{name}: {metric} regressed from {expected} "
+                        f"to {actual}"
+                    )
+                raise CommandError(
+                    f"{len(regressions)} metric(s) regressed beyond the "
+                    "tolerance."
+                )
+            self.stdout.write(self.style.SUCCESS("No regressions."))
+
+    def request(self, make_request):
+        # Keep the benchmark user under the throttle limit and leave the
+        # database unchanged by write scenarios.
+        for scope in ("user", "booking"):
+            get_store().reset(UserBucketThrottle.cache_format
+                              % {"scope": scope, "ident": self.user.pk})
+        with transaction.atomic():
+            started = time.perf_counter()
+            response = make_request()
+            elapsed = time.perf_counter() - started
+            transaction.set_rollback(True)
+        if response.status_code >= 400:
+            raise CommandError(
+                f"Benchmark request failed with {response.status_code}: "
+                f"{getattr(response, 'data', response.content)}"
+            )
+        return response, elapsed
+
+    def run_scenario(self, make_request, iterations, warmup):
+        for _ in range(warmup):
+            self.request(make_request)
+
+        # Keep the periodic denylist refresh out of the query count.
+        denylist.refresh(force=True)
+        with CaptureQueriesContext(connection) as captured:
+            self.request(make_request)
+        # Savepoint statements come from the benchmark itself.
+        queries = sum(
+            1 for query in captured.captured_queries
+            if "SAVEPOINT" not in query["sql"]
+        )
+        tracemalloc.start()
+        try:
+            self.request(make_request)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        timings = [self.request(make_request)[1] for _ in range(iterations)]
+        return {
+            "p50_ms": round(statistics.median(timings) * 1000, 3),
+            "p95_ms": round(percentile(timings, 0.95) * 1000, 3),
+            "p99_ms": round(percentile(timings, 0.99) * 1000, 3),
+            "throughput_rps": round(len(timings) / sum(timings), 1),
+            "queries": queries,
+            "peak_memory_kb": round(peak / 1024, 1),
+        }
@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from train_station_api.schema import build_schema, code_version
+
+
+class Command(BaseCommand):
+    help = ("Generate the OpenAPI schema served at /api/doc/ for the "
+            "current code version, e.g. at build or startup.")
+
+    def handle(self, *args, **options):
+        version = code_version()
+        build_schema(version)
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote the schema of version {version} to "
+            f"{settings.SCHEMA_DIR}."
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from station.sync import compact_changes
+
+
+class Command(BaseCommand):
+    help = ("Drop logged sync changes superseded by a later change of the "
+            "same row.")
+
+    def handle(self, *args, **options):
+        count = compact_changes()
+        self.stdout.write(self.style.SUCCESS(
+            f"Dropped {count} superseded sync changes."
+        ))
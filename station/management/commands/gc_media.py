@@ -0,0 +1,71 @@
+import os
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from station.signals import IMAGE_MODELS, is_blob_referenced
+
+IMAGE_ROOT = "uploads/images"
+
+
+def walk_storage(storage, directory):
+    directories, files = storage.listdir(directory)
+    for name in files:
+        yield os.path.join(directory, name).replace("\\", "/")
+    for name in directories:
+        yield from walk_storage(storage, os.path.join(directory, name))
+
+
+def referenced_names():
+    names = set()
+    for model in IMAGE_MODELS:
+        rows = model.objects.exclude(image="").exclude(image__isnull=True)
+        for image, variants in rows.values_list(
+                "image", "image_variants").iterator():
+            names.add(image)
+            names.update((variants or {}).values())
+    return names
+
+
+class Command(BaseCommand):
+    help = "Delete uploaded image blobs no longer referenced by any row."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--grace-minutes",
+            type=int,
+            default=60,
+            help="Keep unreferenced files younger than this (default 60).",
+        )
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        storage = default_storage
+        if not storage.exists(IMAGE_ROOT):
+            return
+        cutoff = timezone.now() - timedelta(minutes=options["grace_minutes"])
+        referenced = referenced_names()
+
+        removed = 0
+        for name in walk_storage(storage, IMAGE_ROOT):
+            # An upload may have reused the blob since the scan began, so
+            # look again before deciding; reuse also refreshes its time.
+            if name in referenced or is_blob_referenced(name):
+                continue
+            try:
+                if storage.get_modified_time(name) > cutoff:
+                    continue
+            except FileNotFoundError:
+                # An upload in flight renamed or removed it.
+                continue
+            removed += 1
+            if options["dry_run"]:
+                self.stdout.write(f"Would delete {name}")
+            else:
+                storage.delete(name)
+
+        verb = "Found" if options["dry_run"] else "Deleted"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {removed} orphaned file(s)."))
@@ -0,0 +1,408 @@
+import heapq
+import math
+import random
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.utils import timezone
+
+from station.fares import announce_fare_change, fare_tables
+from station.models import (TrainType,
+                            Train,
+                            Crew,
+                            Station,
+                            Route,
+                            Journey,
+                            Order,
+                            Ticket,
+                            Tariff,
+                            OccupancySurcharge)
+from station.sync import record_changes
+
+USER_DOMAIN = "dataset.example"
+
+# name: (speed km/h, cargo range, places per cargo range)
+TRAIN_TYPES = {
+    "Regional": (80, (4, 6), (60, 80)),
+    "InterCity": (120, (8, 12), (50, 60)),
+    "High-speed": (220, (6, 10), (60, 70)),
+    "Night": (90, (10, 14), (30, 36)),
+}
+
+SYLLABLES = ("ka", "ly", "mir", "ko", "vo", "ro", "dan", "sla", "ne", "pol",
+             "zhy", "tor", "bu", "chi", "hra", "lin", "os", "tav", "ve", "yar")
+
+FARE_MULTIPLIERS = {"Regional": Decimal("1.00"),
+                    "InterCity": Decimal("1.30"),
+                    "High-speed": Decimal("1.80"),
+                    "Night": Decimal("1.20")}
+
+# Used when the database has no fares yet: (from km, price per km) and
+# (min occupancy %, surcharge %).
+TARIFFS = ((0, "0.60"), (200, "0.45"), (600, "0.30"))
+SURCHARGES = ((70, 10), (90, 25))
+
+# Group sizes of an order and their weights.
+ORDER_SIZES = (1, 2, 3, 4, 5)
+ORDER_SIZE_WEIGHTS = (50, 25, 12, 8, 5)
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2)
+         * math.sin((lon2 - lon1) / 2) ** 2)
+    return 6371 * 2 * math.asin(math.sqrt(a))
+
+
+def insert_rows(model, fields, rows):
+    """Insert raw rows, using COPY on PostgreSQL with psycopg 3.
+
+    Unlike bulk_create this keeps explicit ``auto_now_add`` values and
+    does not build model instances.
+    """
+    if not rows:
+        return
+    model_fields = [model._meta.get_field(name) for name in fields]
+    columns = ", ".join(
+        connection.ops.quote_name(field.column) for field in model_fields
+    )
+    table = connection.ops.quote_name(model._meta.db_table)
+    with connection.cursor() as cursor:
+        raw_cursor = cursor.cursor
+        if connection.vendor == "postgresql" and hasattr(raw_cursor, "copy"):
+            sql = f"COPY {table} ({columns}) FROM STDIN"
+            with raw_cursor.copy(sql) as copy:
+                for row in rows:
+                    copy.write_row(row)
+            return
+        converters = [
+            (lambda value, field=field:
+             field.get_db_prep_value(value, connection))
+            if field.get_internal_type() == "DateTimeField" else None
+            for field in model_fields
+        ]
+        placeholders = ", ".join(["%s"] * len(fields))
+        cursor.executemany(
+            f"INSERT INTO {table} ({columns}) VALUES ({placeholders})",
+            [
+                [convert(value) if convert else value
+                 for convert, value in zip(converters, row)]
+                for row in rows
+            ],
+        )
+
+
+class Command(BaseCommand):
+    help = ("Fill an empty database with a deterministic synthetic "
+            "network of stations, routes, journeys, orders and tickets.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--stations", type=int, default=2000)
+        parser.add_argument("--neighbours", type=int, default=3,
+                            help="Routes from each station to its nearest "
+                                 "stations (default 3).")
+        parser.add_argument("--express-routes", type=int, default=200)
+        parser.add_argument("--trains", type=int, default=300)
+        parser.add_argument("--users", type=int, default=20000)
+        parser.add_argument("--days", type=int, default=365)
+        parser.add_argument("--journeys-per-day", type=int, default=100)
+        parser.add_argument("--start-date", default="2026-01-01",
+                            help="First day of the timetable (YYYY-MM-DD).")
+        parser.add_argument("--occupancy", type=float, default=0.6,
+                            help="Mean share of seats sold (default 0.6).")
+        parser.add_argument("--batch-size", type=int, default=50000)
+
+    def handle(self, *args, **options):
+        if not 0 < options["occupancy"] < 1:
+            raise CommandError("--occupancy must be between 0 and 1.")
+        if Station.objects.exists():
+            raise CommandError(
+                "Database already contains stations; "
+                "generate_dataset must run against an empty database."
+            )
+        self.rng = random.Random(options["seed"])
+        self.options = options
+        start = timezone.make_aware(
+            datetime.strptime(options["start_date"], "%Y-%m-%d")
+        )
+
+        with transaction.atomic():
+            stations = self.create_stations()
+            routes = self.create_routes(stations)
+            trains, teams = self.create_trains_and_crews()
+            users = self.create_users()
+            journeys = self.create_journeys(start, routes, trains, teams)
+            for model, rows in ((Station, stations), (Train, trains),
+                                (Route, routes), (Journey, journeys)):
+                record_changes(model, [row.pk for row in rows])
+            self.create_fares()
+        self.create_orders(journeys, users)
+        self.reset_sequences()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {len(stations)} stations, {len(routes)} routes, "
+            f"{len(journeys)} journeys, {self.order_count} orders and "
+            f"{self.ticket_count} tickets."
+        ))
+
+    def log(self, message):
+        self.stdout.write(message)
+
+    def create_stations(self):
+        used = set()
+        stations = []
+        for index in range(self.options["stations"]):
+            name = "".join(
+                self.rng.choice(SYLLABLES)
+                for _ in range(self.rng.randint(2, 4))
+            ).capitalize()
+            if name in used:
+                name = f"{name} {index}"
+            used.add(name)
+            stations.append(Station(
+                name=name,
+                latitude=round(self.rng.uniform(44.5, 52.0), 5),
+                longitude=round(self.rng.uniform(22.5, 40.0), 5),
+            ))
+        stations = Station.objects.bulk_create(
+            stations, batch_size=self.options["batch_size"]
+        )
+        self.log(f"Created {len(stations)} stations")
+        return stations
+
+    def create_routes(self, stations):
+        # Link every station to its nearest neighbours (searching a
+        # longitude-sorted window) plus a few long-distance express links.
+        pairs = {}
+        by_longitude = sorted(stations, key=lambda s: s.longitude)
+        window = max(self.options["neighbours"] * 10, 30)
+        for position, station in enumerate(by_longitude):
+            candidates = by_longitude[max(position - window, 0):
+                                      position + window + 1]
+            nearest = sorted(
+                (haversine(station.latitude, station.longitude,
+                           other.latitude, other.longitude), other.id)
+                for other in candidates if other.id != station.id
+            )[:self.options["neighbours"]]
+            for distance, other_id in nearest:
+                pairs[(station.id, other_id)] = distance
+                pairs[(other_id, station.id)] = distance
+        for _ in range(self.options["express_routes"]):
+            source, destination = self.rng.sample(stations, 2)
+            distance = haversine(source.latitude, source.longitude,
+                                 destination.latitude, destination.longitude)
+            pairs[(source.id, destination.id)] = distance
+            pairs[(destination.id, source.id)] = distance
+
+        routes = Route.objects.bulk_create(
+            [
+                Route(source_id=source_id,
+                      destination_id=destination_id,
+                      distance=max(int(distance * 1.2), 1))
+                for (source_id, destination_id), distance
+                in sorted(pairs.items())
+            ],
+            batch_size=self.options["batch_size"],
+        )
+        self.log(f"Created {len(routes)} routes")
+        return routes
+
+    def create_trains_and_crews(self):
+        train_types = TrainType.objects.bulk_create(
+            [TrainType(name=name, fare_multiplier=FARE_MULTIPLIERS[name])
+             for name in TRAIN_TYPES]
+        )
+        trains = []
+        for index in range(self.options["trains"]):
+            train_type = self.rng.choice(train_types)
+            _, cargo_range, place_range = TRAIN_TYPES[train_type.name]
+            trains.append(Train(
+                name=f"{train_type.name[0]}{index + 1:05d}",
+                cargo_num=self.rng.randint(*cargo_range),
+                place_in_cargo=self.rng.randint(*place_range),
+                train_type=train_type,
+            ))
+        trains = Train.objects.bulk_create(trains)
+        for train in trains:
+            train.speed = TRAIN_TYPES[train.train_type.name][0]
+
+        # Every train gets its own crew team, so no crew member is ever
+        # scheduled on two journeys at once.
+        crews = []
+        team_sizes = []
+        for _ in trains:
+            team_sizes.append(self.rng.randint(2, 4))
+            for _ in range(team_sizes[-1]):
+                crews.append(Crew(
+                    first_name=self.rng.choice(SYLLABLES).capitalize()
+                    + self.rng.choice(SYLLABLES),
+                    last_name=self.rng.choice(SYLLABLES).capitalize()
+                    + self.rng.choice(SYLLABLES) + "enko",
+                ))
+        crews = Crew.objects.bulk_create(crews)
+        teams, position = [], 0
+        for size in team_sizes:
+            teams.append([crew.id for crew in crews[position:position + size]])
+            position += size
+        self.log(f"Created {len(trains)} trains and {len(crews)} crew members")
+        return trains, teams
+
+    def create_users(self):
+        user_model = get_user_model()
+        password = make_password("password")
+        user_model.objects.bulk_create(
+            [
+                user_model(email=f"passenger{index}@{USER_DOMAIN}",
+                           password=password)
+                for index in range(self.options["users"])
+            ],
+            batch_size=self.options["batch_size"],
+            ignore_conflicts=True,
+        )
+        users = list(
+            user_model.objects.filter(email__endswith=f"@{USER_DOMAIN}")
+            .order_by("id").values_list("id", flat=True)
+        )
+        self.log(f"Created {len(users)} users")
+        return users
+
+    def create_journeys(self, start, routes, trains, teams):
+        # Route popularity follows a long-tailed distribution.
+        weights = [self.rng.paretovariate(1.5) for _ in routes]
+        available = [(start, index) for index in range(len(trains))]
+        heapq.heapify(available)
+
+        journeys = []
+        for day in range(self.options["days"]):
+            day_start = start + timedelta(days=day)
+            departures = sorted(
+                day_start + timedelta(minutes=self.rng.randint(5 * 60,
+                                                               23 * 60))
+                for _ in range(self.options["journeys_per_day"])
+            )
+            chosen = self.rng.choices(range(len(routes)), weights=weights,
+                                      k=len(departures))
+            for departure, route_index in zip(departures, chosen):
+                available_at, train_index = heapq.heappop(available)
+                train = trains[train_index]
+                route = routes[route_index]
+                departure = max(departure, available_at)
+                arrival = departure + timedelta(
+                    minutes=math.ceil(route.distance / train.speed * 60) + 5
+                )
+                turnaround = timedelta(minutes=self.rng.randint(30, 120))
+                heapq.heappush(available, (arrival + turnaround, train_index))
+                journey = Journey(route=route, train=train,
+                                  departure_time=departure,
+                                  arrival_time=arrival)
+                journey.popularity = weights[route_index]
+                journeys.append(journey)
+
+        journeys = Journey.objects.bulk_create(
+            journeys, batch_size=self.options["batch_size"]
+        )
+        team_by_train = {
+            train.id: team for train, team in zip(trains, teams)
+        }
+        Journey.crew.through.objects.bulk_create(
+            [
+                Journey.crew.through(journey_id=journey.id, crew_id=crew_id)
+                for journey in journeys
+                for crew_id in team_by_train[journey.train_id]
+            ],
+            batch_size=self.options["batch_size"],
+        )
+        self.log(f"Created {len(journeys)} journeys")
+        return journeys
+
+    def create_fares(self):
+        if Tariff.objects.exists() or OccupancySurcharge.objects.exists():
+            return
+        Tariff.objects.bulk_create(
+            [Tariff(from_km=from_km, price_per_km=price_per_km)
+             for from_km, price_per_km in TARIFFS]
+        )
+        OccupancySurcharge.objects.bulk_create(
+            [OccupancySurcharge(min_occupancy=min_occupancy,
+                                surcharge=surcharge)
+             for min_occupancy, surcharge in SURCHARGES]
+        )
+        transaction.on_commit(announce_fare_change)
+        self.log(f"Created {len(TARIFFS)} tariffs and "
+                 f"{len(SURCHARGES)} occupancy surcharges")
+
+    def occupancy(self, journey):
+        share = self.rng.betavariate(4, 4 / self.options["occupancy"] - 4)
+        share *= min(0.6 + journey.popularity / 5, 1.4)
+        local_time = timezone.localtime(journey.departure_time)
+        if local_time.hour in (7, 8, 17, 18, 19):
+            share *= 1.2
+        if local_time.weekday() in (4, 6):
+            share *= 1.15
+        return min(share, 1.0)
+
+    def create_orders(self, journeys, users):
+        self.order_count = self.ticket_count = 0
+        fare_table = fare_tables.get()
+        next_order_id = (Order.objects.order_by("-id")
+                         .values_list("id", flat=True).first() or 0) + 1
+        orders, tickets = [], []
+        for journey in journeys:
+            train = journey.train
+            capacity = train.capacity
+            sold = sorted(self.rng.sample(
+                range(capacity), int(capacity * self.occupancy(journey))
+            ))
+            # Each seat is priced at the occupancy before it was sold.
+            prices = fare_table.prices(
+                [journey.route.distance] * len(sold),
+                [train.train_type.fare_multiplier] * len(sold),
+                range(len(sold)),
+                [capacity] * len(sold),
+            )
+            position = 0
+            while position < len(sold):
+                size = self.rng.choices(ORDER_SIZES, ORDER_SIZE_WEIGHTS)[0]
+                created_at = journey.departure_time - timedelta(
+                    minutes=int(self.rng.expovariate(1 / (14 * 24 * 60)))
+                )
+                orders.append((next_order_id, created_at,
+                               self.rng.choice(users)))
+                for seat_index, price in zip(sold[position:position + size],
+                                             prices[position:position + size]):
+                    tickets.append((
+                        seat_index // train.place_in_cargo + 1,
+                        seat_index % train.place_in_cargo + 1,
+                        journey.id,
+                        next_order_id,
+                        price,
+                    ))
+                position += size
+                next_order_id += 1
+            if len(tickets) >= self.options["batch_size"]:
+                self.flush_orders(orders, tickets)
+                orders, tickets = [], []
+        self.flush_orders(orders, tickets)
+
+    def flush_orders(self, orders, tickets):
+        with transaction.atomic():
+            insert_rows(Order, ("id", "created_at", "user"), orders)
+            insert_rows(Ticket, ("cargo", "seat", "journey", "order", "price"),
+                        tickets)
+        self.order_count += len(orders)
+        self.ticket_count += len(tickets)
+        self.log(f"Inserted {self.order_count} orders, "
+                 f"{self.ticket_count} tickets")
+
+    def reset_sequences(self):
+        statements = connection.ops.sequence_reset_sql(no_style(), [Order])
+        with connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
@@ -0,0 +1,76 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+
+from station.models import Journey
+from station.scheduling import find_conflicts
+from station.sync import record_changes
+
+FIELDS = ("route", "train", "departure_time", "arrival_time")
+
+
+def parse_journey(index, row):
+    missing = [field for field in FIELDS if field not in row]
+    if missing:
+        raise CommandError(f"Journey {index}: missing {', '.join(missing)}.")
+    departure = parse_datetime(row["departure_time"])
+    arrival = parse_datetime(row["arrival_time"])
+    if departure is None or arrival is None:
+        raise CommandError(f"Journey {index}: times must be ISO 8601.")
+    if departure >= arrival:
+        raise CommandError(
+            f"Journey {index}: departure must be earlier than arrival."
+        )
+    return Journey(route_id=row["route"], train_id=row["train"],
+                   departure_time=departure, arrival_time=arrival)
+
+
+class Command(BaseCommand):
+    help = ("Import journeys from a JSON list of objects with route, train, "
+            "departure_time, arrival_time and crew ids, refusing the whole "
+            "file if any train or crew member would be double-booked.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--dry-run", action="store_true",
+                            help="Only check for conflicts.")
+
+    def handle(self, *args, **options):
+        with open(options["path"]) as source:
+            rows = json.load(source)
+        journeys = [parse_journey(index, row)
+                    for index, row in enumerate(rows)]
+        crew = [list(row.get("crew", [])) for row in rows]
+
+        # Candidates use negative keys so they never clash with stored ids.
+        conflicts = find_conflicts({
+            -1 - index: (journey.train_id, crew[index],
+                         journey.departure_time, journey.arrival_time)
+            for index, journey in enumerate(journeys)
+        })
+        if conflicts:
+            for kind, resource_id, key, other in conflicts:
+                other = (f"imported journey {-1 - other}" if other < 0
+                         else f"journey {other}")
+                self.stderr.write(
+                    f"Imported journey {-1 - key}: {kind} {resource_id} "
+                    f"overlaps {other}."
+                )
+            raise CommandError(f"{len(conflicts)} scheduling conflict(s).")
+        if options["dry_run"]:
+            self.stdout.write(f"{len(journeys)} journeys, no conflicts.")
+            return
+
+        with transaction.atomic():
+            Journey.objects.bulk_create(journeys)
+            Journey.crew.through.objects.bulk_create([
+                Journey.crew.through(journey_id=journey.pk, crew_id=crew_id)
+                for journey, members in zip(journeys, crew)
+                for crew_id in members
+            ])
+            record_changes(Journey, [journey.pk for journey in journeys])
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {len(journeys)} journeys."
+        ))
@@ -0,0 +1,90 @@
+import gc
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+from train_station_api.memory import MemoryTrace, describe_view
+
+
+class Command(BaseCommand):
+    help = ("Replay GET requests under tracemalloc and report peak and "
+            "retained memory with the top allocation sites.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("urls", nargs="+",
+                            help="Paths to request, e.g. "
+                                 "/api/station/journeys/1/")
+        parser.add_argument("--user",
+                            help="Email of the user to authenticate as "
+                                 "(default: the first staff user).")
+        parser.add_argument("--repeat", type=int, default=3,
+                            help="Requests per URL; the first warms caches "
+                                 "and is not reported (default 3).")
+        parser.add_argument("--top", type=int, default=10)
+        parser.add_argument("--frames", type=int, default=1,
+                            help="Traceback depth stored per allocation.")
+        parser.add_argument("--output",
+                            help="Also write the report as JSON here.")
+
+    def handle(self, *args, **options):
+        users = get_user_model().objects.order_by("id")
+        if options["user"]:
+            user = users.filter(email=options["user"]).first()
+        else:
+            user = users.filter(is_staff=True).first()
+        if user is None:
+            raise CommandError("No user to authenticate requests as.")
+        if options["repeat"] < 2:
+            raise CommandError("--repeat must be at least 2.")
+        client = APIClient(REMOTE_ADDR="192.0.2.1")
+        client.force_authenticate(user)
+
+        report = {}
+        with override_settings(ALLOWED_HOSTS=["testserver"]):
+            for url in options["urls"]:
+                client.get(url)
+                runs = [self.measure(client, url, options)
+                        for _ in range(options["repeat"] - 1)]
+                report[url] = max(runs, key=lambda run: run["peak_kb"])
+                self.write(url, report[url])
+
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(report, output, indent=2)
+
+    def measure(self, client, url, options):
+        gc.collect()
+        with MemoryTrace(frames=options["frames"]) as trace:
+            response = client.get(url)
+            trace.stop()
+            status_code = response.status_code
+            view = describe_view(response.wsgi_request, response)
+            del response
+            gc.collect()
+            retained = trace.retained()
+        return {
+            "status": status_code,
+            "view": view,
+            "peak_kb": round(trace.peak / 1024, 1),
+            "response_kb": round(trace.allocated / 1024, 1),
+            "retained_kb": round(retained / 1024, 1),
+            "top_sites": trace.top_sites(options["top"]),
+        }
+
+    def write(self, url, result):
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{url} ({result['view']}, {result['status']})"
+        ))
+        self.stdout.write(
+            f"  peak {result['peak_kb']} KiB, alive with response "
+            f"{result['response_kb']} KiB, retained after release "
+            f"{result['retained_kb']} KiB"
+        )
+        for site in result["top_sites"]:
+            self.stdout.write(
+                f"  {site['size'] / 1024:10.1f} KiB "
+                f"{site['count']:7d} blocks  {site['site']}"
+            )
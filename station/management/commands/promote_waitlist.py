@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from station.models import WaitlistEntry
+from station.waitlist import promote_waitlist
+
+
+class Command(BaseCommand):
+    help = ("Book free seats for waitlisted users of upcoming journeys, "
+            "e.g. after seats were released outside the API.")
+
+    def handle(self, *args, **options):
+        journey_ids = WaitlistEntry.objects.filter(
+            promoted_at__isnull=True,
+            journey__departure_time__gt=timezone.now(),
+        ).values_list("journey_id", flat=True).distinct().order_by()
+        promoted = sum(promote_waitlist(journey_id)
+                       for journey_id in journey_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f"Promoted {promoted} waitlist entries."
+        ))
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-19 09:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("station", "0008_journey_image"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="crew",
+            name="image_variants",
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name="journey",
+            name="image_variants",
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.7 on 2026-10-19 09:46
+
+from django.db import migrations, models
+
+# A train cannot run two journeys at once. Exclusion constraints need
+# PostgreSQL; other databases rely on JourneySerializer's checks.
+ADD_CONSTRAINT = (
+    "ALTER TABLE station_journey ADD CONSTRAINT journey_train_no_overlap "
+    "EXCLUDE USING gist (train_id WITH =, "
+    "tstzrange(departure_time, arrival_time, '[)') WITH &&)"
+)
+DROP_CONSTRAINT = (
+    "ALTER TABLE station_journey DROP CONSTRAINT journey_train_no_overlap"
+)
+
+
+def add_train_constraint(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS btree_gist")
+        schema_editor.execute(ADD_CONSTRAINT)
+
+
+def drop_train_constraint(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(DROP_CONSTRAINT)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("station", "0010_check_in"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="journey",
+            index=models.Index(
+                fields=["train", "departure_time"],
+                name="station_jou_train_i_13d639_idx",
+            ),
+        ),
+        migrations.RunPython(add_train_constraint, drop_train_constraint),
+    ]
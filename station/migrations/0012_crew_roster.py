@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-19 09:52
+
+from django.db import migrations, models
+
+# Rosters look up a crew member's journeys; the auto-created through
+# table only has a (journey_id, crew_id) unique index.
+ADD_INDEX = (
+    "CREATE INDEX station_journey_crew_crew_journey_idx "
+    "ON station_journey_crew (crew_id, journey_id)"
+)
+DROP_INDEX = "DROP INDEX station_journey_crew_crew_journey_idx"
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("station", "0011_journey_schedule"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="journey",
+            index=models.Index(
+                fields=["departure_time"], name="station_jou_departu_f114b4_idx"
+            ),
+        ),
+        migrations.RunSQL(ADD_INDEX, DROP_INDEX),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.2.7 on 2026-10-19 10:12
+
+import django.core.validators
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("station", "0013_waitlist"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OccupancySurcharge",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "min_occupancy",
+                    models.PositiveSmallIntegerField(
+                        unique=True,
+                        validators=[django.core.validators.MaxValueValidator(100)],
+                    ),
+                ),
+                ("surcharge", models.PositiveSmallIntegerField()),
+            ],
+            options={
+                "ordering": ["min_occupancy"],
+            },
+        ),
+        migrations.CreateModel(
+            name="Tariff",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("from_km", models.PositiveIntegerField(unique=True)),
+                ("price_per_km", models.DecimalField(decimal_places=2, max_digits=6)),
+            ],
+            options={
+                "ordering": ["from_km"],
+            },
+        ),
+        migrations.AddField(
+            model_name="ticket",
+            name="price",
+            field=models.DecimalField(
+                blank=True, decimal_places=2, max_digits=8, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="traintype",
+            name="fare_multiplier",
+            field=models.DecimalField(
+                decimal_places=2, default=Decimal("1.00"), max_digits=4
+            ),
+        ),
+    ]
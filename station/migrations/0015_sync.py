@@ -0,0 +1,50 @@
+# Generated by Django 5.2.7 on 2026-10-19 10:24
+
+from django.db import migrations, models
+
+SEEDED_TABLES = (("stations", "Station"), ("trains", "Train"),
+                 ("routes", "Route"), ("journeys", "Journey"))
+
+
+def seed_changes(apps, schema_editor):
+    """Log the existing rows so a first sync returns all of them."""
+    SyncChange = apps.get_model("station", "SyncChange")
+    for table, model_name in SEEDED_TABLES:
+        ids = apps.get_model("station", model_name).objects.order_by(
+            "pk"
+        ).values_list("pk", flat=True)
+        SyncChange.objects.bulk_create(
+            (SyncChange(table=table, object_id=object_id)
+             for object_id in ids.iterator()),
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("station", "0014_fares"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SyncChange",
+            fields=[
+                ("seq", models.BigAutoField(primary_key=True, serialize=False)),
+                ("table", models.CharField(max_length=20)),
+                ("object_id", models.BigIntegerField()),
+                ("deleted", models.BooleanField(default=False)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "ordering": ["seq"],
+                "indexes": [
+                    models.Index(
+                        fields=["table", "object_id", "seq"],
+                        name="station_syn_table_d21aad_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(seed_changes, migrations.RunPython.noop),
+    ]
@@ -1,14 +1,19 @@
 import os
 import uuid
+from decimal import Decimal
 
 from django.conf import settings
 from django.core.exceptions import ValidationError
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 from django.utils.text import slugify
 
 
 class TrainType(models.Model):
     name = models.CharField(max_length=100)
+    fare_multiplier = models.DecimalField(max_digits=4,
+                                          decimal_places=2,
+                                          default=Decimal("1.00"))
 
     class Meta:
         ordering = ["name"]
@@ -54,6 +59,7 @@ class Crew(models.Model):
     image = models.ImageField(null=True,
                               upload_to=create_custom_path,
                               blank=True)
+    image_variants = models.JSONField(default=dict, blank=True)
 
     @property
     def full_name(self):
@@ -105,6 +111,34 @@ class Route(models.Model):
         return f"{self.name}, distance: {self.distance} km"
 
 
+class Tariff(models.Model):
+    """Price per km from ``from_km`` up to the next tariff's start."""
+
+    from_km = models.PositiveIntegerField(unique=True)
+    price_per_km = models.DecimalField(max_digits=6, decimal_places=2)
+
+    class Meta:
+        ordering = ["from_km"]
+
+    def __str__(self):
+        return f"{self.price_per_km} per km from {self.from_km} km"
+
+
+class OccupancySurcharge(models.Model):
+    """Surcharge in percent once a journey is ``min_occupancy`` % full."""
+
+    min_occupancy = models.PositiveSmallIntegerField(
+        unique=True, validators=[MaxValueValidator(100)]
+    )
+    surcharge = models.PositiveSmallIntegerField()
+
+    class Meta:
+        ordering = ["min_occupancy"]
+
+    def __str__(self):
+        return f"+{self.surcharge}% from {self.min_occupancy}% occupancy"
+
+
 class Journey(models.Model):
     route = models.ForeignKey(Route,
                               on_delete=models.CASCADE,
@@ -118,6 +152,13 @@ class Journey(models.Model):
     image = models.ImageField(null=True,
                               upload_to=create_custom_path,
                               blank=True)
+    image_variants = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["train", "departure_time"]),
+            models.Index(fields=["departure_time"]),
+        ]
 
     def __str__(self):
         return (
@@ -166,6 +207,10 @@ class Ticket(models.Model):
     order = models.ForeignKey(Order,
                               on_delete=models.CASCADE,
                               related_name="tickets")
+    price = models.DecimalField(max_digits=8,
+                                decimal_places=2,
+                                null=True,
+                                blank=True)
 
     class Meta:
         unique_together = ("journey", "cargo", "seat")
@@ -195,3 +240,77 @@ class Ticket(models.Model):
     def save(self, *args, **kwargs):
         self.full_clean()
         return super(Ticket, self).save(*args, **kwargs)
+
+
+class CheckIn(models.Model):
+    ticket = models.OneToOneField(Ticket,
+                                  on_delete=models.CASCADE,
+                                  related_name="check_in")
+    scanned_at = models.DateTimeField()
+    gate = models.CharField(max_length=50, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.ticket_id} at {self.scanned_at}"
+
+
+class WaitlistEntry(models.Model):
+    journey = models.ForeignKey(Journey,
+                                on_delete=models.CASCADE,
+                                related_name="waitlist")
+    user = models.ForeignKey(settings.AUTH_USER_MODEL,
+                             on_delete=models.CASCADE)
+    seats = models.PositiveSmallIntegerField(
+        validators=[MinValueValidator(1), MaxValueValidator(10)]
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    promoted_at = models.DateTimeField(null=True, blank=True)
+    order = models.OneToOneField(Order,
+                                 null=True,
+                                 blank=True,
+                                 on_delete=models.SET_NULL,
+                                 related_name="waitlist_entry")
+
+    class Meta:
+        ordering = ["created_at", "id"]
+        verbose_name_plural = "waitlist entries"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["journey", "user"],
+                condition=models.Q(promoted_at__isnull=True),
+                name="waitlist_one_waiting_entry_per_user",
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["journey", "created_at", "id"],
+                condition=models.Q(promoted_at__isnull=True),
+                name="waitlist_queue_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user} waiting for {self.seats} on {self.journey_id}"
+
+
+class SyncChange(models.Model):
+    """A row of a synced table written or deleted, in write order.
+
+    Offline clients ask for the changes after the last ``seq`` they saw
+    (see ``station.sync``); older changes of the same row can be dropped
+    with ``compact_sync_changes``.
+    """
+
+    seq = models.BigAutoField(primary_key=True)
+    table = models.CharField(max_length=20)
+    object_id = models.BigIntegerField()
+    deleted = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["seq"]
+        indexes = [models.Index(fields=["table", "object_id", "seq"])]
+
+    def __str__(self):
+        action = "deleted" if self.deleted else "written"
+        return f"{self.seq}: {self.table} {self.object_id} {action}"
@@ -0,0 +1,136 @@
+from collections import defaultdict
+
+from django.db.models import Q
+
+from station.models import Journey
+
+
+class IntervalTree:
+    """Static interval tree over half-open ``[start, end)`` intervals.
+
+    Intervals are kept sorted by start in an implicit balanced tree whose
+    nodes also store the largest end in their subtree, so ``overlapping``
+    visits O(log n + k) nodes for k results.
+    """
+
+    def __init__(self, intervals):
+        self.items = sorted(intervals, key=lambda item: item[0])
+        self.max_end = [None] * len(self.items)
+        self._build(0, len(self.items))
+
+    def _build(self, low, high):
+        if low >= high:
+            return None
+        middle = (low + high) // 2
+        ends = [self.items[middle][1]]
+        for child in (self._build(low, middle),
+                      self._build(middle + 1, high)):
+            if child is not None:
+                ends.append(child)
+        self.max_end[middle] = max(ends)
+        return self.max_end[middle]
+
+    def overlapping(self, start, end):
+        """Yield ``(start, end, value)`` items overlapping ``[start, end)``."""
+        stack = [(0, len(self.items))]
+        while stack:
+            low, high = stack.pop()
+            if low >= high:
+                continue
+            middle = (low + high) // 2
+            if self.max_end[middle] <= start:
+                continue
+            stack.append((low, middle))
+            item = self.items[middle]
+            if item[0] < end:
+                if item[1] > start:
+                    yield item
+                stack.append((middle + 1, high))
+
+
+def load_schedules(start=None, end=None, trains=None, crew=None,
+                   exclude=()):
+    """Intervals of stored journeys per train and per crew member.
+
+    Two queries regardless of the number of journeys: one for the
+    journeys overlapping ``[start, end)`` and one for their crew. When
+    ``trains`` and ``crew`` ids are given, only their journeys are loaded.
+    """
+    journeys = Journey.objects.exclude(pk__in=exclude)
+    if start is not None:
+        journeys = journeys.filter(arrival_time__gt=start)
+    if end is not None:
+        journeys = journeys.filter(departure_time__lt=end)
+    crew_rows = Journey.crew.through.objects.all()
+    if trains is not None:
+        journeys = journeys.filter(
+            Q(train_id__in=trains) | Q(crew__in=crew)
+        ).distinct()
+        crew_rows = crew_rows.filter(crew_id__in=crew)
+    intervals = {}
+    train_schedules = defaultdict(list)
+    for pk, train_id, departure, arrival in journeys.values_list(
+            "id", "train_id", "departure_time", "arrival_time"):
+        intervals[pk] = (departure, arrival)
+        if trains is None or train_id in trains:
+            train_schedules[train_id].append((departure, arrival, pk))
+    crew_schedules = defaultdict(list)
+    for journey_id, crew_id in crew_rows.filter(
+            journey__in=journeys).values_list("journey_id", "crew_id"):
+        crew_schedules[crew_id].append((*intervals[journey_id], journey_id))
+    return train_schedules, crew_schedules
+
+
+def overlapping_pairs(schedules):
+    """``(resource id, journey a, journey b)`` for every overlap."""
+    for resource_id, intervals in schedules.items():
+        tree = IntervalTree(intervals)
+        for start, end, journey in intervals:
+            for _, _, other in tree.overlapping(start, end):
+                if journey < other:
+                    yield resource_id, journey, other
+
+
+def find_conflicts(candidates):
+    """Check new or changed journeys against the timetable and each other.
+
+    ``candidates`` maps a key (any orderable value distinct from stored
+    journey ids, e.g. negative indexes, or the pk of a journey being
+    changed) to ``(train_id, crew_ids, departure_time, arrival_time)``.
+    The stored schedule spanning all candidates is loaded once and
+    indexed with interval trees, so checking thousands of journeys takes
+    two queries and O(n log n) time. Returns ``(kind, resource id,
+    candidate key, conflicting key)`` tuples.
+    """
+    if not candidates:
+        return []
+    start = min(candidate[2] for candidate in candidates.values())
+    end = max(candidate[3] for candidate in candidates.values())
+    trains, crew = load_schedules(
+        start, end,
+        trains={candidate[0] for candidate in candidates.values()},
+        crew={crew_id for candidate in candidates.values()
+              for crew_id in candidate[1]},
+        exclude=[key for key in candidates
+                 if isinstance(key, int) and key > 0],
+    )
+    for key, (train_id, crew_ids, departure, arrival) in candidates.items():
+        trains[train_id].append((departure, arrival, key))
+        for crew_id in crew_ids:
+            crew[crew_id].append((departure, arrival, key))
+
+    conflicts = []
+    for kind, schedules in (("train", trains), ("crew", crew)):
+        for resource_id, intervals in schedules.items():
+            keys = [item[2] for item in intervals if item[2] in candidates]
+            if not keys:
+                continue
+            tree = IntervalTree(intervals)
+            for key in keys:
+                _, _, departure, arrival = candidates[key]
+                for _, _, other in tree.overlapping(departure, arrival):
+                    # Report pairs of candidates once.
+                    if other != key and (other not in candidates
+                                         or key < other):
+                        conflicts.append((kind, resource_id, key, other))
+    return conflicts
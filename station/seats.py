@@ -0,0 +1,102 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+
+from station.models import Journey, Ticket
+from train_station_api.events import broker
+
+PREFIX = "seats:"
+
+
+def seats_topic(journey_id):
+    return f"{PREFIX}{journey_id}"
+
+
+def publish_seats(journey_id, name, seats):
+    """Announce ``taken`` or ``released`` ``(cargo, seat)`` pairs once the
+    current transaction commits."""
+    seats = [list(seat) for seat in seats]
+    transaction.on_commit(lambda: broker.publish(
+        seats_topic(journey_id), (name, {"seats": seats})
+    ))
+
+
+class SeatMap:
+    __slots__ = ("cargo_num", "places_in_cargo", "taken", "expires_at")
+
+    def __init__(self, cargo_num, places_in_cargo, taken):
+        self.cargo_num = cargo_num
+        self.places_in_cargo = places_in_cargo
+        self.taken = set(taken)
+        self.expires_at = time.monotonic() + settings.SEAT_MAP_TTL
+
+    def snapshot(self):
+        return {"cargo_num": self.cargo_num,
+                "places_in_cargo": self.places_in_cargo,
+                "taken": sorted(self.taken)}
+
+
+class SeatMapStore:
+    """Per-process LRU of journey seat maps with a time-to-live.
+
+    A map is loaded with two queries and then follows the ``taken`` and
+    ``released`` events of its ``seats:<id>`` topic, so any number of
+    watchers share it without touching the database.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._maps = OrderedDict()
+
+    def get(self, journey_id):
+        now = time.monotonic()
+        with self._lock:
+            seat_map = self._maps.get(journey_id)
+            if seat_map is not None and seat_map.expires_at > now:
+                self._maps.move_to_end(journey_id)
+                return seat_map
+        layout = Journey.objects.filter(pk=journey_id).values_list(
+            "train__cargo_num", "train__place_in_cargo"
+        ).first()
+        if layout is None:
+            return None
+        seat_map = SeatMap(*layout, Ticket.objects.filter(
+            journey_id=journey_id
+        ).values_list("cargo", "seat"))
+        with self._lock:
+            self._maps[journey_id] = seat_map
+            self._maps.move_to_end(journey_id)
+            while len(self._maps) > settings.SEAT_MAP_CACHE_SIZE:
+                self._maps.popitem(last=False)
+        return seat_map
+
+    def snapshot(self, journey_id):
+        seat_map = self.get(journey_id)
+        if seat_map is None:
+            return None
+        with self._lock:
+            return seat_map.snapshot()
+
+    def apply(self, topic, name, data):
+        # Events repeat what a fresh load would show, so applying them
+        # twice is harmless.
+        with self._lock:
+            seat_map = self._maps.get(int(topic[len(PREFIX):]))
+            if seat_map is None:
+                return
+            seats = {tuple(seat) for seat in data["seats"]}
+            if name == "taken":
+                seat_map.taken |= seats
+            elif name == "released":
+                seat_map.taken -= seats
+
+    def clear(self):
+        with self._lock:
+            self._maps.clear()
+
+
+seat_maps = SeatMapStore()
+broker.listen(PREFIX, seat_maps.apply)
@@ -1,4 +1,12 @@
-from django.db import transaction
+import logging
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
@@ -11,7 +19,18 @@ from station.models import (
     Journey,
     Ticket,
     Order,
+    WaitlistEntry,
 )
+from station.fares import fare_tables
+from station.scheduling import find_conflicts
+from station.seats import publish_seats
+from station.tickets import sign_ticket
+from station.waitlist import schedule_promotion
+
+logger = logging.getLogger(__name__)
+
+# Exclusion constraint added on PostgreSQL by migration 0011.
+TRAIN_OVERLAP_CONSTRAINT = "journey_train_no_overlap"
 
 
 class TrainTypeSerializer(serializers.ModelSerializer):
@@ -34,6 +53,28 @@ class TrainListSerializer(TrainSerializer):
     )
 
 
+class ImageVariantField(serializers.ImageField):
+    """Image URL that honours the ``?image_variant=`` query parameter."""
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault("read_only", True)
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        request = self.context.get("request")
+        variant = (request.query_params.get("image_variant")
+                   if request else None)
+        name = value.instance.image_variants.get(variant) if variant else None
+        if name is None:
+            return super().to_representation(value)
+        url = value.storage.url(name)
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+
 class CrewSerializer(serializers.ModelSerializer):
     class Meta:
         model = Crew
@@ -41,6 +82,8 @@ class CrewSerializer(serializers.ModelSerializer):
 
 
 class CrewListSerializer(serializers.ModelSerializer):
+    image = ImageVariantField()
+
     class Meta:
         model = Crew
         fields = (
@@ -51,6 +94,8 @@ class CrewListSerializer(serializers.ModelSerializer):
 
 
 class CrewDetailSerializer(serializers.ModelSerializer):
+    image = ImageVariantField()
+
     class Meta:
         model = Crew
         fields = ("id", "first_name", "last_name", "full_name", "image")
@@ -87,8 +132,60 @@ class JourneySerializer(serializers.ModelSerializer):
         Journey.validate_departure_time(
             attrs["departure_time"], attrs["arrival_time"], ValidationError
         )
+        self.validate_schedule(attrs)
         return data
 
+    def validate_schedule(self, attrs):
+        """Reject journeys overlapping another of the train or crew."""
+        instance = self.instance
+        train = attrs.get("train") or instance.train
+        if "crew" in attrs:
+            crew = attrs["crew"]
+        else:
+            crew = instance.crew.all() if instance else []
+        key = instance.pk if instance else -1
+        conflicts = find_conflicts({key: (
+            train.pk, [member.pk for member in crew],
+            attrs["departure_time"], attrs["arrival_time"],
+        )})
+        errors = {}
+        for kind, resource_id, _, other in conflicts:
+            if kind == "train":
+                message = (f"The train is already scheduled for journey "
+                           f"{other} at that time.")
+            else:
+                message = (f"Crew member {resource_id} is already assigned "
+                           f"to journey {other} at that time.")
+            errors.setdefault(kind, []).append(message)
+        if errors:
+            raise ValidationError(errors)
+
+    def create(self, validated_data):
+        return self.save_schedule(super().create, validated_data)
+
+    def update(self, instance, validated_data):
+        return self.save_schedule(
+            lambda data: super(JourneySerializer, self).update(instance, data),
+            validated_data,
+        )
+
+    def save_schedule(self, write, validated_data):
+        """Run ``write``, reporting a journey of the train saved since the
+        schedule was checked as a validation error."""
+        attrs = dict(validated_data)
+        try:
+            with transaction.atomic():
+                return write(validated_data)
+        except IntegrityError as error:
+            if TRAIN_OVERLAP_CONSTRAINT not in str(error):
+                raise
+        # The other journey has committed, so checking again names it.
+        self.validate_schedule(attrs)
+        raise ValidationError({"train": [
+            "The train is already scheduled for another journey at that "
+            "time."
+        ]})
+
     class Meta:
         model = Journey
         fields = (
@@ -101,10 +198,32 @@ class JourneySerializer(serializers.ModelSerializer):
         )
 
 
+class PricedJourneyListSerializer(serializers.ListSerializer):
+    """Price all journeys of a page in one pass over the fare table.
+
+    Journeys need their route and train type loaded and
+    ``tickets_available`` annotated; others are left without a price.
+    """
+
+    def to_representation(self, data):
+        journeys = list(data)
+        priced = [journey for journey in journeys
+                  if hasattr(journey, "tickets_available")]
+        prices = fare_tables.get().price_journeys(priced, [
+            journey.train.capacity - journey.tickets_available
+            for journey in priced
+        ])
+        for journey, price in zip(priced, prices):
+            journey.price = price
+        return super().to_representation(journeys)
+
+
 class JourneyListSerializer(JourneySerializer):
     route = serializers.SlugRelatedField(slug_field="name", read_only=True)
     train = serializers.SlugRelatedField(slug_field="name", read_only=True)
     tickets_available = serializers.IntegerField(read_only=True)
+    price = serializers.DecimalField(max_digits=8, decimal_places=2,
+                                     read_only=True)
 
     class Meta:
         model = Journey
@@ -115,7 +234,40 @@ class JourneyListSerializer(JourneySerializer):
             "departure_time",
             "arrival_time",
             "tickets_available",
+            "price",
         )
+        list_serializer_class = PricedJourneyListSerializer
+
+
+class SyncJourneySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Journey
+        fields = ("id", "route", "train", "departure_time", "arrival_time")
+
+
+class JourneyQuoteSerializer(serializers.Serializer):
+    journeys = serializers.ListField(
+        child=serializers.IntegerField(), allow_empty=False,
+        max_length=settings.QUOTE_BATCH_SIZE,
+    )
+
+
+class RosterJourneySerializer(serializers.ModelSerializer):
+    route = serializers.SlugRelatedField(slug_field="name", read_only=True)
+    train = serializers.SlugRelatedField(slug_field="name", read_only=True)
+
+    class Meta:
+        model = Journey
+        fields = ("id", "route", "train", "departure_time", "arrival_time")
+
+
+class CrewRosterSerializer(serializers.ModelSerializer):
+    journeys = RosterJourneySerializer(source="roster", many=True,
+                                       read_only=True)
+
+    class Meta:
+        model = Crew
+        fields = ("id", "full_name", "journeys")
 
 
 class JourneyImageSerializer(serializers.ModelSerializer):
@@ -138,6 +290,7 @@ class JourneyDetailSerializer(JourneySerializer):
                                           read_only=True,
                                           source="tickets")
     crew = CrewListSerializer(many=True, read_only=True)
+    image = ImageVariantField()
 
     class Meta:
         model = Journey
@@ -153,7 +306,20 @@ class JourneyDetailSerializer(JourneySerializer):
         )
 
 
+class PrefetchedJourneyField(serializers.PrimaryKeyRelatedField):
+    """Journey taken from the ``journeys`` the order serializer loaded for
+    all its tickets, so each ticket does not query its own."""
+
+    def to_internal_value(self, data):
+        try:
+            return self.context["journeys"][int(data)]
+        except (KeyError, TypeError, ValueError):
+            return super().to_internal_value(data)
+
+
 class TicketSerializer(serializers.ModelSerializer):
+    journey = PrefetchedJourneyField(queryset=Journey.objects.all())
+
     def validate(self, attrs):
         data = super(TicketSerializer, self).validate(attrs)
         Ticket.validate_ticket(
@@ -163,22 +329,82 @@ class TicketSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Ticket
-        fields = ("id", "cargo", "seat", "journey")
+        fields = ("id", "cargo", "seat", "journey", "price")
+        read_only_fields = ("price",)
+        # Seats are checked for the whole order in one query by
+        # OrderSerializer.validate_tickets.
+        validators = []
+
+
+SEAT_TAKEN = "A seat of this order is already taken."
 
 
 class OrderSerializer(serializers.ModelSerializer):
     tickets = TicketSerializer(read_only=False, many=True, allow_empty=False)
+    total = serializers.SerializerMethodField()
 
     class Meta:
         model = Order
-        fields = ("id", "created_at", "tickets")
+        fields = ("id", "created_at", "tickets", "total")
+
+    def get_total(self, obj) -> str:
+        total = sum(ticket.price for ticket in obj.tickets.all()
+                    if ticket.price is not None)
+        return f"{total:.2f}"
+
+    def to_internal_value(self, data):
+        # Load the journeys of all tickets, with what validating and
+        # pricing them needs, in one query.
+        tickets = data.get("tickets") if hasattr(data, "get") else None
+        journey_ids = set()
+        for ticket in tickets if isinstance(tickets, list) else ():
+            try:
+                journey_ids.add(int(ticket.get("journey")))
+            except (AttributeError, TypeError, ValueError):
+                pass
+        self.context["journeys"] = Journey.objects.select_related(
+            "route", "train__train_type"
+        ).annotate(sold=Count("tickets")).in_bulk(journey_ids)
+        return super().to_internal_value(data)
+
+    def validate_tickets(self, tickets):
+        seats = [(ticket["journey"].id, ticket["cargo"], ticket["seat"])
+                 for ticket in tickets]
+        if len(set(seats)) < len(seats) or Ticket.objects.filter(reduce(or_, [
+            Q(journey_id=journey_id, cargo=cargo, seat=seat)
+            for journey_id, cargo, seat in seats
+        ])).exists():
+            raise ValidationError(SEAT_TAKEN)
+        return tickets
 
     def create(self, validated_data):
         with transaction.atomic():
             tickets_data = validated_data.pop("tickets")
+            # Seats are priced at the occupancy before this order.
+            journeys = list({ticket["journey"].id: ticket["journey"]
+                             for ticket in tickets_data}.values())
+            prices = dict(zip(
+                [journey.id for journey in journeys],
+                fare_tables.get().price_journeys(
+                    journeys, [journey.sold for journey in journeys]
+                ),
+            ))
             order = Order.objects.create(**validated_data)
-            for ticket_data in tickets_data:
-                Ticket.objects.create(order=order, **ticket_data)
+            try:
+                tickets = Ticket.objects.bulk_create([
+                    Ticket(order=order,
+                           price=prices[ticket_data["journey"].id],
+                           **ticket_data)
+                    for ticket_data in tickets_data
+                ])
+            except IntegrityError:
+                # Another order took a seat since it was checked.
+                raise ValidationError({"tickets": [SEAT_TAKEN]})
+            # Bulk inserts skip the ticket signals, so announce the seats.
+            for journey in journeys:
+                seats = [(ticket.cargo, ticket.seat) for ticket in tickets
+                         if ticket.journey_id == journey.id]
+                publish_seats(journey.id, "taken", seats)
             return order
 
 
@@ -189,7 +415,7 @@ class TicketListSerializer(TicketSerializer):
 
     class Meta:
         model = Ticket
-        fields = ("id", "cargo", "seat", "train", "journey")
+        fields = ("id", "cargo", "seat", "train", "journey", "price")
 
 
 class OrderListSerializer(OrderSerializer):
@@ -207,6 +433,7 @@ class TicketDetailSerializer(TicketSerializer):
     arrival_time = serializers.DateTimeField(
         read_only=True, source="journey.arrival_time"
     )
+    token = serializers.SerializerMethodField()
 
     class Meta:
         model = Ticket
@@ -218,8 +445,126 @@ class TicketDetailSerializer(TicketSerializer):
             "arrival_time",
             "cargo",
             "seat",
+            "price",
+            "token",
         )
 
+    def get_token(self, obj) -> str | None:
+        # Without a signing key the order is still shown, without tokens.
+        try:
+            return sign_ticket(obj)
+        except ImproperlyConfigured as error:
+            logger.error("Could not sign ticket %s: %s", obj.pk, error)
+            return None
+
 
 class OrderDetailSerializer(OrderSerializer):
     tickets = TicketDetailSerializer(many=True, read_only=True)
+
+
+class OrderCancelSerializer(serializers.Serializer):
+    tickets = serializers.ListField(
+        child=serializers.IntegerField(), allow_empty=False, required=False,
+        help_text="Tickets to cancel; the whole order when left out.",
+    )
+
+    def cancel(self, order):
+        """Delete the chosen tickets, and the order once it has none.
+
+        The order's tickets are locked and checked in one query and the
+        chosen ones deleted in one statement, however many there are.
+        Tickets of departed journeys or already checked in cannot be
+        cancelled. Seats are released to boards and seat streams by the
+        ticket signals once the transaction commits, and then offered to
+        the journeys' waitlists.
+        """
+        ticket_ids = self.validated_data.get("tickets")
+        now = timezone.now()
+        with transaction.atomic():
+            tickets = {
+                ticket_id: rest
+                for ticket_id, *rest in (
+                    order.tickets.select_for_update(of=("self",))
+                    .values_list("id", "journey__departure_time",
+                                 "check_in", "journey_id")
+                )
+            }
+            if ticket_ids is None:
+                ticket_ids = list(tickets)
+            errors = []
+            for ticket_id in dict.fromkeys(ticket_ids):
+                if ticket_id not in tickets:
+                    errors.append(f"Ticket {ticket_id} is not in this order.")
+                elif tickets[ticket_id][1] is not None:
+                    errors.append(f"Ticket {ticket_id} is checked in.")
+                elif tickets[ticket_id][0] <= now:
+                    errors.append(
+                        f"Ticket {ticket_id} is for a departed journey."
+                    )
+            if errors:
+                raise ValidationError({"tickets": errors})
+            cancelled = sorted(set(ticket_ids))
+            Ticket.objects.filter(id__in=cancelled).delete()
+            remaining = len(tickets) - len(cancelled)
+            if not remaining:
+                order.delete()
+            schedule_promotion(tickets[ticket_id][2]
+                               for ticket_id in cancelled)
+        return {"cancelled": cancelled, "remaining": remaining}
+
+
+class WaitlistEntrySerializer(serializers.ModelSerializer):
+    journey = serializers.PrimaryKeyRelatedField(
+        queryset=Journey.objects.select_related("train")
+    )
+
+    class Meta:
+        model = WaitlistEntry
+        fields = ("id", "journey", "seats", "created_at", "promoted_at",
+                  "order")
+        read_only_fields = ("promoted_at", "order")
+
+    def validate(self, attrs):
+        journey = attrs["journey"]
+        if journey.departure_time <= timezone.now():
+            raise ValidationError({"journey": "The journey has departed."})
+        if WaitlistEntry.objects.filter(
+                journey=journey, user=self.context["request"].user,
+                promoted_at__isnull=True).exists():
+            raise ValidationError(
+                {"journey": "You are already on this waitlist."}
+            )
+        free = journey.train.capacity - journey.tickets.count()
+        if free >= attrs["seats"]:
+            raise ValidationError(
+                {"seats": f"{free} seats are free; book them instead."}
+            )
+        return attrs
+
+
+class CheckInScanSerializer(serializers.Serializer):
+    token = serializers.CharField(max_length=100)
+    scanned_at = serializers.DateTimeField()
+    gate = serializers.CharField(max_length=50, required=False, default="")
+
+
+class CheckInBatchSerializer(serializers.Serializer):
+    scans = CheckInScanSerializer(many=True, allow_empty=False)
+
+    def validate_scans(self, value):
+        if len(value) > settings.CHECK_IN_BATCH_SIZE:
+            raise ValidationError(
+                f"A batch holds at most {settings.CHECK_IN_BATCH_SIZE} scans."
+            )
+        return value
+
+
+class SyncSerializer(serializers.Serializer):
+    token = serializers.CharField()
+    more = serializers.BooleanField()
+    changes = serializers.DictField(child=serializers.ListField(
+        child=serializers.DictField()
+    ))
+    deleted = serializers.DictField(child=serializers.ListField(
+        child=serializers.IntegerField()
+    ))
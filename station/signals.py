@@ -0,0 +1,141 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from station.board import publish_journey
+from station.fares import announce_fare_change
+from station.models import (Crew, Journey, OccupancySurcharge, Route,
+                            Station, Tariff, Ticket, Train)
+from station.seats import publish_seats
+from station.sync import record_changes
+
+IMAGE_MODELS = (Crew, Journey)
+
+
+def is_image_referenced(name, variant=None):
+    lookup = f"image_variants__{variant}" if variant else "image"
+    return any(
+        model.objects.filter(**{lookup: name}).exists()
+        for model in IMAGE_MODELS
+    )
+
+
+def is_blob_referenced(name):
+    """Whether any row uses ``name`` as its image or one of its variants."""
+    return any(is_image_referenced(name, variant)
+               for variant in (None, *settings.IMAGE_VARIANTS))
+
+
+def modified_time(storage, name):
+    try:
+        return storage.get_modified_time(name)
+    except FileNotFoundError:
+        return None
+
+
+def delete_unless_reused(storage, name, modified_at, variant=None):
+    """Delete a blob no row references, unless an upload has reused it
+    since ``modified_at``; gc_media collects it once it is orphaned."""
+    if is_image_referenced(name, variant):
+        return
+    current = modified_time(storage, name)
+    if current is not None and current == modified_at:
+        storage.delete(name)
+
+
+def release_image(storage, blobs):
+    """Delete blobs and variants once no row references them.
+
+    ``blobs`` are ``(name, variant, modified_at)`` as seen when the rows
+    let go of them; uploads of identical content refresh the time.
+    """
+    for name, variant, modified_at in blobs:
+        delete_unless_reused(storage, name, modified_at, variant)
+
+
+def schedule_release(instance, name, variants):
+    storage = instance.image.storage
+    names = [(name, None)] if name else []
+    names.extend((variant_name, variant)
+                 for variant, variant_name in variants.items())
+    blobs = [(blob, variant, modified_time(storage, blob))
+             for blob, variant in names]
+    transaction.on_commit(lambda: release_image(storage, blobs))
+
+
+@receiver(pre_save, sender=Crew)
+@receiver(pre_save, sender=Journey)
+def remember_previous_image(sender, instance, update_fields=None, **kwargs):
+    instance._previous_image = None
+    if instance.pk is None:
+        return
+    if update_fields is not None and "image" not in update_fields:
+        return
+    instance._previous_image = (
+        sender.objects.filter(pk=instance.pk)
+        .values_list("image", "image_variants")
+        .first()
+    )
+
+
+@receiver(post_save, sender=Crew)
+@receiver(post_save, sender=Journey)
+def release_replaced_image(sender, instance, **kwargs):
+    previous = getattr(instance, "_previous_image", None)
+    if not previous:
+        return
+    name, variants = previous
+    if name and name != instance.image.name:
+        schedule_release(instance, name, variants or {})
+
+
+@receiver(post_delete, sender=Crew)
+@receiver(post_delete, sender=Journey)
+def release_deleted_image(sender, instance, **kwargs):
+    if instance.image:
+        schedule_release(instance, instance.image.name,
+                         instance.image_variants)
+
+
+@receiver(post_save, sender=Journey)
+@receiver(post_delete, sender=Journey)
+def announce_journey(sender, instance, **kwargs):
+    publish_journey(instance.id)
+
+
+@receiver(post_save, sender=Ticket)
+def announce_taken_seat(sender, instance, created, **kwargs):
+    if created:
+        publish_seats(instance.journey_id, "taken",
+                      [(instance.cargo, instance.seat)])
+
+
+@receiver(post_delete, sender=Ticket)
+def announce_released_seat(sender, instance, **kwargs):
+    publish_seats(instance.journey_id, "released",
+                  [(instance.cargo, instance.seat)])
+
+
+@receiver(post_save, sender=Tariff)
+@receiver(post_delete, sender=Tariff)
+@receiver(post_save, sender=OccupancySurcharge)
+@receiver(post_delete, sender=OccupancySurcharge)
+def reload_fares(sender, **kwargs):
+    transaction.on_commit(announce_fare_change)
+
+
+@receiver(post_save, sender=Station)
+@receiver(post_save, sender=Train)
+@receiver(post_save, sender=Route)
+@receiver(post_save, sender=Journey)
+def log_sync_write(sender, instance, **kwargs):
+    record_changes(sender, [instance.pk])
+
+
+@receiver(post_delete, sender=Station)
+@receiver(post_delete, sender=Train)
+@receiver(post_delete, sender=Route)
+@receiver(post_delete, sender=Journey)
+def log_sync_deletion(sender, instance, **kwargs):
+    record_changes(sender, [instance.pk], deleted=True)
@@ -0,0 +1,56 @@
+import hashlib
+import os
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+
+TEMPORARY_PREFIX = ".upload-"
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Store files under the SHA-256 of their content.
+
+    Only the directory and extension of the requested name are kept, so
+    ``uploads/images/crew/1-<uuid>.jpg`` becomes
+    ``uploads/images/crew/ab/<sha256>.jpg``. Identical uploads resolve to
+    the same blob and are written to disk only once.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        full_directory = self.path(directory)
+        os.makedirs(full_directory, exist_ok=True)
+
+        digest = hashlib.sha256()
+        fd, temporary_path = tempfile.mkstemp(dir=full_directory,
+                                              prefix=TEMPORARY_PREFIX)
+        try:
+            with os.fdopen(fd, "wb") as temporary:
+                if hasattr(content, "seek"):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    temporary.write(chunk)
+
+            hexdigest = digest.hexdigest()
+            name = os.path.join(directory, hexdigest[:2],
+                                f"{hexdigest}{extension}")
+            full_path = self.path(name)
+            if os.path.exists(full_path):
+                os.remove(temporary_path)
+                # Mark the blob as in use again so gc_media and pending
+                # releases leave it alone.
+                os.utime(full_path)
+            else:
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                os.chmod(temporary_path, self.file_permissions_mode or 0o644)
+                os.replace(temporary_path, full_path)
+        except BaseException:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
+        return name.replace("\\", "/")
@@ -0,0 +1,88 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from station.models import Journey, Route, Station, SyncChange, Train
+from station.serializers import (RouteSerializer,
+                                 StationSerializer,
+                                 SyncJourneySerializer,
+                                 TrainSerializer)
+
+# Synced tables in the order clients should apply them, so rows arrive
+# after the rows they reference.
+TABLES = {
+    "stations": (Station, StationSerializer),
+    "trains": (Train, TrainSerializer),
+    "routes": (Route, RouteSerializer),
+    "journeys": (Journey, SyncJourneySerializer),
+}
+TABLE_NAMES = {model: table for table, (model, _) in TABLES.items()}
+
+
+def record_changes(model, ids, deleted=False):
+    """Log writes or deletions of ``model`` rows for syncing clients.
+
+    Called from signals for single rows; bulk loaders, which skip the
+    signals, call it with all the ids they wrote.
+    """
+    SyncChange.objects.bulk_create(
+        [SyncChange(table=TABLE_NAMES[model], object_id=object_id,
+                    deleted=deleted) for object_id in ids],
+        batch_size=1000,
+    )
+
+
+def changes_since(since, limit):
+    """The rows changed after change ``since``, at most ``limit`` changes.
+
+    Returns the current version of every written row, the ids of deleted
+    ones, the token to ask for next time and whether more changes are
+    waiting. A row changed several times is sent once. Changes younger
+    than ``SYNC_SETTLE_SECONDS`` are held back, so a write whose
+    transaction has not committed yet is not skipped over by a later one
+    that has.
+    """
+    settled = timezone.now() - timedelta(seconds=settings.SYNC_SETTLE_SECONDS)
+    changes = list(SyncChange.objects.filter(
+        seq__gt=since, created_at__lt=settled
+    ).values_list("seq", "table", "object_id")[:limit + 1])
+    more = len(changes) > limit
+    changes = changes[:limit]
+
+    changed = {}
+    for _, table, object_id in changes:
+        changed.setdefault(table, set()).add(object_id)
+    rows, deleted = {}, {}
+    for table, (model, serializer_class) in TABLES.items():
+        ids = changed.get(table)
+        if not ids:
+            continue
+        found = list(model.objects.filter(pk__in=ids).order_by("pk"))
+        if found:
+            rows[table] = serializer_class(found, many=True).data
+        missing = ids.difference(row.pk for row in found)
+        if missing:
+            deleted[table] = sorted(missing)
+    return {
+        "token": str(changes[-1][0] if changes else since),
+        "more": more,
+        "changes": rows,
+        "deleted": deleted,
+    }
+
+
+def compact_changes():
+    """Drop changes superseded by a later change of the same row.
+
+    Clients only need the latest change of each row, so this is safe for
+    any token; deletions stay logged for clients that have not seen them.
+    Returns the number of changes dropped.
+    """
+    superseded = SyncChange.objects.filter(
+        table=OuterRef("table"), object_id=OuterRef("object_id"),
+        seq__gt=OuterRef("seq"),
+    )
+    count, _ = SyncChange.objects.filter(Exists(superseded)).delete()
+    return count
@@ -1,20 +1,65 @@
+import asyncio
+import hashlib
+import json
 import os
+import random
 import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
 from PIL import Image
 from django.contrib.auth import get_user_model
-from django.test import TestCase
-from django.urls import reverse
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.management import call_command, CommandError
+from django.db import IntegrityError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
 from rest_framework import status
-from rest_framework.test import APIClient
-
-from station.models import TrainType, Crew, Train, Route, Station, Journey
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from station import images, waitlist
+from station.board import JOURNEYS_TOPIC, boards, board_topic
+from station.fares import FareTable, fare_tables
+from station.models import (TrainType, Crew, Train, Route, Station, Journey,
+                            Order, Ticket, CheckIn, WaitlistEntry, Tariff,
+                            OccupancySurcharge, SyncChange)
 from station.serializers import (JourneyListSerializer,
                                  JourneyDetailSerializer)
+from station.scheduling import IntervalTree, find_conflicts
+from station.seats import seat_maps, seats_topic
+from station.signals import release_image
+from station.tickets import (InvalidTicketToken, check_signing_keys,
+                             sign_ticket, verify_ticket_token)
+from station.views import StationViewSet
+from station.waitlist import promote_waitlist
+from train_station_api import coalescing
+from train_station_api.admission import Pool
+from train_station_api.batch import BatchAuthentication
+from train_station_api.events import broker, event_stream
+from train_station_api.metrics import registry
+from train_station_api.schema import schema_documents
+from train_station_api.query_budget import QueryRecorder, get_query_budget
+from user.revocation import denylist
+from user.serializers import UserTokenObtainPairSerializer
+from user.throttling import BucketRateThrottle
 
 
 CREW_URL = reverse("station:crew-list")
 JOURNEY_URL = reverse("station:journey-list")
+METRICS_URL = reverse("metrics")
+CHECK_IN_URL = reverse("station:check-in-list")
+BATCH_URL = reverse("batch")
+SYNC_URL = reverse("station:sync-list")
+SCHEMA_URL = reverse("schema")
 
 
 def sample_crew(**params):
@@ -255,6 +300,1900 @@ class JourneyImageUploadTests(TestCase):
         self.assertIn("image", res.data)
 
 
+@override_settings(IMAGE_VARIANT_WORKERS=0)
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_superuser(
+            "admin@test.com", "password"
+        )
+        self.client.force_authenticate(self.user)
+        self.crew = sample_crew()
+
+    def tearDown(self):
+        for name in self.crew.image_variants.values():
+            self.crew.image.storage.delete(name)
+        self.crew.image.delete()
+
+    def upload_image(self):
+        url = image_crew_upload_url(self.crew.id)
+        with tempfile.NamedTemporaryFile(suffix=".jpg") as ntf:
+            img = Image.new("RGB", (1200, 900))
+            img.save(ntf, format="JPEG")
+            ntf.seek(0)
+            with self.captureOnCommitCallbacks(execute=True):
+                res = self.client.post(url, {"image": ntf},
+                                       format="multipart")
+        self.crew.refresh_from_db()
+        return res
+
+    def test_upload_generates_variants(self):
+        res = self.upload_image()
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(self.crew.image_variants),
+                         {"thumbnail", "medium", "webp"})
+        with self.crew.image.storage.open(
+                self.crew.image_variants["thumbnail"]) as thumbnail:
+            self.assertLessEqual(max(Image.open(thumbnail).size), 160)
+
+    def test_failed_background_generation_is_logged(self):
+        future = Future()
+        future.set_exception(OSError("disk full"))
+
+        with self.assertLogs("station.images", "ERROR") as logs:
+            images.log_failure("crew/a.jpg", future)
+
+        self.assertIn("crew/a.jpg", logs.output[0])
+        self.assertIn("disk full", logs.output[0])
+
+    def test_crew_list_selects_variant_by_query_param(self):
+        self.upload_image()
+        res = self.client.get(CREW_URL, {"image_variant": "webp"})
+        original = self.client.get(CREW_URL)
+
+        self.assertTrue(res.data["results"][0]["image"].endswith(".webp"))
+        self.assertTrue(
+            original.data["results"][0]["image"].endswith(".jpg")
+        )
+
+
+class ContentAddressedStorageTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_superuser(
+            "admin@test.com", "password"
+        )
+        self.client.force_authenticate(self.user)
+
+    def upload_image(self, crew, color):
+        url = image_crew_upload_url(crew.id)
+        with tempfile.NamedTemporaryFile(suffix=".jpg") as ntf:
+            img = Image.new("RGB", (10, 10), color)
+            img.save(ntf, format="JPEG")
+            ntf.seek(0)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(url, {"image": ntf}, format="multipart")
+        crew.refresh_from_db()
+
+    def test_identical_uploads_share_one_blob(self):
+        crew1 = sample_crew()
+        crew2 = sample_crew()
+        self.upload_image(crew1, "red")
+        self.upload_image(crew2, "red")
+
+        self.assertEqual(crew1.image.name, crew2.image.name)
+        self.addCleanup(crew1.image.storage.delete, crew1.image.name)
+
+    def test_replaced_image_released_when_unreferenced(self):
+        crew = sample_crew()
+        self.upload_image(crew, "red")
+        old_path = crew.image.path
+        self.upload_image(crew, "blue")
+        self.addCleanup(crew.image.storage.delete, crew.image.name)
+
+        self.assertFalse(os.path.exists(old_path))
+        self.assertTrue(os.path.exists(crew.image.path))
+
+    def test_gc_media_deletes_only_orphans(self):
+        crew = sample_crew()
+        self.upload_image(crew, "green")
+        self.addCleanup(crew.image.storage.delete, crew.image.name)
+        orphan = crew.image.storage.save(
+            "uploads/images/crew/orphan.jpg", ContentFile(b"orphan")
+        )
+
+        call_command("gc_media", grace_minutes=-1, stdout=StringIO())
+
+        self.assertFalse(crew.image.storage.exists(orphan))
+        self.assertTrue(crew.image.storage.exists(crew.image.name))
+
+    def test_reused_blob_survives_gc_and_pending_release(self):
+        storage = Crew._meta.get_field("image").storage
+        name = storage.save("uploads/images/crew/old.jpg",
+                            ContentFile(b"old"))
+        self.addCleanup(storage.delete, name)
+        long_ago = time.time() - 2 * 60 * 60
+        os.utime(storage.path(name), (long_ago, long_ago))
+        released_at = storage.get_modified_time(name)
+
+        # An upload of the same content reuses the blob.
+        self.assertEqual(storage.save("uploads/images/crew/new.jpg",
+                                      ContentFile(b"old")), name)
+        release_image(storage, [(name, None, released_at)])
+        call_command("gc_media", stdout=StringIO())
+
+        self.assertTrue(storage.exists(name))
+
+
+class MediaServingTests(TestCase):
+    def setUp(self):
+        self.storage = Crew._meta.get_field("image").storage
+        self.name = self.storage.save("uploads/images/crew/file.jpg",
+                                      ContentFile(b"0123456789"))
+        self.addCleanup(self.storage.delete, self.name)
+        self.url = self.storage.url(self.name)
+
+    def test_serves_whole_file_with_immutable_cache(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b"".join(response.streaming_content), b"0123456789")
+        self.assertIn("immutable", response["Cache-Control"])
+        response.close()
+
+    def test_range_request(self):
+        response = self.client.get(self.url, HTTP_RANGE="bytes=2-5")
+
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(b"".join(response.streaming_content), b"2345")
+        self.assertEqual(response["Content-Range"], "bytes 2-5/10")
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get(self.url, HTTP_RANGE="bytes=20-")
+
+        self.assertEqual(response.status_code,
+                         status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+
+    def test_conditional_request_not_modified(self):
+        etag = self.client.get(self.url)["ETag"]
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    @override_settings(MEDIA_SERVE_MODE="x-accel-redirect")
+    def test_accel_redirect_mode_delegates_transfer(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response["X-Accel-Redirect"],
+                         f"/protected-media/{self.name}")
+        self.assertEqual(response.content, b"")
+
+    def test_path_traversal_rejected(self):
+        response = self.client.get("/media/../settings.py")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class GenerateDatasetTests(TestCase):
+    def generate(self, **options):
+        call_command("generate_dataset", stations=30, trains=5, users=20,
+                     days=3, journeys_per_day=6, stdout=StringIO(),
+                     **options)
+
+    def test_generates_consistent_network(self):
+        self.generate()
+
+        self.assertEqual(Station.objects.count(), 30)
+        self.assertEqual(Journey.objects.count(), 18)
+        self.assertTrue(Order.objects.exists())
+        for ticket in Ticket.objects.select_related("journey__train"):
+            train = ticket.journey.train
+            self.assertTrue(1 <= ticket.cargo <= train.cargo_num)
+            self.assertTrue(1 <= ticket.seat <= train.place_in_cargo)
+            self.assertGreater(ticket.price, 0)
+        for order in Order.objects.all()[:10]:
+            self.assertLess(order.created_at,
+                            order.tickets.first().journey.departure_time)
+
+    def test_same_seed_gives_same_dataset(self):
+        self.generate(seed=7)
+        first = list(Journey.objects.values_list(
+            "route__source__name", "departure_time"))
+        tickets = Ticket.objects.count()
+        for model in (Ticket, Order, Journey, Route, Station, Crew, Train,
+                      TrainType):
+            model.objects.all().delete()
+        self.generate(seed=7)
+
+        self.assertEqual(first, list(Journey.objects.values_list(
+            "route__source__name", "departure_time")))
+        self.assertEqual(tickets, Ticket.objects.count())
+
+    def test_refuses_non_empty_database(self):
+        sample_station()
+
+        with self.assertRaises(CommandError):
+            self.generate()
+
+
+class BenchmarkCommandTests(TestCase):
+    def setUp(self):
+        call_command("generate_dataset", stations=20, trains=3, users=5,
+                     days=2, journeys_per_day=3, stdout=StringIO())
+        self.output = tempfile.NamedTemporaryFile(suffix=".json")
+        self.addCleanup(self.output.close)
+
+    def benchmark(self, **options):
+        call_command("benchmark", iterations=3, warmup=1, stdout=StringIO(),
+                     stderr=StringIO(), **options)
+
+    def test_records_metrics_for_every_scenario(self):
+        self.benchmark(output=self.output.name)
+
+        results = json.load(open(self.output.name))["scenarios"]
+        self.assertIn("order-create", results)
+        self.assertGreater(results["journey-list"]["queries"], 0)
+        self.assertEqual(Order.objects.filter(
+            tickets__journey__isnull=True).count(), 0)
+
+    def test_fails_on_regression(self):
+        self.benchmark(output=self.output.name, scenario=["journey-detail"])
+        with open(self.output.name) as output:
+            baseline = json.load(output)
+        baseline["scenarios"]["journey-detail"]["queries"] = 0
+        with open(self.output.name, "w") as output:
+            json.dump(baseline, output)
+
+        with self.assertRaises(CommandError):
+            self.benchmark(baseline=self.output.name,
+                           scenario=["journey-detail"])
+
+
+class QueryBudgetTests(TestCase):
+    """Every endpoint stays within the query budget its view declares.
+
+    Requests carry a real JWT, so the budgets include authentication. The
+    token denylist is refreshed by requests but its queries are left out
+    of budgets; the fare table is compiled again for every request, as
+    after it expired.
+    """
+
+    def setUp(self):
+        denylist.reset()
+        self.addCleanup(boards.clear)
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "admin@test.com", "password", is_staff=True
+        )
+        token = UserTokenObtainPairSerializer.get_token(self.user)
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {token.access_token}"
+        )
+        self.journey = sample_journey()
+        self.crew = [sample_crew(), sample_crew()]
+        self.journey.crew.set(self.crew)
+        other_journey = Journey.objects.create(
+            route=Route.objects.create(source=sample_station(name="A"),
+                                       destination=sample_station(name="B"),
+                                       distance=50),
+            train=sample_train(name="Other"),
+            departure_time=self.journey.departure_time,
+            arrival_time=self.journey.arrival_time,
+        )
+        for journey in (self.journey, other_journey):
+            order = Order.objects.create(user=self.user)
+            for seat in (1, 2, 3):
+                Ticket.objects.create(order=order, journey=journey,
+                                      cargo=1, seat=seat)
+        self.addCleanup(fare_tables.invalidate)
+
+    def assertWithinQueryBudget(self, make_request):
+        recorder = QueryRecorder()
+        fare_tables.invalidate()
+        with connection.execute_wrapper(recorder):
+            response = make_request()
+        self.assertLess(response.status_code, 400, response.content)
+        budget = get_query_budget(response.renderer_context["view"],
+                                  response.renderer_context["request"])
+        self.assertIsNotNone(budget, "The view declares no query budget.")
+        self.assertLessEqual(len(recorder.queries), budget,
+                             "\n".join(recorder.queries))
+
+    def test_list_and_retrieve_endpoints(self):
+        journey = self.journey
+        urls = [
+            reverse("station:traintype-list"),
+            reverse("station:train-list"),
+            reverse("station:train-detail", args=[journey.train_id]),
+            CREW_URL,
+            detail_crew_url(self.crew[0].id),
+            reverse("station:station-list"),
+            reverse("station:station-detail", args=[journey.route.source_id]),
+            reverse("station:route-list"),
+            reverse("station:route-detail", args=[journey.route_id]),
+            JOURNEY_URL,
+            detail_journey_url(journey.id),
+            reverse("station:order-list"),
+            reverse("station:order-detail",
+                    args=[self.user.order_set.first().id]),
+            reverse("station:journey-conflicts"),
+            reverse("station:crew-roster", args=[self.crew[0].id])
+            + "?from=2025-10-01",
+            reverse("station:crew-roster-export") + "?from=2025-10-01",
+            reverse("station:station-board",
+                    args=[journey.route.source_id]),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertWithinQueryBudget(lambda: self.client.get(url))
+
+    def test_create_endpoints(self):
+        journey = self.journey
+        train_type = journey.train.train_type
+        requests = [
+            (reverse("station:traintype-list"), {"name": "Express"}),
+            (reverse("station:train-list"),
+             {"name": "New", "cargo_num": 2, "place_in_cargo": 3,
+              "train_type": train_type.id}),
+            (CREW_URL, {"first_name": "New", "last_name": "Crew"}),
+            (reverse("station:station-list"),
+             {"name": "New", "latitude": 1, "longitude": 2}),
+            (reverse("station:route-list"),
+             {"source": journey.route.destination_id,
+              "destination": journey.route.source_id, "distance": 10}),
+            (JOURNEY_URL,
+             {"route": journey.route_id, "train": journey.train_id,
+              "departure_time": "2025-12-02 14:00:00",
+              "arrival_time": "2025-12-03 14:00:00",
+              "crew": [crew.id for crew in self.crew]}),
+            (reverse("station:order-list"),
+             {"tickets": [{"journey": journey.id, "cargo": 2, "seat": 1},
+                          {"journey": journey.id, "cargo": 2, "seat": 2}]}),
+            (reverse("station:journey-quote"), {"journeys": [journey.id]}),
+        ]
+        for url, data in requests:
+            with self.subTest(url=url):
+                self.assertWithinQueryBudget(
+                    lambda: self.client.post(url, data, format="json")
+                )
+
+    def test_order_queries_do_not_grow_with_tickets(self):
+        url = reverse("station:order-list")
+
+        def order(cargo, seats):
+            return self.client.post(url, {"tickets": [
+                {"journey": self.journey.id, "cargo": cargo, "seat": seat}
+                for seat in range(1, seats + 1)
+            ]}, format="json")
+
+        # Warm the caches, so both orders run the same queries.
+        fare_tables.get()
+        denylist.refresh(force=True)
+        with CaptureQueriesContext(connection) as single:
+            order(4, 1)
+        with self.assertNumQueries(len(single)):
+            response = order(5, 10)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data["tickets"]), 10)
+
+    def test_journey_update_and_delete(self):
+        url = detail_journey_url(self.journey.id)
+        data = {"route": self.journey.route_id,
+                "train": self.journey.train_id,
+                "departure_time": "2025-12-02 14:00:00",
+                "arrival_time": "2025-12-03 14:00:00",
+                "crew": [self.crew[0].id]}
+
+        self.assertWithinQueryBudget(
+            lambda: self.client.put(url, data, format="json"))
+        self.assertWithinQueryBudget(
+            lambda: self.client.patch(url, {
+                "departure_time": "2025-12-02 15:00:00",
+                "arrival_time": "2025-12-03 15:00:00",
+            }, format="json"))
+        self.assertWithinQueryBudget(lambda: self.client.delete(url))
+
+    def test_order_cancel(self):
+        Journey.objects.update(
+            departure_time=timezone.now() + timedelta(days=1),
+            arrival_time=timezone.now() + timedelta(days=2),
+        )
+        order = self.journey.tickets.first().order
+        url = reverse("station:order-cancel", args=[order.id])
+
+        self.assertWithinQueryBudget(lambda: self.client.post(
+            url, {"tickets": [order.tickets.first().id]}, format="json"))
+        self.assertWithinQueryBudget(lambda: self.client.post(url))
+
+    def test_waitlist_endpoints(self):
+        Journey.objects.update(
+            departure_time=timezone.now() + timedelta(days=1),
+            arrival_time=timezone.now() + timedelta(days=2),
+        )
+        Train.objects.filter(id=self.journey.train_id).update(
+            cargo_num=1, place_in_cargo=3
+        )
+        url = reverse("station:waitlist-list")
+
+        self.assertWithinQueryBudget(lambda: self.client.post(
+            url, {"journey": self.journey.id, "seats": 1}, format="json"))
+        self.assertWithinQueryBudget(lambda: self.client.get(url))
+        entry = WaitlistEntry.objects.get()
+        self.assertWithinQueryBudget(lambda: self.client.delete(
+            reverse("station:waitlist-detail", args=[entry.id])))
+
+    @override_settings(SYNC_SETTLE_SECONDS=0)
+    def test_sync(self):
+        self.assertWithinQueryBudget(lambda: self.client.get(SYNC_URL))
+
+    def test_upload_image_endpoints(self):
+        for url, instance in (
+                (image_crew_upload_url(self.crew[0].id), self.crew[0]),
+                (image_journey_upload_url(self.journey.id), self.journey)):
+            with self.subTest(url=url), \
+                    tempfile.NamedTemporaryFile(suffix=".jpg") as ntf:
+                Image.new("RGB", (10, 10)).save(ntf, format="JPEG")
+                ntf.seek(0)
+                self.assertWithinQueryBudget(lambda: self.client.post(
+                    url, {"image": ntf}, format="multipart"))
+                instance.refresh_from_db()
+                instance.image.delete()
+
+    def test_middleware_logs_budget_violations(self):
+        url = reverse("station:station-list")
+        with mock.patch.dict(StationViewSet.query_budget, {"list": 1}), \
+                self.assertLogs("train_station_api.query_budget",
+                                "WARNING") as logs:
+            self.client.get(url)
+
+        self.assertIn("StationViewSet.list", logs.output[0])
+        self.assertIn("SELECT", logs.output[0])
+
+
+class MetricsEndpointTests(TestCase):
+    def setUp(self):
+        registry.reset()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "admin@test.com", "password", is_staff=True
+        )
+
+    def test_metrics_require_staff(self):
+        user = get_user_model().objects.create_user("user@test.com",
+                                                    "password")
+        self.client.force_authenticate(user)
+
+        response = self.client.get(METRICS_URL)
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_request_histograms_exposed(self):
+        self.client.force_authenticate(self.user)
+        sample_station()
+        self.client.get(reverse("station:station-list"))
+
+        response = self.client.get(METRICS_URL)
+        body = response.content.decode()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("# TYPE http_request_duration_seconds histogram", body)
+        self.assertIn(
+            'http_request_queries_count{view="station:station-list",'
+            'method="GET"} 1',
+            body,
+        )
+        self.assertIn("http_response_render_seconds_bucket", body)
+
+    def test_series_from_other_workers_merged(self):
+        with tempfile.TemporaryDirectory() as directory, \
+                override_settings(METRICS_DIR=directory):
+            registry.observe("http_request_queries",
+                             (("view", "station:station-list"),), 2)
+            with open(os.path.join(directory, "metrics-1.json"), "w") as f:
+                json.dump([["http_request_queries",
+                            [["view", "station:station-list"]],
+                            [0, 0, 0, 1, 0, 0, 0, 0, 0, 0, 3.0]]], f)
+
+            collected = registry.collect()
+
+        self.assertEqual(
+            collected[("http_request_queries",
+                       (("view", "station:station-list"),))],
+            [0, 0, 1, 1, 0, 0, 0, 0, 0, 0, 5.0],
+        )
+
+    def test_files_of_gone_workers_removed(self):
+        series = [["http_request_queries", [], [1] + [0] * 9 + [0.0]]]
+        with tempfile.TemporaryDirectory() as directory, \
+                override_settings(METRICS_DIR=directory):
+            for pid in (1, 2, 3):
+                with open(os.path.join(directory, f"metrics-{pid}.json"),
+                          "w") as f:
+                    json.dump(series, f)
+            long_ago = time.time() - 2 * 24 * 60 * 60
+            os.utime(os.path.join(directory, "metrics-3.json"),
+                     (long_ago, long_ago))
+
+            with mock.patch("train_station_api.metrics.pid_running",
+                            side_effect=lambda pid: pid != 2):
+                collected = registry.collect()
+            remaining = sorted(os.listdir(directory))
+
+        self.assertEqual(remaining, ["metrics-1.json"])
+        self.assertEqual(collected[("http_request_queries", ())][0], 1)
+
+
+class RequestProfilingTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        settings_override = override_settings(
+            PROFILING_DIR=self.directory.name
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "admin@test.com", "password", is_staff=True
+        )
+        self.client.force_authenticate(self.user)
+
+    def get_token(self):
+        return self.client.post(reverse("profile-token")).data["token"]
+
+    def test_token_requires_staff(self):
+        user = get_user_model().objects.create_user("user@test.com",
+                                                    "password")
+        self.client.force_authenticate(user)
+
+        response = self.client.post(reverse("profile-token"))
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_request_without_token_not_profiled(self):
+        response = self.client.get(reverse("station:station-list"),
+                                   HTTP_X_PROFILE="forged")
+
+        self.assertNotIn("X-Profile-Id", response)
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+    def test_profiled_request_downloadable(self):
+        sample_station()
+        response = self.client.get(reverse("station:station-list"),
+                                   HTTP_X_PROFILE=self.get_token())
+        profile_id = response["X-Profile-Id"]
+        url = reverse("profile", args=[profile_id])
+
+        sql = self.client.get(url, {"output": "sql"})
+        stats = self.client.get(url)
+
+        self.assertEqual(sql.data["status"], 200)
+        self.assertTrue(any("station_station" in query["sql"]
+                            for query in sql.data["queries"]))
+        self.assertEqual(stats.status_code, status.HTTP_200_OK)
+        self.assertIn("attachment", stats["Content-Disposition"])
+        stats.close()
+
+    def test_token_accepted_as_query_parameter(self):
+        response = self.client.get(reverse("station:station-list"),
+                                   {"profile": self.get_token()})
+
+        self.assertIn("X-Profile-Id", response)
+
+    def test_token_profiles_one_request_of_its_user(self):
+        token = self.get_token()
+        url = reverse("station:station-list")
+        other = get_user_model().objects.create_user(
+            "other@test.com", "password", is_staff=True
+        )
+
+        self.client.force_authenticate(other)
+        stolen = self.client.get(url, HTTP_X_PROFILE=token)
+        self.client.force_authenticate(self.user)
+        replayed = self.client.get(url, HTTP_X_PROFILE=token)
+
+        self.assertNotIn("X-Profile-Id", stolen)
+        self.assertNotIn("X-Profile-Id", replayed)
+        self.assertFalse([name for name in os.listdir(self.directory.name)
+                          if not name.endswith(".used")])
+
+    @override_settings(PROFILING_MAX_PROFILES=1)
+    def test_only_newest_profiles_kept(self):
+        url = reverse("station:station-list")
+        first = self.client.get(url, HTTP_X_PROFILE=self.get_token())
+        second = self.client.get(url, HTTP_X_PROFILE=self.get_token())
+
+        self.assertEqual(
+            self.client.get(reverse("profile",
+                                    args=[first["X-Profile-Id"]])).status_code,
+            status.HTTP_404_NOT_FOUND,
+        )
+        self.assertEqual(
+            sorted(name for name in os.listdir(self.directory.name)
+                   if not name.endswith(".used")),
+            [f"{second['X-Profile-Id']}.json",
+             f"{second['X-Profile-Id']}.prof"],
+        )
+
+
+class MemoryProfilingTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            "admin@test.com", "password", is_staff=True
+        )
+        self.journey = sample_journey()
+
+    def test_command_reports_peak_and_sites(self):
+        with tempfile.NamedTemporaryFile(suffix=".json") as output:
+            call_command("memory_profile",
+                         detail_journey_url(self.journey.id),
+                         output=output.name, stdout=StringIO())
+            report = json.load(open(output.name))
+
+        result = report[detail_journey_url(self.journey.id)]
+        self.assertEqual(result["view"], "JourneyViewSet.retrieve")
+        self.assertGreater(result["peak_kb"], 0)
+        self.assertTrue(result["top_sites"])
+
+    @override_settings(MEMORY_PROFILE_SAMPLE_RATE=1)
+    def test_sampled_requests_recorded(self):
+        registry.reset()
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        with self.assertLogs("train_station_api.memory", "INFO") as logs:
+            client.get(detail_journey_url(self.journey.id))
+
+        self.assertIn("JourneyViewSet.retrieve", logs.output[0])
+        self.assertIn(
+            ("http_request_memory_peak_bytes",
+             (("view", "station:journey-detail"), ("method", "GET"))),
+            registry.snapshot(),
+        )
+
+
+class AdmissionControlTests(TestCase):
+    def setUp(self):
+        registry.reset()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "admin@test.com", "password", is_staff=True
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_pool_queues_then_rejects(self):
+        pool = Pool("test", {"concurrency": 1, "queue": 1, "timeout": 5})
+        self.assertTrue(pool.acquire())
+        results = []
+        waiter = threading.Thread(target=lambda: results.append(
+            pool.acquire()
+        ))
+        waiter.start()
+        while not pool.waiting:
+            pass
+
+        self.assertFalse(pool.acquire())
+        pool.release()
+        waiter.join()
+        self.assertEqual(results, [True])
+        self.assertEqual(pool.active, 1)
+
+    def test_pool_wait_times_out(self):
+        pool = Pool("test", {"concurrency": 1, "queue": 1, "timeout": 0.01})
+        pool.acquire()
+
+        self.assertFalse(pool.acquire())
+        self.assertEqual(pool.waiting, 0)
+
+    @override_settings(ADMISSION_POOLS={
+        "booking": {"concurrency": 0, "queue": 0, "timeout": 2},
+    })
+    def test_full_pool_sheds_bookings_only(self):
+        response = self.client.post(reverse("station:order-list"), {})
+
+        self.assertEqual(response.status_code,
+                         status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response["Retry-After"], "2")
+        self.assertEqual(
+            self.client.get(reverse("station:station-list")).status_code,
+            status.HTTP_200_OK,
+        )
+        body = self.client.get(METRICS_URL).content.decode()
+        self.assertIn('admission_rejected_total{pool="booking"} 1', body)
+
+    def test_admitted_booking_releases_slot(self):
+        self.client.post(reverse("station:order-list"), {})
+        self.client.post(reverse("station:order-list"), {})
+
+        body = self.client.get(METRICS_URL).content.decode()
+        self.assertIn('admission_queue_depth_count{pool="booking"} 2', body)
+        self.assertNotIn("admission_rejected_total", body)
+
+
+class CoalescingTests(TestCase):
+    def setUp(self):
+        registry.reset()
+        self.calls = 0
+        self.release = threading.Event()
+
+    def compute(self):
+        self.calls += 1
+        self.release.wait(5)
+        return 200, {"count": self.calls}
+
+    @override_settings(COALESCING_DIR=None)
+    def test_concurrent_calls_share_one_computation(self):
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(
+                coalescing.coalesce("key", self.compute)
+            ))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.05)
+        self.release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, [(200, {"count": 1})] * 4)
+        self.assertEqual(coalescing._flights, {})
+
+    @override_settings(COALESCING_DIR=None)
+    def test_errors_are_not_shared(self):
+        self.release.set()
+        self.assertEqual(coalescing.coalesce("key", lambda: (404, {})),
+                         (404, {}))
+        self.assertEqual(coalescing.coalesce("key", self.compute),
+                         (200, {"count": 1}))
+
+    def test_result_shared_across_processes(self):
+        with tempfile.TemporaryDirectory() as directory, \
+                override_settings(COALESCING_DIR=directory):
+            # Another process holds the lock while it computes the result.
+            coalescing.share_across_processes("key", lambda: (200, {}), "")
+            result_path = next(os.path.join(directory, name)
+                               for name in os.listdir(directory)
+                               if name.endswith(".json"))
+            lock = os.open(result_path.replace(".json", ".lock"), os.O_RDWR)
+            coalescing.fcntl.flock(lock, coalescing.fcntl.LOCK_EX)
+            results = []
+            follower = threading.Thread(target=lambda: results.append(
+                coalescing.share_across_processes("key", self.compute, "")
+            ))
+            follower.start()
+            time.sleep(0.05)
+            coalescing.write_result(result_path, (200, {"shared": True}))
+            os.close(lock)
+            follower.join()
+
+        self.assertEqual(self.calls, 0)
+        self.assertEqual(results, [(200, {"shared": True})])
+
+    def test_idle_files_are_removed(self):
+        with tempfile.TemporaryDirectory() as directory, \
+                override_settings(COALESCING_DIR=directory,
+                                  COALESCING_TIMEOUT=10), \
+                mock.patch.object(coalescing, "_pruned_at", float("-inf")):
+            coalescing.share_across_processes("old", lambda: (200, {}), "")
+            idle = time.time() - 60
+            for name in os.listdir(directory):
+                os.utime(os.path.join(directory, name), (idle, idle))
+            coalescing._pruned_at = float("-inf")
+
+            coalescing.share_across_processes("new", lambda: (200, {}), "")
+
+            new = hashlib.sha256(b"new").hexdigest()
+            self.assertEqual(sorted(os.listdir(directory)),
+                             [f"{new}.json", f"{new}.lock"])
+
+    def test_key_ignores_query_parameter_order(self):
+        factory = APIRequestFactory()
+        view = StationViewSet()
+
+        def key(url):
+            return view.get_coalescing_key(Request(factory.get(url)))
+
+        self.assertEqual(key("/api/station/stations/?a=1&b=2"),
+                         key("/api/station/stations/?b=2&a=1"))
+        self.assertNotEqual(key("/api/station/stations/?a=1"),
+                            key("/api/station/stations/?a=2"))
+
+
+@override_settings(TICKET_SIGNING_KEYS={1: "first-key"})
+class TicketTokenTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.staff = get_user_model().objects.create_user(
+            "admin@test.com", "password", is_staff=True
+        )
+        self.journey = sample_journey()
+        self.order = Order.objects.create(user=self.staff)
+        self.tickets = [
+            Ticket.objects.create(order=self.order, journey=self.journey,
+                                  cargo=1, seat=seat)
+            for seat in (1, 2, 3)
+        ]
+
+    def scan(self, ticket, scanned_at="2025-10-02T13:30:00Z", **extra):
+        return {"token": sign_ticket(ticket), "scanned_at": scanned_at,
+                **extra}
+
+    def test_token_round_trip(self):
+        ticket = self.tickets[1]
+
+        self.assertEqual(verify_ticket_token(sign_ticket(ticket)), {
+            "id": ticket.id, "journey": self.journey.id,
+            "cargo": 1, "seat": 2,
+        })
+
+    def test_tampered_token_rejected(self):
+        token = sign_ticket(self.tickets[0])
+        other = sign_ticket(self.tickets[1])
+
+        for bad in (token[:-2] + other[-2:], token[:20], "not a token!"):
+            with self.subTest(token=bad), \
+                    self.assertRaises(InvalidTicketToken):
+                verify_ticket_token(bad)
+
+    def test_rotated_keys_keep_old_tokens_valid(self):
+        token = sign_ticket(self.tickets[0])
+
+        with override_settings(TICKET_SIGNING_KEYS={1: "first-key",
+                                                    2: "second-key"}):
+            self.assertEqual(verify_ticket_token(token)["id"],
+                             self.tickets[0].id)
+            self.assertNotEqual(sign_ticket(self.tickets[0]), token)
+        with override_settings(TICKET_SIGNING_KEYS={2: "second-key"}), \
+                self.assertRaises(InvalidTicketToken):
+            verify_ticket_token(token)
+
+    def test_signing_requires_a_key(self):
+        with override_settings(TICKET_SIGNING_KEYS={1: None}), \
+                self.assertRaises(ImproperlyConfigured):
+            sign_ticket(self.tickets[0])
+
+    def test_missing_key_fails_the_system_check(self):
+        with override_settings(TICKET_SIGNING_KEYS={1: None}):
+            errors = check_signing_keys(None)
+
+        self.assertEqual([error.id for error in errors], ["station.E001"])
+
+    def test_order_detail_without_a_key_omits_tokens(self):
+        self.client.force_authenticate(self.staff)
+
+        with override_settings(TICKET_SIGNING_KEYS={1: None}), \
+                self.assertLogs("station.serializers", "ERROR"):
+            response = self.client.get(
+                reverse("station:order-detail", args=[self.order.id])
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual({ticket["token"]
+                          for ticket in response.data["tickets"]}, {None})
+
+    def test_order_detail_includes_ticket_tokens(self):
+        self.client.force_authenticate(self.staff)
+
+        response = self.client.get(
+            reverse("station:order-detail", args=[self.order.id])
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [verify_ticket_token(ticket["token"])["seat"]
+             for ticket in response.data["tickets"]],
+            [1, 2, 3],
+        )
+
+    def test_bulk_check_in(self):
+        CheckIn.objects.create(ticket=self.tickets[2],
+                               scanned_at="2025-10-02T13:00:00Z")
+        self.client.force_authenticate(self.staff)
+        scans = [
+            self.scan(self.tickets[0], "2025-10-02T13:31:00Z"),
+            self.scan(self.tickets[0], gate="A1"),
+            self.scan(self.tickets[1]),
+            self.scan(self.tickets[2]),
+            {"token": "forged", "scanned_at": "2025-10-02T13:30:00Z"},
+        ]
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(CHECK_IN_URL, {"scans": scans},
+                                        format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["statuses"], [
+            "duplicate", "boarded", "boarded", "duplicate", "invalid",
+        ])
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(self.tickets[0].check_in.gate, "A1")
+        self.assertEqual(CheckIn.objects.count(), 3)
+
+    def test_scans_with_unconfigured_keys_are_reported_per_scan(self):
+        scans = [self.scan(self.tickets[0])]
+        with override_settings(TICKET_SIGNING_KEYS={2: "second-key"}):
+            scans.append(self.scan(self.tickets[1]))
+        self.client.force_authenticate(self.staff)
+
+        with self.assertLogs("station.tickets", "ERROR"):
+            response = self.client.post(CHECK_IN_URL, {"scans": scans},
+                                        format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["statuses"],
+                         ["boarded", "unverifiable"])
+
+    def test_deleted_ticket_is_unknown(self):
+        scan = self.scan(self.tickets[0])
+        self.tickets[0].delete()
+        self.client.force_authenticate(self.staff)
+
+        response = self.client.post(CHECK_IN_URL, {"scans": [scan]},
+                                    format="json")
+
+        self.assertEqual(response.data["statuses"], ["unknown"])
+
+    def test_check_in_requires_staff(self):
+        user = get_user_model().objects.create_user("user@test.com",
+                                                    "password")
+        self.client.force_authenticate(user)
+
+        response = self.client.post(
+            CHECK_IN_URL, {"scans": [self.scan(self.tickets[0])]},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class ScheduleConflictTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "admin@test.com", "password", is_staff=True
+        )
+        self.client.force_authenticate(self.user)
+        self.crew = [sample_crew(), sample_crew()]
+        self.journey = sample_journey(
+            departure_time="2025-10-02 14:00:00+00:00",
+            arrival_time="2025-10-02 18:00:00+00:00",
+        )
+        self.journey.crew.set([self.crew[0]])
+
+    def journey_data(self, departure, arrival, **extra):
+        return {"route": self.journey.route_id,
+                "train": self.journey.train_id,
+                "departure_time": f"2025-10-02 {departure}:00",
+                "arrival_time": f"2025-10-02 {arrival}:00",
+                "crew": [self.crew[1].id], **extra}
+
+    def test_interval_tree_matches_brute_force(self):
+        generator = random.Random(7)
+        intervals = []
+        for value in range(200):
+            start = generator.randrange(1000)
+            intervals.append((start, start + generator.randrange(1, 50),
+                              value))
+        tree = IntervalTree(intervals)
+
+        for start in range(0, 1000, 37):
+            end = start + 20
+            self.assertEqual(
+                sorted(item[2] for item in tree.overlapping(start, end)),
+                sorted(value for low, high, value in intervals
+                       if low < end and high > start),
+            )
+
+    def test_overlapping_train_rejected(self):
+        response = self.client.post(
+            JOURNEY_URL, self.journey_data("17:00", "20:00"), format="json"
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("train", response.data)
+
+    def test_overlapping_crew_rejected(self):
+        data = self.journey_data("15:00", "16:00", crew=[self.crew[0].id],
+                                 train=sample_train(name="Other").id)
+
+        response = self.client.post(JOURNEY_URL, data, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("crew", response.data)
+
+    def test_journey_saved_concurrently_is_a_validation_error(self):
+        # Another writer commits an overlapping journey of the train after
+        # the check, so the exclusion constraint rejects ours.
+        checks = [[]]
+        other = Journey.objects.create(
+            route=self.journey.route, train=self.journey.train,
+            departure_time="2025-10-02 19:00:00+00:00",
+            arrival_time="2025-10-02 21:00:00+00:00",
+        )
+        error = IntegrityError('conflicting key value violates exclusion '
+                               'constraint "journey_train_no_overlap"')
+
+        with mock.patch("station.serializers.find_conflicts",
+                        side_effect=lambda journeys: checks.pop()
+                        if checks else find_conflicts(journeys)), \
+                mock.patch("rest_framework.serializers.ModelSerializer"
+                           ".create", side_effect=error):
+            response = self.client.post(
+                JOURNEY_URL, self.journey_data("18:00", "20:00"),
+                format="json",
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data["train"], [
+            f"The train is already scheduled for journey {other.id} at "
+            f"that time."
+        ])
+
+    def test_back_to_back_and_own_update_allowed(self):
+        response = self.client.post(
+            JOURNEY_URL, self.journey_data("18:00", "20:00"), format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        response = self.client.put(
+            detail_journey_url(self.journey.id),
+            self.journey_data("13:00", "17:00", crew=[self.crew[0].id]),
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_conflict_report(self):
+        other = Journey.objects.create(
+            route=self.journey.route, train=sample_train(name="Other"),
+            departure_time="2025-10-02 17:00:00+00:00",
+            arrival_time="2025-10-02 19:00:00+00:00",
+        )
+        other.crew.set(self.crew)
+        overlapping = Journey.objects.create(
+            route=self.journey.route, train=self.journey.train,
+            departure_time="2025-10-02 16:00:00+00:00",
+            arrival_time="2025-10-02 17:00:00+00:00",
+        )
+        url = reverse("station:journey-conflicts")
+
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertCountEqual(response.data, [
+            {"kind": "train", "resource": self.journey.train_id,
+             "journeys": [self.journey.id, overlapping.id]},
+            {"kind": "crew", "resource": self.crew[0].id,
+             "journeys": [self.journey.id, other.id]},
+        ])
+        self.assertEqual(
+            self.client.get(url, {"from": "2025-10-03"}).data, []
+        )
+
+    def test_import_journeys(self):
+        rows = [
+            {"route": self.journey.route_id, "train": self.journey.train_id,
+             "departure_time": f"2025-10-0{day}T10:00:00+00:00",
+             "arrival_time": f"2025-10-0{day}T12:00:00+00:00",
+             "crew": [self.crew[1].id]}
+            for day in (3, 4)
+        ]
+        with tempfile.NamedTemporaryFile("w", suffix=".json") as source:
+            json.dump(rows + [{**rows[0], "crew": [self.crew[0].id]}], source)
+            source.flush()
+            with self.assertRaises(CommandError):
+                call_command("import_journeys", source.name,
+                             stderr=StringIO())
+
+            source.seek(0)
+            source.truncate()
+            json.dump(rows, source)
+            source.flush()
+            call_command("import_journeys", source.name, stdout=StringIO())
+
+        self.assertEqual(self.crew[1].journey_set.count(), 2)
+
+
+class CrewRosterTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "user@test.com", "password"
+        )
+        self.client.force_authenticate(self.user)
+        self.crew = [sample_crew(), sample_crew(first_name="Idle")]
+        journey = sample_journey()
+        self.journeys = [
+            Journey.objects.create(
+                route=journey.route, train=journey.train,
+                departure_time=f"2025-09-{day:02d} 08:00:00+00:00",
+                arrival_time=f"2025-09-{day:02d} 10:00:00+00:00",
+            )
+            for day in (9, 2, 20)
+        ]
+        for journey in self.journeys:
+            journey.crew.set([self.crew[0]])
+
+    def test_roster_in_window(self):
+        url = reverse("station:crew-roster", args=[self.crew[0].id])
+
+        response = self.client.get(url, {"from": "2025-09-01",
+                                         "to": "2025-09-10"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["id"], self.crew[0].id)
+        self.assertEqual(
+            [journey["id"] for journey in response.data["journeys"]],
+            [self.journeys[1].id, self.journeys[0].id],
+        )
+        self.assertEqual(response.data["journeys"][0]["route"],
+                         self.journeys[1].route.name)
+
+    def test_default_window_starts_today(self):
+        url = reverse("station:crew-roster", args=[self.crew[0].id])
+
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["journeys"], [])
+
+    def test_invalid_window_rejected(self):
+        url = reverse("station:crew-roster", args=[self.crew[0].id])
+
+        for params in ({"from": "tomorrow"},
+                       {"from": "2025-09-10", "to": "2025-09-01"},
+                       {"from": "2025-01-01", "to": "2025-12-31"}):
+            with self.subTest(params=params):
+                response = self.client.get(url, params)
+                self.assertEqual(response.status_code,
+                                 status.HTTP_400_BAD_REQUEST)
+
+    def test_roster_export(self):
+        url = reverse("station:crew-roster-export")
+        params = {"from": "2025-09-05", "to": "2025-09-25"}
+        self.assertEqual(self.client.get(url, params).status_code,
+                         status.HTTP_403_FORBIDDEN)
+        self.user.is_staff = True
+        self.user.save()
+
+        response = self.client.get(url, params)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(crew["id"], [journey["id"] for journey in crew["journeys"]])
+             for crew in response.data],
+            [(self.crew[0].id, [self.journeys[0].id, self.journeys[2].id]),
+             (self.crew[1].id, [])],
+        )
+
+
+class DepartureBoardTests(TestCase):
+    def setUp(self):
+        self.addCleanup(boards.clear)
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "user@test.com", "password"
+        )
+        self.client.force_authenticate(self.user)
+        now = timezone.now()
+        self.journey = sample_journey(
+            departure_time=now + timedelta(hours=1),
+            arrival_time=now + timedelta(hours=3),
+        )
+        self.station = self.journey.route.source
+        self.later = Journey.objects.create(
+            route=self.journey.route, train=self.journey.train,
+            departure_time=now + timedelta(hours=4),
+            arrival_time=now + timedelta(hours=6),
+        )
+        Journey.objects.create(
+            route=self.journey.route, train=self.journey.train,
+            departure_time=now - timedelta(hours=3),
+            arrival_time=now - timedelta(hours=2),
+        )
+        self.url = reverse("station:station-board", args=[self.station.id])
+
+    def test_board_lists_upcoming_journeys(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [journey["id"] for journey in response.data["departures"]],
+            [self.journey.id, self.later.id],
+        )
+        self.assertEqual(response.data["arrivals"], [])
+        self.assertEqual(response.data["departures"][0]["tickets_available"],
+                         100)
+
+    def test_writes_update_loaded_board(self):
+        self.client.get(self.url)
+        order = Order.objects.create(user=self.user)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Ticket.objects.create(order=order, journey=self.later,
+                                  cargo=1, seat=1)
+            self.journey.departure_time += timedelta(hours=4)
+            self.journey.arrival_time += timedelta(hours=4)
+            self.journey.save()
+        broker.transport.flush()
+
+        with self.assertNumQueries(0):
+            snapshot = boards.snapshot(self.station.id)
+        self.assertEqual(
+            [(journey["id"], journey["tickets_available"])
+             for journey in snapshot["departures"]],
+            [(self.later.id, 99), (self.journey.id, 100)],
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.later.delete()
+        broker.transport.flush()
+        self.assertEqual(
+            [journey["id"]
+             for journey in boards.snapshot(self.station.id)["departures"]],
+            [self.journey.id],
+        )
+
+    def test_stream_sends_snapshot_then_changes(self):
+        boards.snapshot(self.station.id)
+
+        async def listen():
+            stream = event_stream(board_topic(self.station.id),
+                                  self.async_snapshot)
+            events = [await anext(stream)]
+            # Tickets commit in request threads, which then publish.
+            await asyncio.to_thread(broker.publish,
+                                    seats_topic(self.journey.id),
+                                    ("taken", {"seats": [[1, 1]]}))
+            events.append(await anext(stream))
+            await stream.aclose()
+            return events
+
+        snapshot, seats = asyncio.run(listen())
+
+        self.assertTrue(snapshot.startswith("event: snapshot\n"))
+        self.assertEqual(
+            seats,
+            f'event: seats\ndata: {{"id": {self.journey.id}, '
+            f'"tickets_available": 99}}\n\n',
+        )
+        self.assertFalse(broker.has_subscribers(
+            board_topic(self.station.id)
+        ))
+
+    def test_events_of_other_processes_update_loaded_board(self):
+        boards.snapshot(self.station.id)
+        moved = self.journey.departure_time + timedelta(hours=4)
+
+        # The transport hands over events other workers published.
+        broker.deliver(JOURNEYS_TOPIC, ("journey", {
+            "id": self.journey.id,
+            "entry": {"id": self.journey.id, "route": "Moved",
+                      "train": "Train", "departure_time": moved.isoformat(),
+                      "arrival_time": (moved + timedelta(hours=2))
+                      .isoformat(), "tickets_available": 100},
+            "stations": [self.station.id, self.journey.route.destination_id],
+        }))
+        broker.deliver(seats_topic(self.later.id),
+                       ("taken", {"seats": [[1, 1], [1, 2]]}))
+
+        with self.assertNumQueries(0):
+            snapshot = boards.snapshot(self.station.id)
+        self.assertEqual(
+            [(journey["id"], journey["route"], journey["tickets_available"])
+             for journey in snapshot["departures"]],
+            [(self.later.id, self.journey.route.name, 98),
+             (self.journey.id, "Moved", 100)],
+        )
+
+    async def async_snapshot(self):
+        return {"departures": []}
+
+
+class SeatStreamTests(TestCase):
+    def setUp(self):
+        self.addCleanup(seat_maps.clear)
+        self.user = get_user_model().objects.create_user(
+            "user@test.com", "password"
+        )
+        self.journey = sample_journey()
+        self.order = Order.objects.create(user=self.user)
+        Ticket.objects.create(order=self.order, journey=self.journey,
+                              cargo=1, seat=1)
+
+    def test_seat_map_follows_bookings(self):
+        seat_maps.get(self.journey.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ticket = Ticket.objects.create(order=self.order,
+                                           journey=self.journey,
+                                           cargo=2, seat=5)
+        broker.transport.flush()
+        with self.assertNumQueries(0):
+            self.assertEqual(seat_maps.snapshot(self.journey.id), {
+                "cargo_num": 10, "places_in_cargo": 10,
+                "taken": [(1, 1), (2, 5)],
+            })
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ticket.delete()
+        broker.transport.flush()
+        self.assertEqual(seat_maps.snapshot(self.journey.id)["taken"],
+                         [(1, 1)])
+
+    def test_stream_sends_snapshot_then_deltas(self):
+        seat_maps.get(self.journey.id)
+        topic = seats_topic(self.journey.id)
+
+        async def snapshot():
+            return seat_maps.snapshot(self.journey.id)
+
+        async def listen():
+            stream = event_stream(topic, snapshot)
+            events = [await anext(stream)]
+            await asyncio.to_thread(broker.publish, topic,
+                                    ("released", {"seats": [[1, 1]]}))
+            events.append(await anext(stream))
+            await stream.aclose()
+            return events
+
+        events = asyncio.run(listen())
+
+        self.assertEqual(events, [
+            'event: snapshot\ndata: {"cargo_num": 10, "places_in_cargo": 10, '
+            '"taken": [[1, 1]]}\n\n',
+            'event: released\ndata: {"seats": [[1, 1]]}\n\n',
+        ])
+
+    def test_unknown_journey_not_found(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        response = client.get(
+            reverse("station:journey-seats-stream", args=[self.journey.id + 1])
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class OrderCancellationTests(TestCase):
+    def setUp(self):
+        self.addCleanup(seat_maps.clear)
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "user@test.com", "password"
+        )
+        self.client.force_authenticate(self.user)
+        now = timezone.now()
+        self.journey = sample_journey(
+            departure_time=now + timedelta(days=1),
+            arrival_time=now + timedelta(days=1, hours=2),
+        )
+        self.order = self.book(3)
+
+    def book(self, count):
+        order = Order.objects.create(user=self.user)
+        start = self.journey.tickets.count()
+        for index in range(start, start + count):
+            Ticket.objects.create(order=order, journey=self.journey,
+                                  cargo=index // 10 + 1,
+                                  seat=index % 10 + 1)
+        return order
+
+    def cancel(self, order, **data):
+        return self.client.post(
+            reverse("station:order-cancel", args=[order.id]), data,
+            format="json",
+        )
+
+    def test_partial_cancellation_releases_seats(self):
+        seat_maps.get(self.journey.id)
+        tickets = list(self.order.tickets.all())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.cancel(self.order, tickets=[tickets[0].id])
+        broker.transport.flush()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {"cancelled": [tickets[0].id],
+                                         "remaining": 2})
+        self.assertEqual(self.order.tickets.count(), 2)
+        self.assertEqual(seat_maps.snapshot(self.journey.id)["taken"],
+                         [(1, 2), (1, 3)])
+
+    def test_full_cancellation_deletes_order(self):
+        response = self.cancel(self.order)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["remaining"], 0)
+        self.assertFalse(Order.objects.filter(id=self.order.id).exists())
+        self.assertFalse(self.journey.tickets.exists())
+
+    def test_cancellation_is_set_based(self):
+        def queries(order):
+            with CaptureQueriesContext(connection) as captured:
+                self.assertEqual(self.cancel(order).status_code,
+                                 status.HTTP_200_OK)
+            return len(captured)
+
+        self.assertEqual(queries(self.book(50)), queries(self.order))
+
+    def test_invalid_tickets_rejected(self):
+        ticket = self.order.tickets.first()
+        CheckIn.objects.create(ticket=ticket, scanned_at=timezone.now())
+        other = self.book(1).tickets.get()
+
+        response = self.cancel(self.order, tickets=[ticket.id, other.id])
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(response.data["tickets"]), 2)
+        self.assertEqual(Ticket.objects.count(), 4)
+
+    def test_departed_journey_rejected(self):
+        Journey.objects.filter(id=self.journey.id).update(
+            departure_time=timezone.now() - timedelta(hours=1)
+        )
+
+        response = self.cancel(self.order)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_other_users_order_not_found(self):
+        self.client.force_authenticate(get_user_model().objects.create_user(
+            "other@test.com", "password"
+        ))
+
+        response = self.cancel(self.order)
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@override_settings(WAITLIST_WORKERS=0)
+class WaitlistTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.users = [
+            get_user_model().objects.create_user(f"user{index}@test.com",
+                                                 "password")
+            for index in range(3)
+        ]
+        self.client.force_authenticate(self.users[1])
+        now = timezone.now()
+        self.journey = sample_journey(
+            train=sample_train(name="Small", cargo_num=2, place_in_cargo=1),
+            departure_time=now + timedelta(days=1),
+            arrival_time=now + timedelta(days=1, hours=2),
+        )
+        self.order = Order.objects.create(user=self.users[0])
+        for cargo in (1, 2):
+            Ticket.objects.create(order=self.order, journey=self.journey,
+                                  cargo=cargo, seat=1)
+
+    def join(self, seats=1):
+        return self.client.post(reverse("station:waitlist-list"),
+                                {"journey": self.journey.id, "seats": seats},
+                                format="json")
+
+    def cancel(self, ticket):
+        self.client.force_authenticate(self.users[0])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse("station:order-cancel", args=[self.order.id]),
+                {"tickets": [ticket.id]}, format="json",
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_join_only_when_sold_out(self):
+        self.assertEqual(self.join().status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.join().status_code,
+                         status.HTTP_400_BAD_REQUEST)
+
+        self.order.tickets.first().delete()
+        self.client.force_authenticate(self.users[2])
+        self.assertEqual(self.join().status_code,
+                         status.HTTP_400_BAD_REQUEST)
+
+    def test_cancellation_promotes_in_order(self):
+        self.join(seats=2)
+        self.client.force_authenticate(self.users[2])
+        self.join()
+        tickets = list(self.order.tickets.all())
+
+        self.cancel(tickets[0])
+        # The first user needs two seats, so nobody skips ahead.
+        self.assertFalse(WaitlistEntry.objects.filter(
+            promoted_at__isnull=False).exists())
+
+        self.cancel(tickets[1])
+        first, second = WaitlistEntry.objects.all()
+        self.assertIsNotNone(first.promoted_at)
+        self.assertEqual(
+            list(first.order.tickets.values_list("cargo", "seat")),
+            [(1, 1), (2, 1)],
+        )
+        self.assertEqual(first.order.user, self.users[1])
+        self.assertIsNone(second.promoted_at)
+
+    def test_failed_background_promotion_is_logged(self):
+        future = Future()
+        future.set_exception(IntegrityError("seat taken"))
+
+        with self.assertLogs("station.waitlist", "ERROR") as logs:
+            waitlist.log_failure([self.journey.id], future)
+
+        self.assertIn("seat taken", logs.output[0])
+
+    @override_settings(WAITLIST_BATCH_SIZE=4)
+    def test_promotion_in_batches(self):
+        Train.objects.filter(id=self.journey.train_id).update(cargo_num=10)
+        users = [
+            get_user_model().objects.create_user(f"wait{index}@test.com",
+                                                 "password")
+            for index in range(12)
+        ]
+        WaitlistEntry.objects.bulk_create(
+            WaitlistEntry(journey=self.journey, user=user, seats=1)
+            for user in users
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(promote_waitlist(self.journey.id), 8)
+
+        self.assertEqual(
+            list(WaitlistEntry.objects.filter(
+                promoted_at__isnull=False
+            ).values_list("user", flat=True)),
+            [user.id for user in users[:8]],
+        )
+        self.assertEqual(self.journey.tickets.count(), 10)
+
+    def test_leave_waitlist(self):
+        entry_id = self.join().data["id"]
+
+        response = self.client.delete(
+            reverse("station:waitlist-detail", args=[entry_id])
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(WaitlistEntry.objects.exists())
+
+
+class FareTests(TestCase):
+    def setUp(self):
+        fare_tables.invalidate()
+        self.addCleanup(fare_tables.invalidate)
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "user@test.com", "password"
+        )
+        self.client.force_authenticate(self.user)
+        Tariff.objects.create(from_km=0, price_per_km="0.50")
+        Tariff.objects.create(from_km=100, price_per_km="0.30")
+        OccupancySurcharge.objects.create(min_occupancy=50, surcharge=10)
+        OccupancySurcharge.objects.create(min_occupancy=90, surcharge=25)
+        now = timezone.now()
+        self.journey = sample_journey(
+            departure_time=now + timedelta(days=1),
+            arrival_time=now + timedelta(days=1, hours=2),
+        )
+        TrainType.objects.update(fare_multiplier="1.50")
+
+    def test_fare_table(self):
+        table = FareTable([(0, Decimal("0.50")), (100, Decimal("0.30"))],
+                          [(50, 10), (90, 25)])
+
+        self.assertEqual(table.distance_fares([0, 40, 100, 200]),
+                         [0, 2000, 5000, 8000])
+        self.assertEqual(
+            table.prices([200, 200, 200, 40], [Decimal("1.50")] * 3
+                         + [Decimal("1.00")], [0, 50, 100, 0],
+                         [100, 100, 100, 100]),
+            [Decimal("120.00"), Decimal("132.00"), Decimal("150.00"),
+             Decimal("20.00")],
+        )
+
+    def test_journey_list_and_quote_prices(self):
+        response = self.client.get(JOURNEY_URL)
+        self.assertEqual(response.data["results"][0]["price"], "120.00")
+
+        response = self.client.post(
+            reverse("station:journey-quote"),
+            {"journeys": [self.journey.id + 1, self.journey.id]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, [{"journey": self.journey.id,
+                                          "price": "120.00",
+                                          "tickets_available": 100}])
+
+    def test_booking_snapshots_price(self):
+        response = self.client.post(
+            reverse("station:order-list"),
+            {"tickets": [{"journey": self.journey.id, "cargo": 1, "seat": 1},
+                         {"journey": self.journey.id, "cargo": 1, "seat": 2}]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["total"], "240.00")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Tariff.objects.filter(from_km=100).update(price_per_km="1.00")
+            Tariff.objects.get(from_km=0).save()
+
+        self.assertEqual(
+            self.client.get(JOURNEY_URL).data["results"][0]["price"],
+            "225.00",
+        )
+        self.assertEqual(
+            list(Ticket.objects.values_list("price", flat=True)),
+            [Decimal("120.00")] * 2,
+        )
+
+
+class BatchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "user@test.com", "password"
+        )
+        token = UserTokenObtainPairSerializer.get_token(self.user)
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {token.access_token}"
+        )
+        self.station = sample_station()
+        Order.objects.create(user=self.user)
+
+    def batch(self, *requests, **params):
+        return self.client.post(BATCH_URL, {"requests": list(requests),
+                                            **params}, format="json")
+
+    def test_batch_runs_reads_as_the_user(self):
+        station_url = reverse("station:station-detail",
+                              args=[self.station.id])
+        with mock.patch("train_station_api.batch.resolve",
+                        wraps=resolve) as resolver, \
+                mock.patch.object(BatchAuthentication, "authenticate",
+                                  wraps=BatchAuthentication().authenticate
+                                  ) as authenticate:
+            response = self.batch(
+                {"path": reverse("station:order-list")},
+                {"path": station_url},
+                {"path": reverse("station:station-list"),
+                 "query": {"name": "K_"}},
+                {"path": station_url},
+                {"path": "/api/station/missing/"},
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        responses = response.data["responses"]
+        self.assertEqual([item["status"] for item in responses],
+                         [200, 200, 200, 200, 404])
+        self.assertEqual(responses[0]["body"],
+                         self.client.get(reverse("station:order-list")).data)
+        self.assertEqual(responses[1]["body"]["name"], "K_Test")
+        self.assertEqual(responses[1], responses[3])
+        # The repeated read ran once.
+        self.assertEqual(resolver.call_count, 4)
+        self.assertTrue(authenticate.called)
+
+    def test_only_reads_of_the_api_can_be_batched(self):
+        orders = reverse("station:order-list")
+        self.assertEqual(self.batch({"path": "/admin/"}).status_code, 400)
+        self.assertEqual(
+            self.batch({"path": orders, "method": "POST"}).status_code, 400
+        )
+        self.assertEqual(self.batch(*[{"path": orders}] * 21).status_code,
+                         400)
+        stream = reverse("station:station-board-stream",
+                         args=[self.station.id])
+        self.assertEqual(
+            self.batch({"path": stream}).data["responses"][0]["status"], 400
+        )
+
+        self.client.credentials()
+        self.assertEqual(self.batch({"path": orders}).status_code, 401)
+
+    @mock.patch.dict(BucketRateThrottle.THROTTLE_RATES, {"user": "3/hour"})
+    def test_each_sub_request_is_throttled(self):
+        stations = {"path": reverse("station:station-list")}
+
+        self.assertEqual(self.batch(stations, stations).status_code, 200)
+        self.assertEqual(self.batch(stations, stations).status_code, 429)
+        self.assertEqual(self.batch(stations).status_code, 200)
+
+    @mock.patch.dict(BucketRateThrottle.THROTTLE_RATES, {"user": "30/hour"})
+    def test_oversized_batch_costs_at_most_the_limit(self):
+        stations = {"path": reverse("station:station-list")}
+
+        self.assertEqual(self.batch(*[stations] * 25).status_code, 400)
+        self.assertEqual(self.batch(*[stations] * 10).status_code, 200)
+
+    @override_settings(BATCH_WORKERS=2)
+    def test_parallel_batch(self):
+        # Worker threads have their own connections, which cannot see the
+        # test's transaction, so the pool runs inline here.
+        with mock.patch("train_station_api.batch.get_executor") as executor:
+            executor.return_value.map = map
+            response = self.batch({"path": reverse("station:station-list")},
+                                  {"path": reverse("station:route-list")},
+                                  parallel=True)
+
+        executor.assert_called_once()
+        self.assertEqual([item["status"]
+                          for item in response.data["responses"]],
+                         [200, 200])
+
+
+@override_settings(SYNC_SETTLE_SECONDS=0)
+class SyncTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "user@test.com", "password"
+        )
+        self.client.force_authenticate(self.user)
+        self.journey = sample_journey()
+
+    def sync(self, since=None):
+        response = self.client.get(SYNC_URL, {} if since is None
+                                   else {"since": since})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_first_sync_returns_every_row(self):
+        data = self.sync()
+
+        self.assertFalse(data["more"])
+        self.assertEqual(
+            {table: [row["id"] for row in rows]
+             for table, rows in data["changes"].items()},
+            {"stations": [self.journey.route.source_id,
+                          self.journey.route.destination_id],
+             "trains": [self.journey.train_id],
+             "routes": [self.journey.route_id],
+             "journeys": [self.journey.id]},
+        )
+        self.assertEqual(data["changes"]["journeys"][0]["route"],
+                         self.journey.route_id)
+        self.assertEqual(data["deleted"], {})
+
+    def test_sync_returns_only_changes_since_the_token(self):
+        token = self.sync()["token"]
+        source = self.journey.route.source
+        source.name = "Renamed"
+        source.save()
+        source.save()
+        new_station = sample_station()
+        journey_id = self.journey.id
+        self.journey.delete()
+
+        data = self.sync(token)
+
+        self.assertEqual(list(data["changes"]), ["stations"])
+        self.assertEqual(
+            [(row["id"], row["name"]) for row in data["changes"]["stations"]],
+            [(source.id, "Renamed"), (new_station.id, "K_Test")],
+        )
+        self.assertEqual(data["deleted"], {"journeys": [journey_id]})
+        self.assertEqual(
+            self.sync(data["token"]),
+            {"token": data["token"], "more": False, "changes": {},
+             "deleted": {}},
+        )
+
+    @override_settings(SYNC_PAGE_SIZE=2)
+    def test_sync_is_paginated_by_change(self):
+        pages, token, more = [], None, True
+        while more:
+            data = self.sync(token)
+            token, more = data["token"], data["more"]
+            pages.append(sorted(data["changes"]))
+
+        self.assertEqual(pages, [["stations"], ["routes", "trains"],
+                                 ["journeys"]])
+
+    def test_compaction_keeps_the_latest_change_of_each_row(self):
+        token = self.sync()["token"]
+        self.journey.route.source.save()
+        self.journey.route.source.save()
+        self.journey.delete()
+        expected = self.sync(token)
+        before = self.sync()
+
+        out = StringIO()
+        call_command("compact_sync_changes", stdout=out)
+
+        self.assertIn("Dropped 3 superseded", out.getvalue())
+        self.assertEqual(self.sync(token)["changes"], expected["changes"])
+        self.assertEqual(self.sync(token)["deleted"], expected["deleted"])
+        self.assertEqual(self.sync()["deleted"], before["deleted"])
+
+    @override_settings(SYNC_SETTLE_SECONDS=60)
+    def test_recent_changes_wait_to_settle(self):
+        self.assertEqual(self.sync()["token"], "0")
+        SyncChange.objects.update(
+            created_at=timezone.now() - timedelta(minutes=2)
+        )
+        self.assertEqual(len(self.sync()["changes"]), 4)
+
+    def test_invalid_token_and_anonymous_requests(self):
+        self.assertEqual(self.client.get(SYNC_URL, {"since": "x"}).status_code,
+                         status.HTTP_400_BAD_REQUEST)
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(SYNC_URL).status_code,
+                         status.HTTP_401_UNAUTHORIZED)
+
+
+class SchemaTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        overrides = override_settings(SCHEMA_DIR=self.directory,
+                                      CODE_VERSION="v1")
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        schema_documents.clear()
+        self.addCleanup(schema_documents.clear)
+        self.client = APIClient()
+
+    def test_schema_is_built_once_and_served_with_an_etag(self):
+        generator = "drf_spectacular.generators.SchemaGenerator.get_schema"
+        with mock.patch(generator, autospec=True,
+                        side_effect=lambda *args, **kwargs: {
+                            "openapi": "3.0.3", "paths": {}}) as get_schema:
+            response = self.client.get(SCHEMA_URL)
+            json_response = self.client.get(SCHEMA_URL, {"format": "json"})
+            cached = self.client.get(SCHEMA_URL,
+                                     HTTP_IF_NONE_MATCH=response["ETag"])
+
+        self.assertEqual(get_schema.call_count, 1)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"],
+                         "application/vnd.oai.openapi")
+        self.assertIn("max-age=86400", response["Cache-Control"])
+        self.assertEqual(json.loads(json_response.content)["openapi"],
+                         "3.0.3")
+        self.assertNotEqual(json_response["ETag"], response["ETag"])
+        self.assertEqual(cached.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         ["schema-v1.json", "schema-v1.yaml"])
+
+    def test_jwt_authentication_is_documented(self):
+        response = self.client.get(SCHEMA_URL, {"format": "json"})
+
+        schema = json.loads(response.content)
+        self.assertEqual(schema["components"]["securitySchemes"]["jwtAuth"],
+                         {"type": "http", "scheme": "bearer",
+                          "bearerFormat": "JWT"})
+        self.assertIn({"jwtAuth": []}, schema["paths"][
+            "/api/station/journeys/"]["get"]["security"])
+
+    def test_built_schema_is_reused_until_the_code_version_changes(self):
+        out = StringIO()
+        call_command("build_schema", stdout=out)
+        self.assertIn("version v1", out.getvalue())
+        schema_documents.clear()
+
+        generator = "drf_spectacular.generators.SchemaGenerator.get_schema"
+        with mock.patch(generator) as get_schema:
+            response = self.client.get(SCHEMA_URL,
+                                       HTTP_ACCEPT="application/json")
+        get_schema.assert_not_called()
+        self.assertIn("/api/station/sync/",
+                      json.loads(response.content)["paths"])
+
+        with override_settings(CODE_VERSION="v2"):
+            response = self.client.get(SCHEMA_URL)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         ["schema-v2.json", "schema-v2.yaml"])
+
+
 class UnauthenticatedJourneyApiTest(TestCase):
     def setUp(self):
         self.client = APIClient()
@@ -345,8 +2284,11 @@ class AuthenticatedJourneyApiTest(TestCase):
         serializer_3 = JourneyListSerializer(journey3)
 
         response_by_route.data.get("results")[0].pop("tickets_available", None)
+        response_by_route.data.get("results")[0].pop("price", None)
         response_by_date.data.get("results")[0].pop("tickets_available", None)
+        response_by_date.data.get("results")[0].pop("price", None)
         response_by_train.data.get("results")[0].pop("tickets_available", None)
+        response_by_train.data.get("results")[0].pop("price", None)
 
         self.assertEqual(response_by_route.status_code,
                          status.HTTP_200_OK)
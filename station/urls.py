@@ -10,6 +10,9 @@ from station.views import (
     RouteViewSet,
     JourneyViewSet,
     OrderViewSet,
+    CheckInViewSet,
+    WaitlistViewSet,
+    SyncViewSet,
 )
 
 app_name = "station"
@@ -22,5 +25,8 @@ router.register("stations", StationViewSet)
 router.register("routes", RouteViewSet)
 router.register("journeys", JourneyViewSet)
 router.register("orders", OrderViewSet)
+router.register("check-ins", CheckInViewSet, basename="check-in")
+router.register("waitlist", WaitlistViewSet, basename="waitlist")
+router.register("sync", SyncViewSet, basename="sync")
 
 urlpatterns = [path("", include(router.urls))]
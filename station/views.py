@@ -1,21 +1,32 @@
-from datetime import datetime
-
-from django.db.models import F, Count
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import F, Count, Prefetch
+from django.http import Http404
+from django.utils import timezone
 from drf_spectacular.utils import extend_schema, OpenApiParameter
 from rest_framework import viewsets, status, mixins
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet
 
+from station.board import boards, board_topic
+from station.fares import fare_tables
+from station.images import schedule_image_variants
 from station.models import (TrainType,
                             Train,
                             Crew,
                             Station,
                             Route,
                             Journey,
-                            Order)
+                            Order,
+                            Ticket,
+                            WaitlistEntry)
 from station.permissions import IsAdminOrIfAuthenticatedReadOnly
 from station.serializers import (
     TrainTypeSerializer,
@@ -33,7 +44,22 @@ from station.serializers import (
     TrainListSerializer,
     CrewImageSerializer,
     JourneyImageSerializer, CrewListSerializer, CrewDetailSerializer,
+    CheckInBatchSerializer,
+    CrewRosterSerializer,
+    OrderCancelSerializer,
+    WaitlistEntrySerializer,
+    JourneyQuoteSerializer,
+    SyncSerializer,
 )
+from station.scheduling import load_schedules, overlapping_pairs
+from station.seats import seat_maps, seats_topic
+from station.sync import changes_since
+from station.tickets import record_check_ins
+from train_station_api.coalescing import CoalescingListMixin
+from train_station_api.events import event_stream_response
+
+ROSTER_DEFAULT_DAYS = 7
+ROSTER_MAX_DAYS = 92
 
 
 class TrainTypeViewSet(mixins.CreateModelMixin,
@@ -42,6 +68,7 @@ class TrainTypeViewSet(mixins.CreateModelMixin,
     queryset = TrainType.objects.all()
     serializer_class = TrainTypeSerializer
     permission_classes = (IsAdminOrIfAuthenticatedReadOnly,)
+    query_budget = {"list": 3, "create": 2}
 
 
 class TrainViewSet(mixins.ListModelMixin,
@@ -50,6 +77,7 @@ class TrainViewSet(mixins.ListModelMixin,
                    viewsets.GenericViewSet,):
     queryset = Train.objects.select_related("train_type")
     permission_classes = (IsAuthenticated,)
+    query_budget = {"list": 3, "retrieve": 2, "create": 5}
 
     def get_serializer_class(self):
         if self.action in ("list", "retrieve"):
@@ -57,12 +85,67 @@ class TrainViewSet(mixins.ListModelMixin,
         return TrainSerializer
 
 
+def parse_date_param(request, param):
+    """Start of the ``YYYY-MM-DD`` date in query parameter ``param``."""
+    value = request.query_params.get(param)
+    if not value:
+        return None
+    try:
+        return timezone.make_aware(datetime.strptime(value, "%Y-%m-%d"))
+    except ValueError:
+        raise ValidationError({param: "Use the YYYY-MM-DD format."})
+
+
+def roster_window(request):
+    """``[from, to)`` from the query, a week from today by default."""
+    start = parse_date_param(request, "from") or timezone.make_aware(
+        datetime.combine(timezone.localdate(), datetime.min.time())
+    )
+    end = parse_date_param(request, "to") or start + timedelta(
+        days=ROSTER_DEFAULT_DAYS
+    )
+    if end <= start:
+        raise ValidationError({"to": "Must be later than from."})
+    if end - start > timedelta(days=ROSTER_MAX_DAYS):
+        raise ValidationError(
+            {"to": f"Rosters span at most {ROSTER_MAX_DAYS} days."}
+        )
+    return start, end
+
+
+ROSTER_PARAMETERS = [
+    OpenApiParameter(
+        "from",
+        type=datetime,
+        description="Only journeys departing on or after this date "
+                    "(YYYY-MM-DD), today by default",
+        location=OpenApiParameter.QUERY,
+    ),
+    OpenApiParameter(
+        "to",
+        type=datetime,
+        description="Only journeys departing before this date "
+                    f"(YYYY-MM-DD), {ROSTER_DEFAULT_DAYS} days after from "
+                    f"by default, at most {ROSTER_MAX_DAYS} days after it",
+        location=OpenApiParameter.QUERY,
+    ),
+]
+
+
 class CrewViewSet(mixins.ListModelMixin,
                   mixins.CreateModelMixin,
                   mixins.RetrieveModelMixin,
                   viewsets.GenericViewSet,):
     queryset = Crew.objects.all()
     permission_classes = (IsAdminOrIfAuthenticatedReadOnly,)
+    query_budget = {
+        "list": 3,
+        "retrieve": 2,
+        "create": 2,
+        "upload_image": 4,
+        "roster": 3,
+        "roster_export": 3,
+    }
 
     def get_serializer_class(self):
         if self.action == "list":
@@ -71,8 +154,52 @@ class CrewViewSet(mixins.ListModelMixin,
             return CrewDetailSerializer
         if self.action == "upload_image":
             return CrewImageSerializer
+        if self.action in ("roster", "roster_export"):
+            return CrewRosterSerializer
         return CrewSerializer
 
+    @staticmethod
+    def roster_journeys(start, end):
+        # Bounding departure_time alone keeps the scan to the window, so
+        # the cost does not grow with the journeys of past years.
+        return Journey.objects.filter(
+            departure_time__gte=start, departure_time__lt=end
+        ).select_related(
+            "route__source", "route__destination", "train"
+        ).order_by("departure_time", "id")
+
+    @extend_schema(parameters=ROSTER_PARAMETERS)
+    @action(methods=["GET"], detail=True)
+    def roster(self, request, pk=None):
+        """Journeys a crew member departs on within the window."""
+        start, end = roster_window(request)
+        crew = self.get_object()
+        crew.roster = self.roster_journeys(start, end).filter(crew=crew)
+        return Response(self.get_serializer(crew).data)
+
+    @extend_schema(parameters=ROSTER_PARAMETERS,
+                   operation_id="api_station_crews_roster_list")
+    @action(methods=["GET"],
+            detail=False,
+            url_path="roster",
+            permission_classes=[IsAdminUser])
+    def roster_export(self, request):
+        """Rosters of all crew members within the window."""
+        start, end = roster_window(request)
+        assignments = Journey.crew.through.objects.filter(
+            journey__in=self.roster_journeys(start, end)
+        ).select_related(
+            "journey__route__source", "journey__route__destination",
+            "journey__train"
+        ).order_by("journey__departure_time", "journey_id")
+        rosters = defaultdict(list)
+        for assignment in assignments:
+            rosters[assignment.crew_id].append(assignment.journey)
+        crews = list(Crew.objects.order_by("id"))
+        for crew in crews:
+            crew.roster = rosters[crew.id]
+        return Response(self.get_serializer(crews, many=True).data)
+
     @action(methods=["POST"],
             detail=True,
             url_path="upload-image", permission_classes=[IsAdminUser])
@@ -81,28 +208,60 @@ class CrewViewSet(mixins.ListModelMixin,
         serializer = self.get_serializer(crew, data=request.data)
 
         if serializer.is_valid():
-            serializer.save()
+            serializer.save(image_variants={})
+            schedule_image_variants(serializer.instance)
             return Response(serializer.data, status=status.HTTP_200_OK)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class StationViewSet(mixins.ListModelMixin,
+class StationViewSet(CoalescingListMixin,
+                     mixins.ListModelMixin,
                      mixins.CreateModelMixin,
                      mixins.RetrieveModelMixin,
                      viewsets.GenericViewSet,):
     queryset = Station.objects.all()
     serializer_class = StationSerializer
     permission_classes = (IsAdminOrIfAuthenticatedReadOnly,)
-
-
-class RouteViewSet(mixins.ListModelMixin,
+    query_budget = {
+        "list": 3,
+        "retrieve": 2,
+        "create": 4,
+        "board": 3,
+        "board_stream": 2,
+    }
+
+    @action(methods=["GET"], detail=True)
+    def board(self, request, pk=None):
+        """Next departures and arrivals with the seats left."""
+        station = self.get_object()
+        return Response({"station": station.id,
+                         **boards.snapshot(station.id)})
+
+    @extend_schema(responses={(200, "text/event-stream"): str})
+    @action(methods=["GET"], detail=True, url_path="board/stream")
+    def board_stream(self, request, pk=None):
+        """Server-sent events with the board, then only its changes.
+
+        The first ``snapshot`` event carries the board as returned by
+        ``board/``; ``upsert``, ``remove`` and ``seats`` events follow as
+        journeys and tickets are written. Meant to be served over ASGI.
+        """
+        station = self.get_object()
+        snapshot = sync_to_async(boards.snapshot)
+        return event_stream_response(board_topic(station.id),
+                                     lambda: snapshot(station.id))
+
+
+class RouteViewSet(CoalescingListMixin,
+                   mixins.ListModelMixin,
                    mixins.CreateModelMixin,
                    mixins.RetrieveModelMixin,
                    viewsets.GenericViewSet,):
     queryset = Route.objects.all().select_related("source", "destination")
     serializer_class = RouteSerializer
     permission_classes = (IsAdminOrIfAuthenticatedReadOnly,)
+    query_budget = {"list": 3, "retrieve": 2, "create": 6}
 
     def get_serializer_class(self):
         if self.action == "list":
@@ -144,13 +303,25 @@ class RouteViewSet(mixins.ListModelMixin,
         return super().list(request, *args, **kwargs)
 
 
-class JourneyViewSet(viewsets.ModelViewSet):
+class JourneyViewSet(CoalescingListMixin, viewsets.ModelViewSet):
     queryset = Journey.objects.all()
     permission_classes = (IsAdminOrIfAuthenticatedReadOnly,)
+    query_budget = {
+        "list": 4,
+        "retrieve": 4,
+        "create": 16,
+        "update": 18,
+        "partial_update": 18,
+        "destroy": 10,
+        "upload_image": 8,
+        "conflicts": 3,
+        "seats_stream": 3,
+        "quote": 3,
+    }
 
     def get_queryset(self):
         queryset = self.queryset.select_related(
-            "route__source", "route__destination", "train"
+            "route__source", "route__destination", "train__train_type"
         )
         route_param = self.request.query_params.get("route")
         time_param = self.request.query_params.get("departure_time")
@@ -180,11 +351,88 @@ class JourneyViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(journey, data=request.data)
 
         if serializer.is_valid():
-            serializer.save()
+            serializer.save(image_variants={})
+            schedule_image_variants(serializer.instance)
             return Response(serializer.data, status=status.HTTP_200_OK)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                "from",
+                type=datetime,
+                description="Only journeys arriving after this date "
+                            "(YYYY-MM-DD)",
+                location=OpenApiParameter.QUERY,
+            ),
+            OpenApiParameter(
+                "to",
+                type=datetime,
+                description="Only journeys departing before this date "
+                            "(YYYY-MM-DD)",
+                location=OpenApiParameter.QUERY,
+            ),
+        ]
+    )
+    @action(methods=["GET"],
+            detail=False,
+            permission_classes=[IsAdminUser])
+    def conflicts(self, request):
+        """List trains and crew members assigned to overlapping journeys."""
+        trains, crew = load_schedules(parse_date_param(request, "from"),
+                                      parse_date_param(request, "to"))
+        return Response([
+            {"kind": kind, "resource": resource_id, "journeys": [a, b]}
+            for kind, schedules in (("train", trains), ("crew", crew))
+            for resource_id, a, b in overlapping_pairs(schedules)
+        ])
+
+    @action(methods=["POST"],
+            detail=False,
+            permission_classes=[IsAuthenticated])
+    def quote(self, request):
+        """Current prices of up to ``QUOTE_BATCH_SIZE`` journeys."""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data["journeys"]
+        journeys = list(Journey.objects.filter(id__in=ids).select_related(
+            "route", "train__train_type"
+        ).annotate(sold=Count("tickets")))
+        prices = fare_tables.get().price_journeys(
+            journeys, [journey.sold for journey in journeys]
+        )
+        quotes = {
+            journey.id: {"journey": journey.id,
+                         "price": f"{price:.2f}",
+                         "tickets_available": journey.train.capacity
+                         - journey.sold}
+            for journey, price in zip(journeys, prices)
+        }
+        return Response([quotes[journey_id]
+                         for journey_id in dict.fromkeys(ids)
+                         if journey_id in quotes])
+
+    @extend_schema(responses={(200, "text/event-stream"): str})
+    @action(methods=["GET"], detail=True, url_path="seats/stream")
+    def seats_stream(self, request, pk=None):
+        """Server-sent events with the taken seats, then only changes.
+
+        The first ``snapshot`` event carries the train layout and the
+        taken seats; ``taken`` and ``released`` events follow with the
+        seats booked or freed since. Seat maps are kept in memory, so
+        watchers cost no queries once a journey's map is loaded.
+        """
+        try:
+            journey_id = int(pk)
+        except ValueError:
+            raise Http404
+        if seat_maps.snapshot(journey_id) is None:
+            raise Http404
+        snapshot = sync_to_async(seat_maps.snapshot)
+        return event_stream_response(seats_topic(journey_id),
+                                     lambda: snapshot(journey_id))
+
     def get_serializer_class(self):
         if self.action == "list":
             return JourneyListSerializer
@@ -192,6 +440,8 @@ class JourneyViewSet(viewsets.ModelViewSet):
             return JourneyDetailSerializer
         if self.action == "upload_image":
             return JourneyImageSerializer
+        if self.action == "quote":
+            return JourneyQuoteSerializer
         return JourneySerializer
 
     @extend_schema(
@@ -229,25 +479,113 @@ class OrderPagination(PageNumberPagination):
 
 class OrderViewSet(mixins.ListModelMixin,
                    mixins.CreateModelMixin,
+                   mixins.RetrieveModelMixin,
                    GenericViewSet,):
     queryset = Order.objects.all()
     pagination_class = OrderPagination
     permission_classes = (IsAuthenticated,)
+    query_budget = {"list": 4, "retrieve": 4, "create": 11, "cancel": 12}
+    throttle_scopes = {"create": "booking", "cancel": "booking"}
+    admission_pools = {"create": "booking"}
 
     def get_queryset(self):
         queryset = self.queryset.filter(user=self.request.user)
         if self.action in ("list", "retrieve"):
             return queryset.prefetch_related(
-                "tickets__journey__route", "tickets__journey__train"
+                Prefetch(
+                    "tickets",
+                    queryset=Ticket.objects.select_related(
+                        "journey__route__source",
+                        "journey__route__destination",
+                        "journey__train__train_type",
+                    ),
+                )
             )
         return queryset
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+    @action(methods=["POST"], detail=True)
+    def cancel(self, request, pk=None):
+        """Cancel some tickets of an order, or all of them."""
+        order = self.get_object()
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(serializer.cancel(order))
+
     def get_serializer_class(self):
         if self.action == "list":
             return OrderListSerializer
         if self.action == "retrieve":
             return OrderDetailSerializer
+        if self.action == "cancel":
+            return OrderCancelSerializer
         return OrderSerializer
+
+
+class WaitlistViewSet(mixins.ListModelMixin,
+                      mixins.CreateModelMixin,
+                      mixins.DestroyModelMixin,
+                      GenericViewSet,):
+    """Waitlists of sold-out journeys; seats released by cancellations are
+    booked for waiting users in the order they joined."""
+
+    serializer_class = WaitlistEntrySerializer
+    permission_classes = (IsAuthenticated,)
+    query_budget = {"list": 3, "create": 6, "destroy": 3}
+
+    def get_queryset(self):
+        queryset = WaitlistEntry.objects.filter(user=self.request.user)
+        if self.action == "destroy":
+            return queryset.filter(promoted_at__isnull=True)
+        return queryset
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+
+class CheckInViewSet(GenericViewSet):
+    """Bulk ingestion of boarding scans from gate devices."""
+
+    serializer_class = CheckInBatchSerializer
+    permission_classes = (IsAdminUser,)
+    # Gates send many batches; staff accounts are not rate limited here.
+    throttle_classes = ()
+    query_budget = {"create": 2}
+
+    def create(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        statuses = record_check_ins(serializer.validated_data["scans"])
+        return Response({
+            "boarded": statuses.count("boarded"),
+            "statuses": statuses,
+        })
+
+
+class SyncViewSet(GenericViewSet):
+    """Changes to the timetable for clients keeping an offline copy."""
+
+    permission_classes = (IsAuthenticated,)
+    serializer_class = SyncSerializer
+    # One query for the changes and one per synced table.
+    query_budget = {"list": 6}
+
+    @extend_schema(parameters=[OpenApiParameter(
+        "since",
+        type=str,
+        location=OpenApiParameter.QUERY,
+        description="Token of the previous sync; leave out for all rows",
+    )])
+    def list(self, request):
+        """Stations, trains, routes and journeys written or deleted since
+        the ``since`` token.
+
+        Ask again with the returned ``token`` while ``more`` is true.
+        """
+        try:
+            since = int(request.query_params.get("since") or 0)
+        except ValueError:
+            raise ValidationError({"since": "Not a sync token."})
+        return Response(changes_since(since, settings.SYNC_PAGE_SIZE))
@@ -0,0 +1,142 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import product
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.utils import timezone
+
+from station.fares import fare_tables
+from station.models import Journey, Order, Ticket, WaitlistEntry
+from station.seats import publish_seats
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.WAITLIST_WORKERS,
+            thread_name_prefix="waitlist",
+        )
+    return _executor
+
+
+def promote_batch(journey_id):
+    """Book free seats for the next waitlist batch of a journey.
+
+    Runs in one short transaction holding the journey row, so concurrent
+    promotions of the journey take turns while bookings go on. Entries
+    are served strictly first come, first served: the batch stops at the
+    first entry asking for more seats than are left. Returns the number
+    of entries promoted and whether seats ran out.
+    """
+    with transaction.atomic():
+        # FOR NO KEY UPDATE still lets bookings reference the journey.
+        layout = Journey.objects.select_for_update(
+            of=("self",), no_key=True
+        ).filter(
+            pk=journey_id, departure_time__gt=timezone.now()
+        ).values_list(
+            "train__cargo_num", "train__place_in_cargo", "route__distance",
+            "train__train_type__fare_multiplier",
+        ).first()
+        if layout is None:
+            return 0, True
+        entries = list(WaitlistEntry.objects.filter(
+            journey_id=journey_id, promoted_at__isnull=True
+        )[:settings.WAITLIST_BATCH_SIZE])
+        if not entries:
+            return 0, True
+        taken = set(Ticket.objects.filter(
+            journey_id=journey_id
+        ).values_list("cargo", "seat"))
+        free = (seat for seat in product(range(1, layout[0] + 1),
+                                         range(1, layout[1] + 1))
+                if seat not in taken)
+        capacity = layout[0] * layout[1]
+        free_count = capacity - len(taken)
+        price, = fare_tables.get().prices([layout[2]], [layout[3]],
+                                          [len(taken)], [capacity])
+
+        promoted = []
+        for entry in entries:
+            if entry.seats > free_count:
+                break
+            free_count -= entry.seats
+            promoted.append((entry, [next(free) for _ in range(entry.seats)]))
+        if not promoted:
+            return 0, True
+
+        orders = Order.objects.bulk_create(
+            [Order(user_id=entry.user_id) for entry, _ in promoted]
+        )
+        now = timezone.now()
+        tickets = []
+        for order, (entry, seats) in zip(orders, promoted):
+            entry.order = order
+            entry.promoted_at = now
+            tickets.extend(Ticket(order=order, journey_id=journey_id,
+                                  cargo=cargo, seat=seat, price=price)
+                           for cargo, seat in seats)
+        # Bulk inserts skip the ticket signals, so announce the seats here.
+        Ticket.objects.bulk_create(tickets)
+        WaitlistEntry.objects.bulk_update([entry for entry, _ in promoted],
+                                          ["order", "promoted_at"])
+        publish_seats(journey_id, "taken",
+                      [(ticket.cargo, ticket.seat) for ticket in tickets])
+    return len(promoted), len(promoted) < len(entries)
+
+
+def promote_waitlist(journey_id):
+    """Promote waitlisted users of a journey until seats or entries run
+    out; returns the number of entries promoted."""
+    promoted = conflicts = 0
+    while True:
+        try:
+            count, exhausted = promote_batch(journey_id)
+        except IntegrityError:
+            # A booking took one of the seats; look again.
+            conflicts += 1
+            if conflicts > settings.WAITLIST_RETRIES:
+                raise
+            continue
+        promoted += count
+        if exhausted:
+            return promoted
+
+
+def _run_in_worker(journey_ids):
+    close_old_connections()
+    try:
+        for journey_id in journey_ids:
+            promote_waitlist(journey_id)
+    finally:
+        close_old_connections()
+
+
+def log_failure(journey_ids, future):
+    error = future.exception()
+    if error is not None:
+        logger.error("Could not promote the waitlists of journeys %s.",
+                     journey_ids, exc_info=error)
+
+
+def schedule_promotion(journey_ids):
+    """Promote the waitlists of ``journey_ids`` once the transaction that
+    released their seats commits."""
+    journey_ids = sorted(set(journey_ids))
+
+    def submit():
+        if settings.WAITLIST_WORKERS:
+            future = get_executor().submit(_run_in_worker, journey_ids)
+            future.add_done_callback(partial(log_failure, journey_ids))
+        else:
+            for journey_id in journey_ids:
+                promote_waitlist(journey_id)
+
+    transaction.on_commit(submit)
@@ -0,0 +1,119 @@
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.http import JsonResponse
+
+from train_station_api.metrics import registry
+
+
+class Pool:
+    """Concurrency limit with a bounded wait queue.
+
+    At most ``concurrency`` requests run at once; up to ``queue`` more wait
+    for at most ``timeout`` seconds. ``acquire()`` returns ``False`` right
+    away when the queue is full, or once the timeout runs out.
+    """
+
+    def __init__(self, name, config):
+        self.name = name
+        self.config = config
+        self.concurrency = config["concurrency"]
+        self.queue = config["queue"]
+        self.timeout = config["timeout"]
+        self.active = self.waiting = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        labels = (("pool", self.name),)
+        with self._condition:
+            registry.observe("admission_queue_depth", labels, self.waiting)
+            if self.active < self.concurrency and not self.waiting:
+                self.active += 1
+                return True
+            if self.waiting >= self.queue:
+                return False
+            self.waiting += 1
+            started = time.perf_counter()
+            try:
+                admitted = self._condition.wait_for(
+                    lambda: self.active < self.concurrency, self.timeout
+                )
+            finally:
+                self.waiting -= 1
+            if admitted:
+                self.active += 1
+                registry.observe("admission_wait_seconds", labels,
+                                 time.perf_counter() - started)
+            return admitted
+
+    def release(self):
+        with self._condition:
+            self.active -= 1
+            self._condition.notify()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(name):
+    config = settings.ADMISSION_POOLS[name]
+    pool = _pools.get(name)
+    if pool is None or pool.config != config:
+        with _pools_lock:
+            pool = _pools.get(name)
+            if pool is None or pool.config != config:
+                pool = _pools[name] = Pool(name, config)
+    return pool
+
+
+def get_pool_name(view_func, request):
+    """Pool declared for the request in the view's ``admission_pools``."""
+    view_class = getattr(view_func, "cls", None)
+    pools = getattr(view_class, "admission_pools", None)
+    if not pools:
+        return None
+    method = request.method.lower()
+    actions = getattr(view_func, "actions", None)
+    action = actions.get(method) if actions else method
+    return pools.get(action)
+
+
+class AdmissionControlMiddleware:
+    """Run the actions listed in a view's ``admission_pools`` in a pool.
+
+    ``admission_pools = {"create": "booking"}`` admits order creation
+    through the ``booking`` pool of ``ADMISSION_POOLS``; other requests are
+    never delayed. Requests that cannot get a slot are rejected with 503
+    and ``Retry-After``. Limits apply per worker process, so they only
+    take effect with threaded workers.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            return self.get_response(request)
+        finally:
+            pool = getattr(request, "admission_pool", None)
+            if pool is not None:
+                pool.release()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        name = get_pool_name(view_func, request)
+        if name is None:
+            return None
+        pool = get_pool(name)
+        if pool.acquire():
+            request.admission_pool = pool
+            return None
+        registry.increment("admission_rejected_total", (("pool", name),))
+        response = JsonResponse(
+            {"detail": "The server is busy, please try again later."},
+            status=503,
+        )
+        response["Retry-After"] = str(math.ceil(pool.timeout) or 1)
+        return response
@@ -0,0 +1,134 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import HttpRequest, QueryDict
+from django.urls import Resolver404, resolve
+from django.utils.http import urlencode
+from rest_framework import serializers
+from rest_framework.authentication import BaseAuthentication
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+# Only the API routers can be batched.
+PATH_PREFIXES = ("/api/station/", "/api/user/")
+
+# Headers that describe the batch itself rather than its sub-requests.
+SKIPPED_META = ("CONTENT_TYPE", "CONTENT_LENGTH", "HTTP_IF_NONE_MATCH",
+                "HTTP_IF_MODIFIED_SINCE")
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.BATCH_WORKERS,
+            thread_name_prefix="batch",
+        )
+    return _executor
+
+
+class BatchAuthentication(BaseAuthentication):
+    """Reuse the user of the batch for its sub-requests, so the token is
+    checked once per batch."""
+
+    def authenticate(self, request):
+        parent = getattr(request._request, "batch_parent", None)
+        if parent is None:
+            return None
+        return parent.user, parent.auth
+
+    def authenticate_header(self, request):
+        # Ask clients for a token as the JWT authentication would.
+        return JWTAuthentication().authenticate_header(request)
+
+
+class BatchRequestSerializer(serializers.Serializer):
+    path = serializers.CharField(max_length=2048)
+    method = serializers.ChoiceField(choices=["GET"], default="GET")
+    query = serializers.DictField(child=serializers.CharField(),
+                                  required=False, default=dict)
+
+    def validate_path(self, path):
+        path = path.split("?", 1)[0]
+        if not path.startswith(PATH_PREFIXES):
+            raise serializers.ValidationError(
+                f"Only paths under {', '.join(PATH_PREFIXES)} can be batched."
+            )
+        return path
+
+
+class BatchSerializer(serializers.Serializer):
+    requests = BatchRequestSerializer(many=True, allow_empty=False,
+                                      max_length=settings.BATCH_MAX_REQUESTS)
+    parallel = serializers.BooleanField(default=False)
+
+
+class BatchResponseSerializer(serializers.Serializer):
+    status = serializers.IntegerField()
+    body = serializers.JSONField(allow_null=True)
+
+
+class BatchResultSerializer(serializers.Serializer):
+    responses = BatchResponseSerializer(many=True)
+
+
+def sub_request(parent, path, query):
+    """A GET for ``path`` made with the headers and user of ``parent``."""
+    request = HttpRequest()
+    request.method = "GET"
+    request.path = request.path_info = path
+    request.META = {key: value for key, value in parent.META.items()
+                    if key not in SKIPPED_META}
+    request.META.update(REQUEST_METHOD="GET", PATH_INFO=path,
+                        QUERY_STRING=urlencode(query))
+    request.GET = QueryDict(request.META["QUERY_STRING"])
+    request.COOKIES = parent.COOKIES
+    request.batch_parent = parent
+    return request
+
+
+def run_sub_request(parent, path, query):
+    """``(status, body)`` of one sub-request."""
+    try:
+        match = resolve(path)
+    except Resolver404:
+        return 404, {"detail": "Not found."}
+    response = match.func(sub_request(parent, path, query),
+                          *match.args, **match.kwargs)
+    if response.streaming or not hasattr(response, "data"):
+        response.close()
+        return 400, {"detail": "This endpoint cannot be batched."}
+    return response.status_code, response.data
+
+
+def _run_in_worker(parent, path, query):
+    close_old_connections()
+    try:
+        return run_sub_request(parent, path, query)
+    finally:
+        close_old_connections()
+
+
+def run_batch(parent, requests, parallel=False):
+    """Run validated sub-requests on behalf of ``parent``.
+
+    Identical sub-requests run once. They run one after another on the
+    request's own connection, or with ``parallel`` on up to
+    ``BATCH_WORKERS`` threads with a connection each; the reads are
+    independent either way, so results do not depend on the order.
+    """
+    keys = [(request["path"], tuple(sorted(request["query"].items())))
+            for request in requests]
+    unique = list(dict.fromkeys(keys))
+    if parallel and settings.BATCH_WORKERS and len(unique) > 1:
+        results = list(get_executor().map(
+            lambda key: _run_in_worker(parent, key[0], key[1]), unique
+        ))
+    else:
+        results = [run_sub_request(parent, path, query)
+                   for path, query in unique]
+    results = dict(zip(unique, results))
+    return [{"status": status, "body": body}
+            for status, body in map(results.get, keys)]
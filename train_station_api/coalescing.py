@@ -0,0 +1,165 @@
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+
+from django.conf import settings
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from train_station_api.metrics import registry
+
+
+class Flight:
+    __slots__ = ("done", "result")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+
+
+_flights = {}
+_flights_lock = threading.Lock()
+_pruned_at = float("-inf")
+
+
+def coalesce(key, compute, label="coalesced"):
+    """Return ``compute()``, sharing it with concurrent calls for ``key``.
+
+    Within a process the first caller computes while later callers wait
+    for its result. Across processes, callers take a lock file in
+    ``COALESCING_DIR`` and reuse the result the previous holder wrote
+    while they waited. ``compute`` must return a JSON-serializable
+    ``(status, data)`` pair; results are only shared when the status is
+    200. Callers that time out or follow a failed computation compute
+    the value themselves. Files older than ``COALESCING_TIMEOUT`` can no
+    longer be waited for and are removed.
+    """
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = Flight()
+
+    if not leader:
+        if (flight.done.wait(settings.COALESCING_TIMEOUT)
+                and flight.result is not None):
+            registry.increment("coalesced_requests_total",
+                               (("view", label), ("source", "process")))
+            return flight.result
+        return compute()
+
+    try:
+        result = share_across_processes(key, compute, label)
+        if result[0] == 200:
+            flight.result = result
+        return result
+    finally:
+        with _flights_lock:
+            del _flights[key]
+        flight.done.set()
+
+
+def share_across_processes(key, compute, label):
+    directory = settings.COALESCING_DIR
+    if not directory:
+        return compute()
+    os.makedirs(directory, exist_ok=True)
+    digest = hashlib.sha256(key.encode()).hexdigest()
+    result_path = os.path.join(directory, f"{digest}.json")
+    started = time.time()
+    fd = os.open(os.path.join(directory, f"{digest}.lock"),
+                 os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        locked = acquire_lock(fd, started + settings.COALESCING_TIMEOUT)
+        if locked:
+            shared = read_result(result_path, started)
+            if shared is not None:
+                registry.increment("coalesced_requests_total",
+                                   (("view", label), ("source", "shared")))
+                return shared
+        result = compute()
+        if locked and result[0] == 200:
+            write_result(result_path, result)
+        return result
+    finally:
+        os.close(fd)
+        prune_files(directory, time.time())
+
+
+def prune_files(directory, now):
+    """Remove lock and result files idle for ``COALESCING_TIMEOUT``.
+
+    Runs at most once per timeout in each process. A process still
+    holding a removed lock only means one extra leader for that key.
+    """
+    global _pruned_at
+    if now - _pruned_at < settings.COALESCING_TIMEOUT:
+        return
+    _pruned_at = now
+    for entry in os.scandir(directory):
+        try:
+            if entry.stat().st_mtime < now - settings.COALESCING_TIMEOUT:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+
+
+def acquire_lock(fd, deadline):
+    while True:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            if time.time() >= deadline:
+                return False
+            time.sleep(0.005)
+
+
+def read_result(path, since):
+    """Result written by another process after ``since``, if any."""
+    try:
+        if os.stat(path).st_mtime < since:
+            return None
+        with open(path) as source:
+            return tuple(json.load(source))
+    except (OSError, ValueError):
+        return None
+
+
+def write_result(path, result):
+    temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporary, "w") as output:
+        json.dump(result, output, cls=JSONEncoder)
+    os.replace(temporary, path)
+
+
+class CoalescingListMixin:
+    """Share ``list`` responses between concurrent identical requests.
+
+    Requests are identical when they have the same normalized absolute URL
+    (query parameters sorted) and the view has the same permission
+    classes; the permission check itself still runs for every request.
+    """
+
+    def get_coalescing_key(self, request):
+        query = sorted(request.query_params.lists())
+        permissions = ",".join(
+            f"{permission.__module__}.{permission.__qualname__}"
+            for permission in self.permission_classes
+        )
+        return "|".join((request.build_absolute_uri(request.path),
+                         json.dumps(query), permissions))
+
+    def list(self, request, *args, **kwargs):
+        def compute():
+            response = super(CoalescingListMixin, self).list(
+                request, *args, **kwargs
+            )
+            return response.status_code, response.data
+
+        status_code, data = coalesce(self.get_coalescing_key(request),
+                                     compute, type(self).__name__)
+        return Response(data, status=status_code)
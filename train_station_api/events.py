@@ -0,0 +1,196 @@
+import asyncio
+import json
+import logging
+import queue
+import threading
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils.module_loading import import_string
+from rest_framework.utils.encoders import JSONEncoder
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """Events of one topic for one listener running in an event loop.
+
+    Events are queued up to ``EVENT_QUEUE_SIZE``; a listener that falls
+    further behind loses the backlog and ``overflowed`` is set so it can
+    start over from a fresh snapshot.
+    """
+
+    def __init__(self, broker, topic, loop):
+        self.broker = broker
+        self.topic = topic
+        self.loop = loop
+        self.queue = asyncio.Queue(settings.EVENT_QUEUE_SIZE)
+        self.overflowed = False
+
+    def put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+
+    async def get(self, timeout=None):
+        """Next event, or ``None`` if none arrives within ``timeout``."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class LocalTransport:
+    """Stand-in for delivering events between processes.
+
+    Events are encoded to JSON and handed back to the broker from a
+    background thread, as a message bus would, so publishers never wait
+    for listeners and events keep their publishing order. Delivery stays
+    within the process; deployments with several workers point
+    ``EVENT_TRANSPORT`` at a class with the same ``send`` method that
+    crosses processes.
+    """
+
+    def __init__(self, broker):
+        self.broker = broker
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def send(self, topic, event):
+        self._queue.put((topic, json.dumps(event, cls=JSONEncoder)))
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._run, name="event-transport", daemon=True
+                    )
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            topic, message = self._queue.get()
+            try:
+                self.broker.deliver(topic, json.loads(message))
+            except Exception:
+                logger.exception("Could not deliver an event on %s.", topic)
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        """Wait until every sent event has been delivered."""
+        self._queue.join()
+
+
+class Broker:
+    """Publish/subscribe between request threads and streams.
+
+    ``publish`` may be called from any thread; events travel through the
+    ``EVENT_TRANSPORT`` and are then handed to each subscriber's event
+    loop, so listeners never poll the database. ``listen`` registers a
+    plain callable for every event on topics with a given prefix, to keep
+    shared state such as caches up to date.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._listeners = []
+        self._transport = None
+
+    @property
+    def transport(self):
+        if self._transport is None:
+            with self._lock:
+                if self._transport is None:
+                    self._transport = import_string(
+                        settings.EVENT_TRANSPORT
+                    )(self)
+        return self._transport
+
+    def listen(self, prefix, callback):
+        self._listeners.append((prefix, callback))
+
+    def subscribe(self, topic):
+        subscription = Subscription(self, topic, asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.topic, set())
+            subscribers.discard(subscription)
+            if not subscribers:
+                self._subscribers.pop(subscription.topic, None)
+
+    def has_subscribers(self, topic):
+        return topic in self._subscribers
+
+    def publish(self, topic, event):
+        """Send ``(name, data)`` to the listeners of ``topic``."""
+        self.transport.send(topic, event)
+
+    def deliver(self, topic, event):
+        """Hand an event that came through the transport to listeners."""
+        name, data = event
+        for prefix, callback in self._listeners:
+            if topic.startswith(prefix):
+                callback(topic, name, data)
+        with self._lock:
+            subscribers = list(self._subscribers.get(topic, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.put,
+                                                       (name, data))
+            except RuntimeError:
+                # The listener's loop is gone.
+                self.unsubscribe(subscription)
+
+
+broker = Broker()
+
+
+def format_event(name, data):
+    """Encode one server-sent event."""
+    return f"event: {name}\ndata: {json.dumps(data, cls=JSONEncoder)}\n\n"
+
+
+async def event_stream(topic, snapshot):
+    """Server-sent events for ``topic``, starting with a snapshot.
+
+    ``snapshot`` is an async callable returning the current state; it is
+    sent as a ``snapshot`` event once subscribed, and again whenever the
+    listener falls behind. Published ``(name, data)`` pairs follow as
+    events of that name, with a comment every ``EVENT_HEARTBEAT`` seconds
+    to keep proxies from closing idle connections.
+    """
+    subscription = broker.subscribe(topic)
+    try:
+        yield format_event("snapshot", await snapshot())
+        while True:
+            event = await subscription.get(settings.EVENT_HEARTBEAT)
+            if subscription.overflowed:
+                subscription.overflowed = False
+                yield format_event("snapshot", await snapshot())
+            elif event is None:
+                yield ": heartbeat\n\n"
+            else:
+                yield format_event(*event)
+    finally:
+        subscription.close()
+
+
+def event_stream_response(topic, snapshot):
+    """Streaming response serving ``event_stream(topic, snapshot)``."""
+    response = StreamingHttpResponse(event_stream(topic, snapshot),
+                                     content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
@@ -0,0 +1,128 @@
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.http import (FileResponse,
+                         Http404,
+                         HttpResponse,
+                         StreamingHttpResponse)
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+CONTENT_ADDRESSED = re.compile(r"(^|/)[0-9a-f]{64}\.[a-z0-9]+$")
+RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+DEFAULT_CACHE_CONTROL = "public, max-age=3600"
+
+
+def parse_range(header, size):
+    """Return (start, end) for a single satisfiable byte range, else None.
+
+    Multi-range requests are answered with the whole file, which RFC 9110
+    allows.
+    """
+    match = RANGE.match(header.strip())
+    if not match or size == 0:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        raise ValueError("Unsatisfiable range")
+    return start, end
+
+
+def iter_range(path, start, end, chunk_size):
+    with open(path, "rb") as source:
+        source.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = source.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def build_headers(response, path, stat, etag):
+    content_type, encoding = mimetypes.guess_type(path)
+    response["Content-Type"] = content_type or "application/octet-stream"
+    if encoding:
+        response["Content-Encoding"] = encoding
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(stat.st_mtime)
+    response["Accept-Ranges"] = "bytes"
+    response["Cache-Control"] = (
+        IMMUTABLE_CACHE_CONTROL
+        if CONTENT_ADDRESSED.search(path)
+        else DEFAULT_CACHE_CONTROL
+    )
+    return response
+
+
+def serve_media(request, path):
+    """Serve an uploaded file, delegating the transfer when configured.
+
+    ``MEDIA_SERVE_MODE`` is ``"x-accel-redirect"`` for nginx,
+    ``"x-sendfile"`` for Apache/lighttpd, or ``"python"`` to stream the
+    file from the worker with Range and conditional request support.
+    """
+    full_path = safe_join(settings.MEDIA_ROOT, path)
+    try:
+        stat = os.stat(full_path)
+    except (FileNotFoundError, NotADirectoryError):
+        raise Http404("Media file not found")
+    if not os.path.isfile(full_path):
+        raise Http404("Media file not found")
+
+    etag = quote_etag(f"{stat.st_mtime_ns:x}-{stat.st_size:x}")
+    mode = settings.MEDIA_SERVE_MODE
+    if mode == "x-accel-redirect":
+        response = HttpResponse()
+        response["X-Accel-Redirect"] = (
+            settings.MEDIA_ACCEL_REDIRECT_PREFIX + path.lstrip("/")
+        )
+        return build_headers(response, full_path, stat, etag)
+    if mode == "x-sendfile":
+        response = HttpResponse()
+        response["X-Sendfile"] = full_path
+        return build_headers(response, full_path, stat, etag)
+
+    conditional = get_conditional_response(
+        request, etag=etag, last_modified=int(stat.st_mtime)
+    )
+    if conditional is not None:
+        return build_headers(conditional, full_path, stat, etag)
+
+    byte_range = None
+    range_header = request.META.get("HTTP_RANGE")
+    if_range = request.META.get("HTTP_IF_RANGE")
+    if range_header and (if_range is None or if_range == etag):
+        try:
+            byte_range = parse_range(range_header, stat.st_size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{stat.st_size}"
+            return response
+
+    chunk_size = settings.MEDIA_CHUNK_SIZE
+    if byte_range is None:
+        response = FileResponse(open(full_path, "rb"))
+        response.block_size = chunk_size
+        return build_headers(response, full_path, stat, etag)
+
+    start, end = byte_range
+    response = StreamingHttpResponse(
+        iter_range(full_path, start, end, chunk_size), status=206
+    )
+    response["Content-Length"] = end - start + 1
+    response["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+    return build_headers(response, full_path, stat, etag)
@@ -0,0 +1,121 @@
+import logging
+import random
+import threading
+import tracemalloc
+
+from django.conf import settings
+
+from train_station_api.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+_IGNORED = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+# tracemalloc is process-wide, so only one sampled request is traced at a
+# time; allocations made by other threads meanwhile are included.
+_tracing = threading.Lock()
+
+
+class MemoryTrace:
+    """Measure the allocations made inside a ``with`` block.
+
+    Call ``stop()`` while the block's results are still referenced to
+    record the peak, the memory still allocated and a snapshot for
+    ``top_sites()``. ``retained()`` can be called later, after dropping
+    those references, to see what was never freed.
+    """
+
+    def __init__(self, frames=1):
+        self.frames = frames
+        self.peak = self.allocated = 0
+
+    def __enter__(self):
+        self.owner = not tracemalloc.is_tracing()
+        if self.owner:
+            tracemalloc.start(self.frames)
+        tracemalloc.reset_peak()
+        self.before = tracemalloc.take_snapshot().filter_traces(_IGNORED)
+        self.base = tracemalloc.get_traced_memory()[0]
+        return self
+
+    def stop(self):
+        current, peak = tracemalloc.get_traced_memory()
+        self.peak = peak - self.base
+        self.allocated = current - self.base
+        self.after = tracemalloc.take_snapshot().filter_traces(_IGNORED)
+
+    def retained(self):
+        return tracemalloc.get_traced_memory()[0] - self.base
+
+    def top_sites(self, limit=10):
+        stats = self.after.compare_to(self.before, "lineno")
+        return [
+            {"site": str(stat.traceback[0]),
+             "size": stat.size_diff,
+             "count": stat.count_diff}
+            for stat in stats[:limit]
+            if stat.size_diff > 0
+        ]
+
+    def __exit__(self, *exc_info):
+        if self.owner:
+            tracemalloc.stop()
+
+
+def describe_view(request, response):
+    view = (getattr(response, "renderer_context", None) or {}).get("view")
+    if view is not None:
+        action = getattr(view, "action", None) or request.method.lower()
+        return f"{type(view).__name__}.{action}"
+    match = request.resolver_match
+    return match.view_name if match else "unmatched"
+
+
+class MemorySamplingMiddleware:
+    """Trace a ``MEMORY_PROFILE_SAMPLE_RATE`` share of requests.
+
+    Peaks go to the ``http_request_memory_peak_bytes`` histogram and the
+    top allocation sites are logged. Disabled when the rate is 0.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        rate = settings.MEMORY_PROFILE_SAMPLE_RATE
+        if not rate or random.random() >= rate:
+            return self.get_response(request)
+        if not _tracing.acquire(blocking=False):
+            return self.get_response(request)
+        try:
+            with MemoryTrace() as trace:
+                response = self.get_response(request)
+                trace.stop()
+                sites = trace.top_sites(settings.MEMORY_PROFILE_TOP_SITES)
+        finally:
+            _tracing.release()
+
+        match = request.resolver_match
+        registry.observe(
+            "http_request_memory_peak_bytes",
+            (("view", match.view_name if match else "unmatched"),
+             ("method", request.method)),
+            trace.peak,
+        )
+        logger.info(
+            "Memory for %s %s (%s): peak %.1f KiB, still allocated "
+            "%.1f KiB. Top sites: %s",
+            request.method,
+            request.path,
+            describe_view(request, response),
+            trace.peak / 1024,
+            trace.allocated / 1024,
+            "; ".join(f"{site['site']} {site['size'] / 1024:.1f} KiB"
+                      for site in sites),
+        )
+        return response
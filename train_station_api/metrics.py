@@ -0,0 +1,265 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import connection
+from rest_framework.renderers import JSONRenderer
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+MEMORY_BUCKETS = (65536, 262144, 1048576, 4194304, 16777216, 67108864,
+                  268435456)
+QUEUE_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64)
+
+HISTOGRAMS = {
+    "http_request_duration_seconds": (
+        "Time to handle a request, middleware included.", LATENCY_BUCKETS),
+    "http_request_db_seconds": (
+        "Time spent executing SQL while handling a request.",
+        LATENCY_BUCKETS),
+    "http_request_queries": (
+        "SQL queries executed while handling a request.", QUERY_BUCKETS),
+    "http_response_render_seconds": (
+        "Time spent rendering serialized data into the response body.",
+        LATENCY_BUCKETS),
+    "http_response_size_bytes": (
+        "Size of the response body.", SIZE_BUCKETS),
+    "http_request_memory_peak_bytes": (
+        "Peak traced allocations of sampled requests.", MEMORY_BUCKETS),
+    "admission_queue_depth": (
+        "Requests already waiting in the admission pool on arrival.",
+        QUEUE_BUCKETS),
+    "admission_wait_seconds": (
+        "Time admitted requests waited for a slot in their pool.",
+        LATENCY_BUCKETS),
+}
+
+COUNTERS = {
+    "admission_rejected_total": (
+        "Requests rejected with 503 because their pool was full."),
+    "coalesced_requests_total": (
+        "Requests answered with the result of an identical request."),
+}
+
+
+def pid_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # The process exists but belongs to another user.
+        return True
+    return True
+
+
+def is_stale(path):
+    """Whether a worker's file outlived the worker.
+
+    Files of processes that are gone are stale, as are files not written
+    for ``METRICS_STALE_AFTER`` seconds in case the pid was reused.
+    """
+    pid = os.path.basename(path)[len("metrics-"):-len(".json")]
+    if pid.isdigit() and not pid_running(int(pid)):
+        return True
+    return time.time() - os.path.getmtime(path) > settings.METRICS_STALE_AFTER
+
+
+class Registry:
+    """Histograms kept in process and shared through ``METRICS_DIR``.
+
+    Each histogram series stores one count per bucket (the last one is
+    ``+Inf``) followed by the sum of observed values; a counter series is
+    a single value. Every worker periodically
+    writes its series to ``METRICS_DIR/metrics-<pid>.json``; the metrics
+    view merges all files, so any worker can answer a scrape.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}
+        self._last_flush = 0.0
+
+    def observe(self, name, labels, value):
+        buckets = HISTOGRAMS[name][1]
+        key = (name, labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(buckets) + 1) + [0.0]
+            series[bisect_left(buckets, value)] += 1
+            series[-1] += value
+
+    def increment(self, name, labels, amount=1):
+        key = (name, labels)
+        with self._lock:
+            series = self._series.setdefault(key, [0])
+            series[0] += amount
+
+    def snapshot(self):
+        with self._lock:
+            return {key: list(series) for key, series in self._series.items()}
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def path(self, pid=None):
+        return os.path.join(settings.METRICS_DIR,
+                            f"metrics-{pid or os.getpid()}.json")
+
+    def flush(self, force=False):
+        if not settings.METRICS_DIR:
+            return
+        now = time.monotonic()
+        interval = settings.METRICS_FLUSH_INTERVAL
+        if not force and now - self._last_flush < interval:
+            return
+        self._last_flush = now
+        data = [
+            [name, list(labels), series]
+            for (name, labels), series in self.snapshot().items()
+        ]
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        temporary = f"{self.path()}.tmp"
+        with open(temporary, "w") as output:
+            json.dump(data, output)
+        os.replace(temporary, self.path())
+
+    def collect(self):
+        merged = self.snapshot()
+        if not settings.METRICS_DIR or not os.path.isdir(settings.METRICS_DIR):
+            return merged
+        own = os.path.basename(self.path())
+        for filename in os.listdir(settings.METRICS_DIR):
+            if not filename.endswith(".json") or filename == own:
+                continue
+            path = os.path.join(settings.METRICS_DIR, filename)
+            try:
+                if is_stale(path):
+                    os.remove(path)
+                    continue
+                with open(path) as src:
+                    data = json.load(src)
+            except (OSError, ValueError):
+                continue
+            for name, labels, series in data:
+                key = (name, tuple(map(tuple, labels)))
+                if key in merged:
+                    merged[key] = [a + b for a, b in zip(merged[key], series)]
+                else:
+                    merged[key] = series
+        return merged
+
+
+registry = Registry()
+
+
+def escape(value):
+    return (str(value).replace("\\", "\\\\")
+            .replace("\n", "\\n").replace('"', '\\"'))
+
+
+def format_labels(labels, extra=()):
+    pairs = [*labels, *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{escape(value)}"'
+                          for key, value in pairs) + "}"
+
+
+def render_prometheus(series_by_key):
+    lines = []
+    for name, (help_text, buckets) in HISTOGRAMS.items():
+        series = sorted((labels, values)
+                        for (metric, labels), values in series_by_key.items()
+                        if metric == name)
+        if not series:
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} histogram")
+        for labels, values in series:
+            cumulative = 0
+            for bound, count in zip((*buckets, "+Inf"), values[:-1]):
+                cumulative += count
+                le = (("le", bound if bound == "+Inf" else float(bound)),)
+                lines.append(
+                    f"{name}_bucket{format_labels(labels, le)} {cumulative}"
+                )
+            lines.append(f"{name}_sum{format_labels(labels)} {values[-1]}")
+            lines.append(f"{name}_count{format_labels(labels)} {cumulative}")
+    for name, help_text in COUNTERS.items():
+        series = sorted((labels, values)
+                        for (metric, labels), values in series_by_key.items()
+                        if metric == name)
+        if not series:
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} counter")
+        for labels, values in series:
+            lines.append(f"{name}{format_labels(labels)} {values[0]}")
+    return "\n".join(lines) + "\n"
+
+
+class RequestMetrics:
+    __slots__ = ("db_seconds", "queries", "render_seconds")
+
+    def __init__(self):
+        self.db_seconds = 0.0
+        self.queries = 0
+        self.render_seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_seconds += time.perf_counter() - started
+            self.queries += 1
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = request.request_metrics = RequestMetrics()
+        started = time.perf_counter()
+        with connection.execute_wrapper(metrics):
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        match = request.resolver_match
+        labels = (("view", match.view_name if match else "unmatched"),
+                  ("method", request.method))
+        registry.observe("http_request_duration_seconds",
+                         (*labels, ("status", str(response.status_code))),
+                         duration)
+        registry.observe("http_request_db_seconds", labels,
+                         metrics.db_seconds)
+        registry.observe("http_request_queries", labels, metrics.queries)
+        if metrics.render_seconds:
+            registry.observe("http_response_render_seconds", labels,
+                             metrics.render_seconds)
+        if not response.streaming:
+            registry.observe("http_response_size_bytes", labels,
+                             len(response.content))
+        registry.flush()
+        return response
+
+
+class InstrumentedJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        started = time.perf_counter()
+        try:
+            return super().render(data, accepted_media_type, renderer_context)
+        finally:
+            request = (renderer_context or {}).get("request")
+            metrics = getattr(getattr(request, "_request", None),
+                              "request_metrics", None)
+            if metrics is not None:
+                metrics.render_seconds += time.perf_counter() - started
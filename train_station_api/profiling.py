@@ -0,0 +1,147 @@
+import cProfile
+import json
+import os
+import time
+import uuid
+
+from django.conf import settings
+from django.core import signing
+from django.db import connection
+
+SALT = "train_station_api.profiling"
+
+
+def create_profile_token(user):
+    return signing.dumps({"user": user.pk, "nonce": uuid.uuid4().hex},
+                         salt=SALT)
+
+
+def load_profile_token(token):
+    """The payload of a valid, unexpired token, or ``None``."""
+    try:
+        return signing.loads(token, salt=SALT,
+                             max_age=settings.PROFILING_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return None
+
+
+def claim_profile_token(payload):
+    """Mark a token used; ``False`` if it was used before.
+
+    The marker is created exclusively in ``PROFILING_DIR``, so a token
+    profiles one request across all workers sharing the directory.
+    """
+    os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+    marker = os.path.join(settings.PROFILING_DIR, f"{payload['nonce']}.used")
+    try:
+        os.close(os.open(marker, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        return False
+    return True
+
+
+def profile_paths(profile_id):
+    return (os.path.join(settings.PROFILING_DIR, f"{profile_id}.prof"),
+            os.path.join(settings.PROFILING_DIR, f"{profile_id}.json"))
+
+
+def prune_profiles():
+    """Keep the newest ``PROFILING_MAX_PROFILES`` profiles and drop markers
+    of tokens that have expired anyway."""
+    entries = []
+    with os.scandir(settings.PROFILING_DIR) as scan:
+        for entry in scan:
+            try:
+                entries.append((entry.stat().st_mtime, entry.name))
+            except FileNotFoundError:
+                continue
+    expired = time.time() - settings.PROFILING_TOKEN_MAX_AGE
+    profiles = sorted((mtime, name[:-len(".prof")])
+                      for mtime, name in entries if name.endswith(".prof"))
+    stale = [f"{name}.used" for mtime, name in entries
+             if name.endswith(".used") and mtime < expired]
+    keep = settings.PROFILING_MAX_PROFILES
+    for _, profile_id in profiles[:max(len(profiles) - keep, 0)]:
+        stale.extend(os.path.basename(path)
+                     for path in profile_paths(profile_id))
+    for name in stale:
+        try:
+            os.remove(os.path.join(settings.PROFILING_DIR, name))
+        except FileNotFoundError:
+            pass
+
+
+class SQLRecorder:
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                "sql": sql,
+                "duration_ms": round(
+                    (time.perf_counter() - started) * 1000, 3),
+            })
+
+
+class ProfilingMiddleware:
+    """Profile a single request that carries a staff-issued token.
+
+    The token comes from ``POST /profiles/token/`` and is sent in the
+    ``X-Profile`` header or the ``profile`` query parameter. A token
+    profiles one request, and the result is only kept when the request was
+    made by the staff user the token was issued to: it is stored as a
+    pstats file plus a JSON SQL log, the newest ``PROFILING_MAX_PROFILES``
+    of which are kept, and its id is returned in the ``X-Profile-Id``
+    response header. Other requests only pay for one header lookup.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = request.META.get("HTTP_X_PROFILE")
+        query_string = request.META.get("QUERY_STRING", "")
+        if token is None and "profile=" in query_string:
+            token = request.GET.get("profile")
+        payload = load_profile_token(token) if token else None
+        if payload is None or not claim_profile_token(payload):
+            return self.get_response(request)
+        return self.profile(request, payload["user"])
+
+    def profile(self, request, user_id):
+        profiler = cProfile.Profile()
+        recorder = SQLRecorder()
+        started = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+        duration = time.perf_counter() - started
+        # The API authenticates in the view, which also sets request.user.
+        user = getattr(request, "user", None)
+        if not (user is not None and user.is_authenticated
+                and user.is_staff and user.pk == user_id):
+            return response
+
+        profile_id = uuid.uuid4().hex
+        stats_path, sql_path = profile_paths(profile_id)
+        os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+        profiler.dump_stats(stats_path)
+        with open(sql_path, "w") as output:
+            json.dump({
+                "method": request.method,
+                "path": request.get_full_path(),
+                "status": response.status_code,
+                "duration_ms": round(duration * 1000, 3),
+                "query_count": len(recorder.queries),
+                "queries": recorder.queries,
+            }, output, indent=2)
+        prune_profiles()
+        response["X-Profile-Id"] = profile_id
+        return response
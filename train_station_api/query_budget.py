@@ -0,0 +1,99 @@
+import logging
+import random
+import re
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LISTS = re.compile(r"\((?:\s*(?:\?|%s)\s*,)+\s*(?:\?|%s)\s*\)")
+_SPACES = re.compile(r"\s+")
+
+_unbudgeted = ContextVar("unbudgeted", default=False)
+
+
+def fingerprint(sql):
+    """Reduce SQL to its shape so repeated N+1 queries group together."""
+    sql = _LITERALS.sub("?", sql)
+    sql = _IN_LISTS.sub("(...)", sql.replace("%s", "?"))
+    return _SPACES.sub(" ", sql).strip()
+
+
+def get_query_budget(view, request):
+    """Return the declared query budget for the view handling ``request``.
+
+    Views declare ``query_budget`` as a mapping keyed by viewset action,
+    or by lower-case HTTP method for plain API views.
+    """
+    budgets = getattr(view, "query_budget", None)
+    if not budgets:
+        return None
+    key = getattr(view, "action", None) or request.method.lower()
+    return budgets.get(key)
+
+
+@contextmanager
+def unbudgeted():
+    """Leave the queries run inside out of the request's query budget.
+
+    For periodic refreshes of per-process caches, which some request has
+    to run but which are not part of what its view does.
+    """
+    token = _unbudgeted.set(True)
+    try:
+        yield
+    finally:
+        _unbudgeted.reset(token)
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if not _unbudgeted.get():
+            self.queries.append(sql)
+        return execute(sql, params, many, context)
+
+
+class QueryBudgetMiddleware:
+    """Log requests that run more queries than their view's budget.
+
+    Only a ``QUERY_BUDGET_SAMPLE_RATE`` share of requests is recorded.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= settings.QUERY_BUDGET_SAMPLE_RATE:
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+
+        context = getattr(response, "renderer_context", None) or {}
+        view = context.get("view")
+        if view is None:
+            return response
+        budget = get_query_budget(view, request)
+        if budget is not None and len(recorder.queries) > budget:
+            top = Counter(map(fingerprint, recorder.queries)).most_common(3)
+            logger.warning(
+                "Query budget exceeded for %s %s (%s.%s): %d queries, "
+                "budget %d. Most repeated: %s",
+                request.method,
+                request.path,
+                type(view).__name__,
+                getattr(view, "action", None) or request.method.lower(),
+                len(recorder.queries),
+                budget,
+                "; ".join(f"{count}x {sql}" for sql, count in top),
+            )
+        return response
@@ -0,0 +1,164 @@
+import glob
+import hashlib
+import os
+import tempfile
+import threading
+from functools import lru_cache
+
+import drf_spectacular
+import rest_framework
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition, require_safe
+from drf_spectacular.renderers import OpenApiJsonRenderer, OpenApiYamlRenderer
+from drf_spectacular.settings import spectacular_settings
+
+# Packages whose source the schema is generated from.
+SOURCE_DIRS = ("station", "user", "train_station_api")
+
+FORMATS = {"yaml": OpenApiYamlRenderer, "json": OpenApiJsonRenderer}
+
+
+@lru_cache(maxsize=None)
+def source_hash():
+    """Hash of the project's Python source and the schema libraries."""
+    digest = hashlib.sha256()
+    digest.update(f"{drf_spectacular.__version__} "
+                  f"{rest_framework.VERSION}".encode())
+    for directory in SOURCE_DIRS:
+        for root, dirs, files in os.walk(settings.BASE_DIR / directory):
+            dirs.sort()
+            for name in sorted(files):
+                if not name.endswith(".py"):
+                    continue
+                path = os.path.join(root, name)
+                digest.update(os.path.relpath(path, settings.BASE_DIR)
+                              .encode())
+                with open(path, "rb") as source:
+                    digest.update(source.read())
+    return digest.hexdigest()[:16]
+
+
+def code_version():
+    """``CODE_VERSION`` when deployments set it, else a source hash."""
+    return settings.CODE_VERSION or source_hash()
+
+
+def schema_path(version, schema_format):
+    return os.path.join(settings.SCHEMA_DIR,
+                        f"schema-{version}.{schema_format}")
+
+
+def build_schema(version):
+    """Generate the schema and write it to ``SCHEMA_DIR`` in each format.
+
+    Files are replaced atomically and those of other versions removed.
+    Returns the rendered documents by format.
+    """
+    generator = spectacular_settings.DEFAULT_GENERATOR_CLASS(
+        urlconf=spectacular_settings.SERVE_URLCONF
+    )
+    schema = generator.get_schema(request=None,
+                                  public=spectacular_settings.SERVE_PUBLIC)
+    os.makedirs(settings.SCHEMA_DIR, exist_ok=True)
+    documents = {}
+    for schema_format, renderer_class in FORMATS.items():
+        body = renderer_class().render(schema, renderer_context={})
+        descriptor, temporary = tempfile.mkstemp(dir=settings.SCHEMA_DIR,
+                                                 prefix=".schema-")
+        with os.fdopen(descriptor, "wb") as target:
+            target.write(body)
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, schema_path(version, schema_format))
+        documents[schema_format] = body
+    current = {schema_path(version, schema_format)
+               for schema_format in FORMATS}
+    for path in glob.glob(os.path.join(settings.SCHEMA_DIR, "schema-*")):
+        if path not in current:
+            os.remove(path)
+    return documents
+
+
+def load_schema(version):
+    """The documents of ``version`` from ``SCHEMA_DIR``, or ``None``."""
+    documents = {}
+    for schema_format in FORMATS:
+        try:
+            with open(schema_path(version, schema_format), "rb") as source:
+                documents[schema_format] = source.read()
+        except FileNotFoundError:
+            return None
+    return documents
+
+
+class SchemaDocuments:
+    """The schema of the running code, held in memory.
+
+    It is read from the artifact ``build_schema`` wrote for the code
+    version, which is generated first if missing, so requests never
+    introspect the views.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._current = None
+
+    def get(self):
+        """``(documents, etags)`` keyed by format."""
+        version = code_version()
+        current = self._current
+        if current is None or current[0] != version:
+            with self._lock:
+                current = self._current
+                if current is None or current[0] != version:
+                    documents = (load_schema(version)
+                                 or build_schema(version))
+                    etags = {
+                        schema_format: '"%s"' % hashlib.sha256(
+                            body
+                        ).hexdigest()[:32]
+                        for schema_format, body in documents.items()
+                    }
+                    current = self._current = (version, documents, etags)
+        return current[1], current[2]
+
+    def clear(self):
+        with self._lock:
+            self._current = None
+
+
+schema_documents = SchemaDocuments()
+
+
+def negotiate_format(request):
+    requested = request.GET.get("format")
+    if requested in FORMATS:
+        return requested
+    return "json" if "json" in request.headers.get("Accept", "") else "yaml"
+
+
+def schema_etag(request):
+    _, etags = schema_documents.get()
+    return etags[negotiate_format(request)]
+
+
+@require_safe
+@condition(etag_func=schema_etag)
+def serve_schema(request):
+    """The pre-generated OpenAPI schema, as YAML or, on request, JSON.
+
+    Responses can be cached for ``SCHEMA_MAX_AGE`` seconds and revalidated
+    with their ETag.
+    """
+    schema_format = negotiate_format(request)
+    documents, _ = schema_documents.get()
+    response = HttpResponse(documents[schema_format],
+                            content_type=FORMATS[schema_format].media_type)
+    response["Content-Disposition"] = (
+        f'inline; filename="schema.{schema_format}"'
+    )
+    patch_cache_control(response, public=True,
+                        max_age=settings.SCHEMA_MAX_AGE)
+    patch_vary_headers(response, ("Accept",))
+    return response
@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 import os
+import sys
+import tempfile
 from datetime import timedelta
 from pathlib import Path
 
@@ -48,23 +50,33 @@ INSTALLED_APPS = [
     "django.contrib.staticfiles",
     "rest_framework",
     "rest_framework.authtoken",
-    "debug_toolbar",
     "station",
     "user",
     "drf_spectacular"
 ]
 
 MIDDLEWARE = [
+    "train_station_api.metrics.MetricsMiddleware",
+    "train_station_api.profiling.ProfilingMiddleware",
+    "train_station_api.memory.MemorySamplingMiddleware",
     "django.middleware.security.SecurityMiddleware",
-    "debug_toolbar.middleware.DebugToolbarMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "train_station_api.query_budget.QueryBudgetMiddleware",
+    "train_station_api.admission.AdmissionControlMiddleware",
 ]
 
+if DEBUG:
+    INSTALLED_APPS.append("debug_toolbar")
+    MIDDLEWARE.insert(
+        MIDDLEWARE.index("django.middleware.security.SecurityMiddleware") + 1,
+        "debug_toolbar.middleware.DebugToolbarMiddleware",
+    )
+
 ROOT_URLCONF = "train_station_api.urls"
 
 TEMPLATES = [
@@ -142,6 +154,22 @@ MEDIA_ROOT = "/files/media"
 
 MEDIA_URL = "/media/"
 
+# "python", "x-accel-redirect" (nginx) or "x-sendfile" (Apache, lighttpd)
+MEDIA_SERVE_MODE = os.getenv("MEDIA_SERVE_MODE", "python")
+
+MEDIA_ACCEL_REDIRECT_PREFIX = "/protected-media/"
+
+MEDIA_CHUNK_SIZE = 512 * 1024
+
+STORAGES = {
+    "default": {
+        "BACKEND": "station.storage.ContentAddressedStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
+    },
+}
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -152,26 +180,47 @@ REST_FRAMEWORK = {
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.LimitOffsetPagination",
     "PAGE_SIZE": 10,
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "train_station_api.batch.BatchAuthentication",
+        "user.authentication.ClaimsJWTAuthentication",
     ),
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
+    "DEFAULT_RENDERER_CLASSES": (
+        "train_station_api.metrics.InstrumentedJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ),
 
     "DEFAULT_THROTTLE_CLASSES": [
-            "rest_framework.throttling.AnonRateThrottle",
-            "rest_framework.throttling.UserRateThrottle"
+            "user.throttling.AnonBucketThrottle",
+            "user.throttling.UserBucketThrottle",
+            "user.throttling.ScopedBucketThrottle",
         ],
     "DEFAULT_THROTTLE_RATES": {
         "anon": "30/day",
         "user": "100/day",
+        "booking": "20/hour",
     }
 }
 
+# Where throttle buckets are kept: "database" is shared by all hosts,
+# "shared-memory" by the workers of one host (see user.throttling)
+THROTTLE_STORE = os.getenv("THROTTLE_STORE", "database")
+
+THROTTLE_SHARED_MEMORY_PATH = os.getenv(
+    "THROTTLE_SHARED_MEMORY_PATH",
+    os.path.join(tempfile.gettempdir(), "train_station_throttle"),
+)
+
+THROTTLE_SHARED_MEMORY_SLOTS = 65536
+
 
 SPECTACULAR_SETTINGS = {
     "TITLE": "Cinema Service API",
     "DESCRIPTION": "Book tickets for a movie show",
     "VERSION": "1.0.0",
     "SERVE_INCLUDE_SCHEMA": False,
+    "AUTHENTICATION_WHITELIST": [
+        "user.authentication.ClaimsJWTAuthentication",
+    ],
     "SWAGGER_UI_SETTINGS": {
         "deepLinking": True,
         "defaultModelRendering": "model",
@@ -184,5 +233,146 @@ SPECTACULAR_SETTINGS = {
 SIMPLE_JWT = {
    "ACCESS_TOKEN_LIFETIME": timedelta(minutes=30),
    "REFRESH_TOKEN_LIFETIME": timedelta(days=7),
-   "ROTATE_REFRESH_TOKENS": False
+   "ROTATE_REFRESH_TOKENS": False,
+   "TOKEN_OBTAIN_SERIALIZER":
+       "user.serializers.UserTokenObtainPairSerializer",
+   "TOKEN_REFRESH_SERIALIZER":
+       "user.serializers.UserTokenRefreshSerializer",
 }
+
+# Fallback cache for tokens without user claims (see user.authentication)
+USER_CACHE_SIZE = 1024
+
+USER_CACHE_TTL = 60
+
+# In-process token denylist (see user.revocation)
+REVOCATION_REFRESH_INTERVAL = 5
+
+REVOCATION_REFRESH_OVERLAP = 60
+
+REVOCATION_REBUILD_INTERVAL = 3600
+
+REVOCATION_BLOOM_BITS = 1 << 20
+
+REVOCATION_BLOOM_HASHES = 7
+
+IMAGE_VARIANT_WORKERS = int(os.getenv("IMAGE_VARIANT_WORKERS", 2))
+
+IMAGE_VARIANTS = {
+    "thumbnail": {"size": (160, 160), "format": "JPEG"},
+    "medium": {"size": (800, 800), "format": "JPEG"},
+    "webp": {"size": (800, 800), "format": "WEBP"},
+}
+
+# Share of requests checked against their view's declared query budget
+QUERY_BUDGET_SAMPLE_RATE = float(os.getenv("QUERY_BUDGET_SAMPLE_RATE", 1.0))
+
+# Directory shared by all workers for aggregating /metrics/ histograms;
+# when unset each worker reports only its own requests.
+METRICS_DIR = os.getenv("METRICS_DIR")
+
+METRICS_FLUSH_INTERVAL = 5
+
+# Seconds after which a worker's metrics file is dropped from scrapes even
+# if its pid is alive (files of exited workers are dropped at once)
+METRICS_STALE_AFTER = 24 * 60 * 60
+
+# Staff-triggered request profiling (see train_station_api.profiling)
+PROFILING_DIR = os.getenv(
+    "PROFILING_DIR",
+    os.path.join(tempfile.gettempdir(), "train_station_profiles"),
+)
+
+PROFILING_TOKEN_MAX_AGE = 600
+PROFILING_MAX_PROFILES = 50
+
+# Share of requests traced with tracemalloc (0 disables sampling)
+MEMORY_PROFILE_SAMPLE_RATE = float(
+    os.getenv("MEMORY_PROFILE_SAMPLE_RATE", 0)
+)
+
+MEMORY_PROFILE_TOP_SITES = 10
+
+# Per-process concurrency pools for expensive actions, assigned with a
+# view's admission_pools (see train_station_api.admission)
+ADMISSION_POOLS = {
+    "booking": {
+        "concurrency": int(os.getenv("BOOKING_CONCURRENCY", 4)),
+        "queue": int(os.getenv("BOOKING_QUEUE", 8)),
+        "timeout": 2,
+    },
+}
+
+# Lock and result files shared by the workers of one host for coalescing
+# identical list requests (see train_station_api.coalescing); when unset
+# requests are only coalesced within a worker.
+COALESCING_DIR = os.getenv("COALESCING_DIR") or None
+
+COALESCING_TIMEOUT = 10
+
+# HMAC keys for ticket tokens by key id; gate devices need them to verify
+# tickets offline (see station.tickets), so they must not be SECRET_KEY.
+# Add a key with a higher id to rotate.
+TICKET_SIGNING_KEYS = {
+    1: os.getenv("TICKET_SIGNING_KEY"),
+}
+
+# The test suite signs tickets with a fixed key unless one is configured.
+if sys.argv[1:2] == ["test"] and not TICKET_SIGNING_KEYS[1]:
+    TICKET_SIGNING_KEYS[1] = "test-ticket-signing-key"
+
+CHECK_IN_BATCH_SIZE = 1000
+
+# Station departure boards (see station.board): journeys shown per kind,
+# how far ahead they are loaded and how often a board is reloaded.
+BOARD_SIZE = 20
+BOARD_HORIZON_HOURS = 24
+BOARD_REFRESH_INTERVAL = 300
+
+# Server-sent event streams (see train_station_api.events): events queued
+# per listener and seconds between keep-alive comments.
+EVENT_QUEUE_SIZE = 256
+EVENT_HEARTBEAT = 15
+
+# Carries published events to the listeners; the default only reaches
+# the publishing process, so multi-worker deployments need a transport
+# that crosses processes.
+EVENT_TRANSPORT = os.getenv(
+    "EVENT_TRANSPORT", "train_station_api.events.LocalTransport"
+)
+
+# Journey seat maps kept per process for seat streams (see station.seats)
+SEAT_MAP_CACHE_SIZE = 1024
+SEAT_MAP_TTL = 300
+
+# Waitlist promotion (see station.waitlist): background threads per process
+# (0 promotes inline after the releasing transaction commits), entries per
+# transaction and retries after a booking races for the same seat.
+WAITLIST_WORKERS = int(os.getenv("WAITLIST_WORKERS", 1))
+WAITLIST_BATCH_SIZE = 100
+WAITLIST_RETRIES = 3
+
+# Seconds a compiled fare table is reused before tariffs and surcharges
+# are read again (see station.fares), and journeys per quote request
+FARE_TABLE_TTL = 300
+QUOTE_BATCH_SIZE = 500
+
+# Batch endpoint (see train_station_api.batch): sub-requests per batch and
+# threads per process for batches run with "parallel"
+BATCH_MAX_REQUESTS = 20
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", 4))
+
+# Offline sync (see station.sync): changes per response, and seconds a
+# change is held back so transactions still open when it was logged can
+# commit first
+SYNC_PAGE_SIZE = 1000
+SYNC_SETTLE_SECONDS = 5
+
+# Pre-generated OpenAPI schema (see train_station_api.schema): where it is
+# written, the code version it is generated for (a hash of the source
+# when unset) and seconds clients may cache it
+SCHEMA_DIR = os.getenv(
+    "SCHEMA_DIR", os.path.join(tempfile.gettempdir(), "train_station_schema")
+)
+CODE_VERSION = os.getenv("CODE_VERSION")
+SCHEMA_MAX_AGE = 86400
@@ -15,21 +15,36 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.conf import settings
-from django.conf.urls.static import static
 from django.contrib import admin
-from django.urls import path, include
-from drf_spectacular.views import (SpectacularAPIView,
-                                   SpectacularSwaggerView,
+from django.urls import path, include, re_path
+from drf_spectacular.views import (SpectacularSwaggerView,
                                    SpectacularRedocView)
 
+from train_station_api.media import serve_media
+from train_station_api.schema import serve_schema
+from train_station_api.views import (BatchView,
+                                     MetricsView,
+                                     ProfileTokenView,
+                                     ProfileView)
+
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/station/", include("station.urls", namespace="station")),
     path("api/user/", include("user.urls", namespace="user")),
-    path("__debug__/", include("debug_toolbar.urls")),
-    path("api/doc/", SpectacularAPIView.as_view(), name="schema"),
+    path("api/batch/", BatchView.as_view(), name="batch"),
+    path("metrics/", MetricsView.as_view(), name="metrics"),
+    path("profiles/token/", ProfileTokenView.as_view(), name="profile-token"),
+    path("profiles/<str:profile_id>/", ProfileView.as_view(),
+         name="profile"),
+    path("api/doc/", serve_schema, name="schema"),
     path("api/doc/swagger/", SpectacularSwaggerView.as_view(url_name="schema"),
          name="swagger-ui"),
     path("api/doc/redoc/", SpectacularRedocView.as_view(url_name="schema"),
          name="redoc"),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    re_path(rf"^{settings.MEDIA_URL.lstrip('/')}(?P<path>.+)$",
+            serve_media,
+            name="media"),
+]
+
+if settings.DEBUG:
+    urlpatterns.append(path("__debug__/", include("debug_toolbar.urls")))
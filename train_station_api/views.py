@@ -0,0 +1,90 @@
+import json
+import os
+import re
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse
+from drf_spectacular.utils import extend_schema
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from train_station_api.batch import (BatchResultSerializer,
+                                     BatchSerializer,
+                                     run_batch)
+from train_station_api.metrics import registry, render_prometheus
+from train_station_api.profiling import create_profile_token, profile_paths
+
+PROFILE_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+@extend_schema(exclude=True)
+class MetricsView(APIView):
+    """Prometheus text exposition of the request histograms."""
+
+    permission_classes = (IsAdminUser,)
+    throttle_classes = ()
+
+    def get(self, request):
+        registry.flush(force=True)
+        return HttpResponse(
+            render_prometheus(registry.collect()),
+            content_type="text/plain; version=0.0.4; charset=utf-8",
+        )
+
+
+@extend_schema(exclude=True)
+class ProfileTokenView(APIView):
+    """Issue a short-lived token that enables profiling of a request."""
+
+    permission_classes = (IsAdminUser,)
+
+    def post(self, request):
+        return Response({
+            "token": create_profile_token(request.user),
+            "expires_in": settings.PROFILING_TOKEN_MAX_AGE,
+        })
+
+
+@extend_schema(exclude=True)
+class ProfileView(APIView):
+    """Download a stored profile as pstats, or its SQL log with ?output=sql."""
+
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request, profile_id):
+        if not PROFILE_ID.match(profile_id):
+            raise Http404
+        stats_path, sql_path = profile_paths(profile_id)
+        if not os.path.exists(stats_path):
+            raise Http404
+        if request.query_params.get("output") == "sql":
+            with open(sql_path) as source:
+                return Response(json.load(source))
+        return FileResponse(open(stats_path, "rb"), as_attachment=True,
+                            filename=f"{profile_id}.prof")
+
+
+class BatchView(APIView):
+    """Run several reads of the station and user APIs in one request."""
+
+    permission_classes = (IsAuthenticated,)
+    serializer_class = BatchSerializer
+
+    def get_throttle_cost(self, request):
+        # Each sub-request counts against the rate limits. Larger batches
+        # are rejected by validation, so they cost no more than the limit.
+        data = request.data
+        requests = data.get("requests") if isinstance(data, dict) else None
+        if not isinstance(requests, list):
+            return 1
+        return min(max(len(requests), 1), settings.BATCH_MAX_REQUESTS)
+
+    @extend_schema(request=BatchSerializer,
+                   responses={200: BatchResultSerializer})
+    def post(self, request):
+        serializer = BatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response({"responses": run_batch(
+            request, **serializer.validated_data
+        )})
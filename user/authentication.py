@@ -0,0 +1,144 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from drf_spectacular.contrib.rest_framework_simplejwt import SimpleJWTScheme
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import (AuthenticationFailed,
+                                                 InvalidToken)
+from rest_framework_simplejwt.settings import api_settings
+
+from user.revocation import denylist
+
+USER_CLAIMS = ("email", "is_staff", "is_active")
+
+
+def add_user_claims(token, user):
+    for claim in USER_CLAIMS:
+        token[claim] = getattr(user, claim)
+    return token
+
+
+class UserCache:
+    """Small per-process LRU of users with a time-to-live.
+
+    ``invalidate()`` drops a user and marks tokens issued before now as
+    stale, so their claims are no longer trusted in this process.
+    ``get()`` also reloads users cached before ``loaded_after``.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._users = OrderedDict()
+        self._changed_at = {}
+
+    def get(self, user_id, loaded_after=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._users.get(user_id)
+            if (entry is not None and entry[0] > now
+                    and (loaded_after is None or entry[2] > loaded_after)):
+                self._users.move_to_end(user_id)
+                return entry[1]
+        loaded_at = time.time()
+        user = get_user_model().objects.filter(pk=user_id).first()
+        with self._lock:
+            self._users[user_id] = (now + settings.USER_CACHE_TTL, user,
+                                    loaded_at)
+            self._users.move_to_end(user_id)
+            while len(self._users) > settings.USER_CACHE_SIZE:
+                self._users.popitem(last=False)
+        return user
+
+    def changed_since(self, user_id, issued_at):
+        changed_at = self._changed_at.get(user_id)
+        return changed_at is not None and issued_at <= changed_at
+
+    def discard(self, user_id):
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def invalidate(self, user_id):
+        now = time.time()
+        # Older markers only concern tokens that have expired by now.
+        horizon = now - api_settings.ACCESS_TOKEN_LIFETIME.total_seconds()
+        with self._lock:
+            self._users.pop(user_id, None)
+            self._changed_at = {
+                key: changed_at
+                for key, changed_at in self._changed_at.items()
+                if changed_at > horizon
+            }
+            self._changed_at[user_id] = now
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+            self._changed_at.clear()
+
+
+user_cache = UserCache()
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """JWT authentication that does not load the user on every request.
+
+    Access tokens issued by ``UserTokenObtainPairSerializer`` carry the
+    user's email, staff and active flags; an unsaved ``User`` built from
+    them is enough for permission checks and filtering by user. Tokens
+    without these claims, or issued before the user's claims last changed
+    in this or, once the ``denylist`` has refreshed, another process, fall
+    back to ``user_cache``. Never ``save()`` the
+    returned user: it only has the claimed fields set.
+
+    Revoked tokens are rejected using the in-process ``denylist``.
+    """
+
+    def get_validated_token(self, raw_token):
+        validated_token = super().get_validated_token(raw_token)
+        if denylist.is_revoked(validated_token):
+            raise InvalidToken({
+                "detail": "Token has been revoked",
+                "code": "token_revoked",
+            })
+        return validated_token
+
+    def get_user(self, validated_token):
+        try:
+            user_id = int(validated_token[api_settings.USER_ID_CLAIM])
+        except (KeyError, TypeError, ValueError):
+            raise AuthenticationFailed(
+                "Token contained no recognizable user identification",
+                code="token_not_valid",
+            )
+
+        issued_at = validated_token.get("iat", 0)
+        claims_changed_at = denylist.claims_changed_at(str(user_id))
+        has_claims = all(claim in validated_token for claim in USER_CLAIMS)
+        if (has_claims
+                and not user_cache.changed_since(user_id, issued_at)
+                and (claims_changed_at is None
+                     or issued_at > claims_changed_at)):
+            user = get_user_model()(
+                pk=user_id,
+                **{claim: validated_token[claim] for claim in USER_CLAIMS},
+            )
+            user._state.adding = False
+        else:
+            user = user_cache.get(user_id, loaded_after=claims_changed_at)
+            if user is None:
+                raise AuthenticationFailed("User not found",
+                                           code="user_not_found")
+
+        if not user.is_active:
+            raise AuthenticationFailed("User is inactive",
+                                       code="user_inactive")
+        return user
+
+
+class ClaimsJWTScheme(SimpleJWTScheme):
+    """Document ``ClaimsJWTAuthentication`` as the bearer JWT it accepts."""
+
+    target_class = "user.authentication.ClaimsJWTAuthentication"
@@ -0,0 +1,16 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from user.throttling import DatabaseStore
+
+
+class Command(BaseCommand):
+    help = ("Delete throttle buckets of the database store that have "
+            "refilled completely.")
+
+    def handle(self, *args, **options):
+        count = DatabaseStore().prune(time.time())
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {count} full throttle buckets."
+        ))
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-19 11:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("user", "0004_throttle_bucket"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="tokencutoff",
+            name="claims_changed_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name="tokencutoff",
+            name="revoked_before",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -46,3 +46,45 @@ class User(AbstractUser):
     REQUIRED_FIELDS = []
 
     objects = UserManager()
+
+
+class RevokedToken(models.Model):
+    """A single token revoked before it expires, identified by its jti."""
+
+    jti = models.CharField(max_length=255, unique=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE,
+                             related_name="revoked_tokens")
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return self.jti
+
+
+class TokenCutoff(models.Model):
+    """Tokens of ``user`` issued before ``revoked_before`` are revoked.
+
+    Claims of tokens issued before ``claims_changed_at`` are out of date,
+    so the user is loaded from the database for them instead.
+    """
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE,
+                                related_name="token_cutoff")
+    revoked_before = models.DateTimeField(null=True, blank=True)
+    claims_changed_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.user} before {self.revoked_before}"
+
+
+class ThrottleBucket(models.Model):
+    """Token bucket state of one throttle scope and client."""
+
+    key = models.CharField(max_length=255, unique=True)
+    tokens = models.FloatField()
+    updated_at = models.FloatField()
+    allowed = models.BooleanField()
+
+    def __str__(self):
+        return self.key
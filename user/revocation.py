@@ -0,0 +1,197 @@
+import hashlib
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+
+from train_station_api.query_budget import unbudgeted
+from user.models import RevokedToken, TokenCutoff
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings using double hashing."""
+
+    def __init__(self, bits, hashes):
+        self.bits = bits
+        self.hashes = hashes
+        self.array = bytearray((bits + 7) // 8)
+
+    def positions(self, value):
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return [(first + i * second) % self.bits for i in range(self.hashes)]
+
+    def add(self, value):
+        for position in self.positions(value):
+            self.array[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value):
+        return all(self.array[position >> 3] & (1 << (position & 7))
+                   for position in self.positions(value))
+
+
+class Denylist:
+    """Per-process copy of the revoked tokens and per-user cutoffs.
+
+    It also holds when each user's claims last changed in any process, so
+    claims of tokens issued before that are not trusted here either.
+
+    Lookups never touch the database. The copy is refreshed at most every
+    ``REVOCATION_REFRESH_INTERVAL`` seconds with rows created or changed
+    since the last refresh (re-reading an overlap window so rows committed
+    late are not missed), and rebuilt from scratch every
+    ``REVOCATION_REBUILD_INTERVAL`` seconds to forget expired tokens. Most
+    jtis are rejected by the Bloom filter alone; the rare false positives
+    are settled by the exact set.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clear()
+        self._rebuilt_at = self._refreshed_at = float("-inf")
+
+    def _clear(self):
+        self._bloom = BloomFilter(settings.REVOCATION_BLOOM_BITS,
+                                  settings.REVOCATION_BLOOM_HASHES)
+        self._jtis = set()
+        self._cutoffs = {}
+        self._claims_changed = {}
+        self._watermark = None
+
+    def _add_jti(self, jti):
+        self._bloom.add(jti)
+        self._jtis.add(jti)
+
+    def _add_cutoff(self, user_id, revoked_before):
+        # Tokens carry the user id as a string. The cutoff keeps its
+        # fraction: ``iat`` is truncated to the second, so a token issued
+        # earlier within the cutoff's second is still older than it.
+        user_id = str(user_id)
+        timestamp = revoked_before.timestamp()
+        if timestamp > self._cutoffs.get(user_id, 0):
+            self._cutoffs[user_id] = timestamp
+
+    def _add_claims_change(self, user_id, changed_at):
+        user_id = str(user_id)
+        timestamp = changed_at.timestamp()
+        if timestamp > self._claims_changed.get(user_id, 0):
+            self._claims_changed[user_id] = timestamp
+
+    def refresh(self, force=False):
+        now = time.monotonic()
+        if (not force and now - self._refreshed_at
+                < settings.REVOCATION_REFRESH_INTERVAL):
+            return
+        # The refresh serves every request of the process, so it is not
+        # counted against the budget of the one that happens to run it.
+        with self._lock, unbudgeted():
+            if (not force and now - self._refreshed_at
+                    < settings.REVOCATION_REFRESH_INTERVAL):
+                return
+            if force or (now - self._rebuilt_at
+                         >= settings.REVOCATION_REBUILD_INTERVAL):
+                self._clear()
+                self._rebuilt_at = now
+            started = timezone.now()
+            tokens = RevokedToken.objects.filter(expires_at__gt=started)
+            cutoffs = TokenCutoff.objects.all()
+            if self._watermark is not None:
+                since = self._watermark - timedelta(
+                    seconds=settings.REVOCATION_REFRESH_OVERLAP
+                )
+                tokens = tokens.filter(created_at__gte=since)
+                cutoffs = cutoffs.filter(updated_at__gte=since)
+            for jti in tokens.values_list("jti", flat=True).iterator():
+                self._add_jti(jti)
+            for user_id, revoked_before, claims_changed_at in (
+                    cutoffs.values_list("user_id", "revoked_before",
+                                        "claims_changed_at").iterator()):
+                if revoked_before is not None:
+                    self._add_cutoff(user_id, revoked_before)
+                if claims_changed_at is not None:
+                    self._add_claims_change(user_id, claims_changed_at)
+            self._watermark = started
+            self._refreshed_at = now
+
+    def add(self, jti=None, user_id=None, revoked_before=None,
+            claims_changed_at=None):
+        """Apply a revocation to this process without waiting for refresh."""
+        with self._lock:
+            if jti is not None:
+                self._add_jti(jti)
+            if revoked_before is not None:
+                self._add_cutoff(user_id, revoked_before)
+            if claims_changed_at is not None:
+                self._add_claims_change(user_id, claims_changed_at)
+
+    def is_revoked(self, token):
+        self.refresh()
+        jti = token.get(api_settings.JTI_CLAIM)
+        if jti is not None and jti in self._bloom and jti in self._jtis:
+            return True
+        cutoff = self._cutoffs.get(str(token.get(api_settings.USER_ID_CLAIM)))
+        return cutoff is not None and token.get("iat", 0) < cutoff
+
+    def claims_changed_at(self, user_id):
+        """Timestamp of the last change to the claims of ``user_id``."""
+        self.refresh()
+        return self._claims_changed.get(user_id)
+
+    def reset(self):
+        with self._lock:
+            self._clear()
+            self._rebuilt_at = self._refreshed_at = float("-inf")
+
+
+denylist = Denylist()
+
+
+def revoke_tokens(*tokens):
+    """Revoke access or refresh tokens until they expire."""
+    RevokedToken.objects.filter(expires_at__lte=timezone.now()).delete()
+    RevokedToken.objects.bulk_create([
+        RevokedToken(
+            jti=token[api_settings.JTI_CLAIM],
+            user_id=token[api_settings.USER_ID_CLAIM],
+            expires_at=datetime.fromtimestamp(token["exp"],
+                                              tz=dt_timezone.utc),
+        )
+        for token in tokens
+    ], ignore_conflicts=True)
+    for token in tokens:
+        denylist.add(jti=token[api_settings.JTI_CLAIM])
+
+
+def revoke_user_tokens(user):
+    """Revoke every token issued to ``user`` until now.
+
+    Tokens issued later within the same second are revoked too, as their
+    ``iat`` cannot tell them apart.
+    """
+    revoked_before = timezone.now()
+    TokenCutoff.objects.bulk_create(
+        [TokenCutoff(user_id=user.pk, revoked_before=revoked_before)],
+        update_conflicts=True,
+        unique_fields=["user"],
+        update_fields=["revoked_before", "updated_at"],
+    )
+    denylist.add(user_id=user.pk, revoked_before=revoked_before)
+
+
+def mark_claims_changed(user):
+    """Stop trusting the claims of tokens issued to ``user`` before now.
+
+    Other processes pick the change up with their next refresh.
+    """
+    claims_changed_at = timezone.now()
+    TokenCutoff.objects.bulk_create(
+        [TokenCutoff(user_id=user.pk, claims_changed_at=claims_changed_at)],
+        update_conflicts=True,
+        unique_fields=["user"],
+        update_fields=["claims_changed_at", "updated_at"],
+    )
+    denylist.add(user_id=user.pk, claims_changed_at=claims_changed_at)
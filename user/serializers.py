@@ -1,5 +1,14 @@
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
+from rest_framework_simplejwt import serializers as jwt_serializers
+from rest_framework_simplejwt.exceptions import (AuthenticationFailed,
+                                                 InvalidToken,
+                                                 TokenError)
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from user.authentication import add_user_claims
+from user.revocation import denylist
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -16,8 +25,57 @@ class UserSerializer(serializers.ModelSerializer):
 
     def update(self, instance, validated_data):
         password = validated_data.pop("password", None)
-        user = super().update(instance, validated_data)
         if password:
-            user.set_password(password)
-            user.save()
-        return user
+            instance.set_password(password)
+        return super().update(instance, validated_data)
+
+
+class UserTokenObtainPairSerializer(jwt_serializers.TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        return add_user_claims(super().get_token(user), user)
+
+
+def load_refresh_token(raw_token):
+    try:
+        refresh = RefreshToken(raw_token)
+    except TokenError as error:
+        raise InvalidToken(error.args[0])
+    if denylist.is_revoked(refresh):
+        raise InvalidToken("Token has been revoked")
+    return refresh
+
+
+class UserTokenRefreshSerializer(jwt_serializers.TokenRefreshSerializer):
+    # Replaces the parent's validate() so the user, needed both for the
+    # active check and the claims, is loaded once.
+    def validate(self, attrs):
+        refresh = load_refresh_token(attrs["refresh"])
+        user = get_user_model().objects.filter(
+            pk=refresh[api_settings.USER_ID_CLAIM]
+        ).first()
+        if user is None or not api_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed(
+                self.error_messages["no_active_account"],
+                "no_active_account",
+            )
+        data = {"access": str(add_user_claims(refresh.access_token, user))}
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            data["refresh"] = str(refresh)
+        return data
+
+
+class LogoutSerializer(serializers.Serializer):
+    refresh = serializers.CharField(required=False)
+
+    def validate_refresh(self, value):
+        refresh = load_refresh_token(value)
+        user_id = refresh[api_settings.USER_ID_CLAIM]
+        if str(user_id) != str(self.context["request"].user.pk):
+            raise serializers.ValidationError(
+                "Token belongs to another user."
+            )
+        return refresh
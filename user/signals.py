@@ -0,0 +1,35 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+
+from user.authentication import USER_CLAIMS, user_cache
+from user.revocation import mark_claims_changed
+
+
+def loaded_claims(instance):
+    # Deferred fields are missing from ``__dict__`` and count as changed.
+    return {claim: instance.__dict__[claim] for claim in USER_CLAIMS
+            if claim in instance.__dict__}
+
+
+@receiver(post_init, sender=get_user_model())
+def remember_claims(sender, instance, **kwargs):
+    instance._loaded_claims = loaded_claims(instance)
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def invalidate_cached_user(sender, instance, created=False, **kwargs):
+    # A new user has no tokens yet, but may reuse the id of a deleted one.
+    if created:
+        user_cache.discard(instance.pk)
+    else:
+        user_cache.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=get_user_model())
+def share_claims_change(sender, instance, created=False, **kwargs):
+    claims = loaded_claims(instance)
+    if not created and claims != instance._loaded_claims:
+        mark_claims_changed(instance)
+    instance._loaded_claims = claims
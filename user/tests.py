@@ -1,3 +1,375 @@
-from django.test import TestCase
+import os
+import tempfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from train_station_api.query_budget import QueryRecorder, get_query_budget
+from user.authentication import user_cache
+from user.models import RevokedToken, ThrottleBucket, TokenCutoff
+from user.revocation import BloomFilter, denylist
+from user.serializers import UserTokenObtainPairSerializer
+from user.throttling import (BucketRateThrottle, DatabaseStore,
+                             SharedMemoryStore)
+
+REGISTER_URL = reverse("user:create")
+ME_URL = reverse("user:manage")
+TOKEN_URL = reverse("user:token_obtain_pair")
+TOKEN_REFRESH_URL = reverse("user:token_refresh")
+LOGOUT_URL = reverse("user:logout")
+LOGOUT_ALL_URL = reverse("user:logout_all")
+STATION_URL = reverse("station:station-list")
+ORDER_URL = reverse("station:order-list")
+
+
+class UserQueryBudgetTests(TestCase):
+    def setUp(self):
+        denylist.reset()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "user@test.com", "password"
+        )
+
+    def authenticate(self):
+        token = UserTokenObtainPairSerializer.get_token(self.user)
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {token.access_token}"
+        )
+
+    def assertWithinQueryBudget(self, make_request):
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            response = make_request()
+        self.assertLess(response.status_code, 400, response.content)
+        budget = get_query_budget(response.renderer_context["view"],
+                                  response.renderer_context["request"])
+        self.assertIsNotNone(budget, "The view declares no query budget.")
+        self.assertLessEqual(len(recorder.queries), budget, "\n".join(
+            sql[:100] for sql in recorder.queries
+        ))
+
+    def test_register(self):
+        self.assertWithinQueryBudget(lambda: self.client.post(
+            REGISTER_URL, {"email": "new@test.com", "password": "password"}
+        ))
+
+    def test_logout(self):
+        self.authenticate()
+        refresh = UserTokenObtainPairSerializer.get_token(self.user)
+
+        self.assertWithinQueryBudget(lambda: self.client.post(
+            LOGOUT_URL, {"refresh": str(refresh)}
+        ))
+
+    def test_logout_all(self):
+        self.authenticate()
+
+        self.assertWithinQueryBudget(lambda: self.client.post(LOGOUT_ALL_URL))
+
+    def test_manage_user(self):
+        self.authenticate()
+
+        self.assertWithinQueryBudget(lambda: self.client.get(ME_URL))
+        self.assertWithinQueryBudget(lambda: self.client.patch(
+            ME_URL, {"password": "new-password"}
+        ))
+        self.assertWithinQueryBudget(lambda: self.client.put(
+            ME_URL, {"email": "user@test.com", "password": "password2"}
+        ))
+
+
+class ClaimsAuthenticationTests(TestCase):
+    def setUp(self):
+        user_cache.clear()
+        denylist.reset()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_superuser(
+            "admin@test.com", "password"
+        )
+        response = self.client.post(
+            TOKEN_URL, {"email": "admin@test.com", "password": "password"}
+        )
+        self.tokens = response.data
+
+    def use(self, access):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+
+    def test_tokens_carry_user_claims(self):
+        access = AccessToken(self.tokens["access"])
+        self.assertEqual(access["email"], "admin@test.com")
+        self.assertTrue(access["is_staff"])
+        self.assertTrue(access["is_active"])
+
+        response = self.client.post(
+            TOKEN_REFRESH_URL, {"refresh": self.tokens["refresh"]}
+        )
+        self.assertTrue(AccessToken(response.data["access"])["is_staff"])
+
+    def test_request_does_not_query_user(self):
+        self.use(self.tokens["access"])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(STATION_URL)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(any("user_user" in query["sql"]
+                             for query in queries.captured_queries))
+
+    def test_staff_claim_grants_write_access(self):
+        self.use(self.tokens["access"])
+
+        response = self.client.post(
+            STATION_URL, {"name": "Lviv", "latitude": 49.8,
+                          "longitude": 24.0}
+        )
+
+        self.assertEqual(response.status_code, 201)
+
+    def test_changed_user_is_loaded_from_database(self):
+        self.use(self.tokens["access"])
+        self.user.is_staff = False
+        self.user.save()
+
+        response = self.client.post(
+            STATION_URL, {"name": "Lviv", "latitude": 49.8,
+                          "longitude": 24.0}
+        )
+
+        self.assertEqual(response.status_code, 403)
+
+    def test_user_changed_by_another_worker_is_loaded_from_database(self):
+        self.use(self.tokens["access"])
+        user_cache.get(self.user.pk)
+        # Another worker changes the user; this one only sees it through
+        # the shared cutoff.
+        with mock.patch.object(user_cache, "invalidate"), \
+                mock.patch.object(denylist, "add"):
+            self.user.is_staff = False
+            self.user.save()
+        denylist.refresh(force=True)
+
+        response = self.client.post(
+            STATION_URL, {"name": "Lviv", "latitude": 49.8,
+                          "longitude": 24.0}
+        )
+
+        self.assertEqual(response.status_code, 403)
+
+    def test_deactivated_user_is_rejected(self):
+        self.use(self.tokens["access"])
+        self.user.is_active = False
+        self.user.save()
+
+        response = self.client.get(STATION_URL)
+
+        self.assertEqual(response.status_code, 401)
+
+    def test_manage_user_updates_stored_user(self):
+        self.use(self.tokens["access"])
+
+        response = self.client.patch(ME_URL, {"password": "new-password"})
+
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password("new-password"))
+        self.assertTrue(self.user.is_superuser)
+
+
+class TokenRevocationTests(TestCase):
+    def setUp(self):
+        denylist.reset()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            "user@test.com", "password"
+        )
+        self.tokens = self.obtain_tokens()
+
+    def obtain_tokens(self):
+        return self.client.post(
+            TOKEN_URL, {"email": "user@test.com", "password": "password"}
+        ).data
+
+    def use(self, access):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+
+    def test_logout_revokes_access_and_refresh_tokens(self):
+        self.use(self.tokens["access"])
+
+        response = self.client.post(LOGOUT_URL,
+                                    {"refresh": self.tokens["refresh"]})
+
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.client.get(ME_URL).status_code, 401)
+        response = self.client.post(TOKEN_REFRESH_URL,
+                                    {"refresh": self.tokens["refresh"]})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(RevokedToken.objects.count(), 2)
+
+    def test_logout_rejects_refresh_token_of_another_user(self):
+        other = get_user_model().objects.create_user(
+            "other@test.com", "password"
+        )
+        refresh = UserTokenObtainPairSerializer.get_token(other)
+        self.use(self.tokens["access"])
+
+        response = self.client.post(LOGOUT_URL, {"refresh": str(refresh)})
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_logout_all_revokes_earlier_tokens(self):
+        # Before the tokens of setUp, which a cutoff in their second
+        # would revoke.
+        TokenCutoff.objects.create(
+            user=self.user,
+            revoked_before=self.user.date_joined - timedelta(minutes=5),
+        )
+        earlier = UserTokenObtainPairSerializer.get_token(self.user)
+        earlier["iat"] -= 60
+        self.use(self.tokens["access"])
+
+        response = self.client.post(LOGOUT_ALL_URL)
+
+        self.assertEqual(response.status_code, 204)
+        self.assertTrue(denylist.is_revoked(earlier))
+        self.assertEqual(self.client.get(ME_URL).status_code, 401)
+
+    def test_logout_all_revokes_tokens_of_the_same_second(self):
+        revoked_before = timezone.now().replace(microsecond=500000)
+        TokenCutoff.objects.create(user=self.user,
+                                   revoked_before=revoked_before)
+        denylist.refresh(force=True)
+        token = UserTokenObtainPairSerializer.get_token(self.user)
+        token["iat"] = int(revoked_before.timestamp())
+
+        self.assertTrue(denylist.is_revoked(token))
+
+    def test_refresh_loads_user_once(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(TOKEN_REFRESH_URL,
+                                        {"refresh": self.tokens["refresh"]})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sum("user_user" in query["sql"]
+                             for query in queries.captured_queries), 1)
+
+    def test_other_workers_load_revocations(self):
+        self.use(self.tokens["access"])
+        self.client.post(LOGOUT_URL)
+        denylist.reset()
+
+        self.assertEqual(self.client.get(ME_URL).status_code, 401)
+        self.use(self.obtain_tokens()["access"])
+        self.assertEqual(self.client.get(ME_URL).status_code, 200)
+
+    def test_refresh_is_left_out_of_query_budgets(self):
+        recorder = QueryRecorder()
+
+        with connection.execute_wrapper(recorder):
+            denylist.refresh(force=True)
+            TokenCutoff.objects.count()
+
+        self.assertEqual(len(recorder.queries), 1)
+
+    def test_revocation_check_does_not_query_after_refresh(self):
+        self.use(self.tokens["access"])
+        self.client.get(ME_URL)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(STATION_URL)
+
+        self.assertFalse(any("user_revokedtoken" in query["sql"]
+                             for query in queries.captured_queries))
+
+
+class BloomFilterTests(TestCase):
+    def test_membership(self):
+        bloom = BloomFilter(1 << 12, 5)
+        for index in range(100):
+            bloom.add(f"jti-{index}")
+
+        self.assertTrue(all(f"jti-{index}" in bloom for index in range(100)))
+        false_positives = sum(f"other-{index}" in bloom
+                              for index in range(1000))
+        self.assertLess(false_positives, 20)
+
+
+class ThrottleStoreTests(TestCase):
+    def assertTokenBucket(self, store):
+        results = [store.consume("key", 3, 0.5, 100.0)[0] for _ in range(4)]
+        self.assertEqual(results, [True, True, True, False])
+
+        allowed, tokens = store.consume("key", 3, 0.5, 101.0)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(tokens, 0.5)
+        self.assertTrue(store.consume("key", 3, 0.5, 102.0)[0])
+        self.assertTrue(store.consume("other", 3, 0.5, 102.0)[0])
+
+        store.reset("key")
+        self.assertEqual(store.consume("key", 3, 0.5, 102.0), (True, 2))
+        # Costlier requests take several tokens, or none when short.
+        self.assertEqual(store.consume("cost", 3, 0.5, 102.0, 2), (True, 1))
+        self.assertEqual(store.consume("cost", 3, 0.5, 102.0, 2),
+                         (False, 1))
+        # A cost above the capacity is refused even for a new bucket.
+        self.assertEqual(store.consume("big", 3, 0.5, 102.0, 4), (False, 3))
+        # A worker whose clock is behind refills nothing.
+        self.assertEqual(store.consume("cost", 3, 0.5, 100.0, 2),
+                         (False, 1))
+
+    def test_database_store(self):
+        self.assertTokenBucket(DatabaseStore())
+
+    @override_settings(REST_FRAMEWORK={
+        "DEFAULT_THROTTLE_RATES": {"user": "10/hour", "booking": "1/day"},
+    })
+    def test_database_store_prunes_full_buckets(self):
+        store = DatabaseStore()
+        store.consume("idle", 3, 0.5, 100.0)
+        store.consume("recent", 3, 0.5, 100.0 + 86400)
+
+        self.assertEqual(store.prune(101.0 + 86400), 1)
+        self.assertEqual(
+            list(ThrottleBucket.objects.values_list("key", flat=True)),
+            ["recent"],
+        )
+
+    def test_shared_memory_store(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "throttle")
+            self.assertTokenBucket(SharedMemoryStore(path, 128))
+            # Another worker mapping the same file sees the same buckets.
+            self.assertEqual(
+                SharedMemoryStore(path, 128).consume("key", 3, 0.5, 102.0),
+                (True, 1),
+            )
+
+
+class ScopedThrottleTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        user = get_user_model().objects.create_user(
+            "user@test.com", "password"
+        )
+        token = UserTokenObtainPairSerializer.get_token(user)
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {token.access_token}"
+        )
+
+    @mock.patch.dict(BucketRateThrottle.THROTTLE_RATES,
+                     {"booking": "1/hour"})
+    def test_booking_is_limited_separately_from_browsing(self):
+        self.assertEqual(self.client.post(ORDER_URL, {}).status_code, 400)
+
+        response = self.client.post(ORDER_URL, {})
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(int(response["Retry-After"]), 3600)
+        self.assertEqual(self.client.get(ORDER_URL).status_code, 200)
@@ -0,0 +1,231 @@
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+from rest_framework.settings import api_settings
+from rest_framework.throttling import SimpleRateThrottle
+
+from user.models import ThrottleBucket
+
+
+class DatabaseStore:
+    """Token buckets in the ``ThrottleBucket`` table.
+
+    Refilling and taking a token is a single upsert, so concurrent workers
+    and hosts never lose updates and each request costs one query. Buckets
+    idle long enough to be full again are removed by ``prune()``.
+    """
+
+    def consume(self, key, capacity, rate, now, cost=1):
+        table = connection.ops.quote_name(ThrottleBucket._meta.db_table)
+        # A clock behind the one of the last update refills nothing.
+        elapsed = (
+            f"CASE WHEN excluded.updated_at > {table}.updated_at "
+            f"THEN excluded.updated_at - {table}.updated_at ELSE 0 END"
+        )
+        refill = f"{table}.tokens + ({elapsed}) * %s"
+        refilled = f"CASE WHEN {refill} > %s THEN %s ELSE {refill} END"
+        sql = (
+            f"INSERT INTO {table} (key, tokens, updated_at, allowed) "
+            "VALUES (%s, %s, %s, %s) "
+            "ON CONFLICT (key) DO UPDATE SET "
+            f"tokens = CASE WHEN {refilled} >= %s "
+            f"THEN {refilled} - %s ELSE {refilled} END, "
+            f"allowed = {refilled} >= %s, "
+            "updated_at = excluded.updated_at "
+            "RETURNING tokens, allowed"
+        )
+        refilled_params = [rate, capacity, capacity, rate]
+        # A new bucket starts full, like a bucket idle for long enough.
+        allowed = cost <= capacity
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [
+                key, capacity - cost if allowed else capacity, now, allowed,
+                *refilled_params, cost, *refilled_params, cost,
+                *refilled_params, *refilled_params, cost,
+            ])
+            tokens, allowed = cursor.fetchone()
+        return bool(allowed), tokens
+
+    def reset(self, key):
+        ThrottleBucket.objects.filter(key=key).delete()
+
+    def prune(self, now):
+        """Delete buckets that have refilled completely by ``now``.
+
+        A bucket refills within the duration of its rate, so one idle for
+        longer than the longest configured duration is full, the same as a
+        missing one. Returns the number of buckets deleted.
+        """
+        throttle = ScopedBucketThrottle()
+        durations = [
+            throttle.parse_rate(rate)[1]
+            for rate in api_settings.DEFAULT_THROTTLE_RATES.values() if rate
+        ]
+        count, _ = ThrottleBucket.objects.filter(
+            updated_at__lt=now - max(durations, default=0)
+        ).delete()
+        return count
+
+
+class SharedMemoryStore:
+    """Token buckets in a memory-mapped file shared by local workers.
+
+    The file holds a fixed number of slots addressed by a hash of the key,
+    each locked with ``fcntl`` while it is updated. A key whose slot was
+    taken over by another key starts again with a full bucket, so size
+    ``THROTTLE_SHARED_MEMORY_SLOTS`` well above the number of active
+    clients.
+    """
+
+    slot = struct.Struct("<Qdd")
+
+    def __init__(self, path, slots):
+        self.path = path
+        self.slots = slots
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def _open(self):
+        # Each process maps the file itself; fcntl locks are per process.
+        if self._pid != os.getpid():
+            size = self.slot.size * self.slots
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            self._fd = fd
+            self._map = mmap.mmap(fd, size)
+            self._pid = os.getpid()
+
+    def _locate(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+        key_hash = int.from_bytes(digest, "little") or 1
+        return key_hash, (key_hash % self.slots) * self.slot.size
+
+    def consume(self, key, capacity, rate, now, cost=1):
+        key_hash, offset = self._locate(key)
+        with self._lock:
+            self._open()
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, self.slot.size, offset)
+            try:
+                stored_hash, tokens, updated_at = self.slot.unpack_from(
+                    self._map, offset
+                )
+                if stored_hash != key_hash:
+                    tokens, updated_at = capacity, now
+                tokens = min(capacity,
+                             tokens + max(now - updated_at, 0) * rate)
+                allowed = tokens >= cost
+                if allowed:
+                    tokens -= cost
+                self.slot.pack_into(self._map, offset, key_hash, tokens, now)
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, self.slot.size, offset)
+        return allowed, tokens
+
+    def reset(self, key):
+        key_hash, offset = self._locate(key)
+        with self._lock:
+            self._open()
+            self.slot.pack_into(self._map, offset, 0, 0.0, 0.0)
+
+
+_stores = {}
+
+
+def get_store():
+    name = settings.THROTTLE_STORE
+    if name not in _stores:
+        if name == "database":
+            _stores[name] = DatabaseStore()
+        elif name == "shared-memory":
+            _stores[name] = SharedMemoryStore(
+                settings.THROTTLE_SHARED_MEMORY_PATH,
+                settings.THROTTLE_SHARED_MEMORY_SLOTS,
+            )
+        else:
+            raise ValueError(f"Unknown THROTTLE_STORE {name!r}")
+    return _stores[name]
+
+
+class BucketRateThrottle(SimpleRateThrottle):
+    """Token bucket version of DRF's ``SimpleRateThrottle``.
+
+    A rate of ``100/day`` allows bursts of 100 requests and refills one
+    request every 864 seconds. State lives in the shared ``THROTTLE_STORE``
+    rather than the per-process cache, and every request does a constant
+    amount of work.
+    """
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        # Batched requests were paid for by the batch.
+        if getattr(request._request, "batch_parent", None) is not None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+        capacity, refill_rate = self.num_requests, (self.num_requests
+                                                    / self.duration)
+        get_cost = getattr(view, "get_throttle_cost", None)
+        self.cost = get_cost(request) if get_cost else 1
+        allowed, self.tokens = get_store().consume(
+            self.key, capacity, refill_rate, self.timer(), self.cost
+        )
+        self.refill_rate = refill_rate
+        return allowed
+
+    def wait(self):
+        return max(self.cost - self.tokens, 0) / self.refill_rate
+
+    timer = staticmethod(time.time)
+
+
+class AnonBucketThrottle(BucketRateThrottle):
+    scope = "anon"
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return None
+        return self.cache_format % {
+            "scope": self.scope, "ident": self.get_ident(request)
+        }
+
+
+class UserBucketThrottle(BucketRateThrottle):
+    scope = "user"
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = request.user.pk
+        else:
+            ident = self.get_ident(request)
+        return self.cache_format % {"scope": self.scope, "ident": ident}
+
+
+class ScopedBucketThrottle(UserBucketThrottle):
+    """Extra limit for the actions listed in a view's ``throttle_scopes``.
+
+    ``throttle_scopes = {"create": "booking"}`` limits creating orders with
+    the ``booking`` rate on top of the anon/user limits.
+    """
+
+    def __init__(self):
+        # The scope depends on the view, so the rate is resolved later.
+        pass
+
+    def allow_request(self, request, view):
+        action = getattr(view, "action", None) or request.method.lower()
+        self.scope = getattr(view, "throttle_scopes", {}).get(action)
+        if self.scope is None:
+            return True
+        self.rate = self.get_rate()
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        return super().allow_request(request, view)
@@ -3,7 +3,8 @@ from rest_framework_simplejwt.views import (TokenObtainPairView,
                                             TokenRefreshView,
                                             TokenVerifyView)
 
-from user.views import CreateUserView, ManageUserView
+from user.views import (CreateUserView, LogoutAllView, LogoutView,
+                        ManageUserView)
 
 app_name = "user"
 
@@ -13,4 +14,6 @@ urlpatterns = [
    path("token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
    path("token/verify/", TokenVerifyView.as_view(), name="token_verify"),
    path("me/", ManageUserView.as_view(), name="manage"),
+   path("logout/", LogoutView.as_view(), name="logout"),
+   path("logout/all/", LogoutAllView.as_view(), name="logout_all"),
 ]
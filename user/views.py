@@ -1,13 +1,18 @@
-from rest_framework import generics
+from django.contrib.auth import get_user_model
+from drf_spectacular.utils import extend_schema
+from rest_framework import generics, status
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
 from rest_framework.settings import api_settings
 
-from user.serializers import UserSerializer
+from user.revocation import revoke_tokens, revoke_user_tokens
+from user.serializers import LogoutSerializer, UserSerializer
 
 
 class CreateUserView(generics.CreateAPIView):
     serializer_class = UserSerializer
+    query_budget = {"post": 4}
 
 
 class CreateTokenView(ObtainAuthToken):
@@ -17,6 +22,38 @@ class CreateTokenView(ObtainAuthToken):
 class ManageUserView(generics.RetrieveUpdateAPIView):
     serializer_class = UserSerializer
     permission_classes = (IsAuthenticated,)
+    query_budget = {"get": 3, "put": 5, "patch": 5}
 
     def get_object(self):
-        return self.request.user
+        # request.user may be built from token claims; edit the stored row.
+        return get_user_model().objects.get(pk=self.request.user.pk)
+
+
+class LogoutView(generics.GenericAPIView):
+    """Revoke the access token of the request and, if sent, a refresh token."""
+
+    serializer_class = LogoutSerializer
+    permission_classes = (IsAuthenticated,)
+    query_budget = {"post": 3}
+
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        tokens = [request.auth]
+        if "refresh" in serializer.validated_data:
+            tokens.append(serializer.validated_data["refresh"])
+        revoke_tokens(*tokens)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class LogoutAllView(generics.GenericAPIView):
+    """Revoke every token issued to the user so far."""
+
+    permission_classes = (IsAuthenticated,)
+    query_budget = {"post": 4}
+
+    @extend_schema(request=None, responses={204: None})
+    def post(self, request):
+        revoke_user_tokens(request.user)
+        revoke_tokens(request.auth)
+        return Response(status=status.HTTP_204_NO_CONTENT)